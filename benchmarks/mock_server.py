@@ -0,0 +1,322 @@
+# mock_server.py
+"""
+Local HTTP server imitating the Discourse JSON API and the Snapshot GraphQL hub,
+serving synthetic data (synthetic.py), so crawler throughput can be measured offline.
+
+Discourse: /categories.json, /c/{id}.json?page=N, /t/{id}.json, /t/{id}/posts.json?post_ids[]=...
+and /posts/{id}.json. Snapshot: POST /graphql answering the `proposals` and `votes`
+queries of downloader_snapshot.py (first / skip / created / created_gte /
+created_lte / ids, ordered by created, proposals projected on the selected fields).
+Every space gets the same proposals. With shuffle_ties, rows sharing a `created`
+come back in a new order on every request, as nothing in the hub's API promises a
+tie order.
+
+Every response is delayed by `latency` seconds (plus up to `jitter`), and a
+`throttle_rate` fraction of requests is answered 429 with Retry-After: `retry_after`.
+
+    with MockServer(MockData(topics=200, proposals=20, votes_per_proposal=2_000)) as server:
+        fetch.DISCOURSE_BASE_URL = server.base_url
+        ...
+
+    python benchmarks/mock_server.py --port 8080 --latency 0.05 --throttle-rate 0.05
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import groupby
+from urllib.parse import parse_qs, urlparse
+
+from synthetic import POSTS_PER_TOPIC, generate_posts, generate_proposals, generate_votes
+
+TOPICS_PER_PAGE = 30
+EMBEDDED_POSTS = 20  # posts inlined in /t/{id}.json, as Discourse does
+CATEGORY_SLUGS = ["general", "delegates", "technical-proposals", "gov-design"]
+
+def selected_fields(query, field):
+    """
+    Top-level names selected under `field` in a GraphQL query; nested selections are
+    returned whole.
+    """
+    match = re.search(rf"\b{field}\s*\([^)]*\)\s*\{{", query)
+    depth, names = 1, []
+    for token in re.findall(r"\{|\}|\w+", query[match.end():]):
+        if token == "{":
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if depth == 0:
+                break
+        elif depth == 1:
+            names.append(token)
+    return names
+
+class MockData:
+    """
+    The forum and hub contents: `topics` topics of `posts_per_topic` posts spread over
+    the categories, and `proposals` proposals with `votes_per_proposal` votes each.
+    """
+    def __init__(self, topics=100, posts_per_topic=POSTS_PER_TOPIC, proposals=10, votes_per_proposal=1_000,
+                 category_slugs=CATEGORY_SLUGS, shuffle_ties=False, seed=0):
+        self.shuffle_ties = shuffle_ties
+        self.rng = random.Random(seed)
+        posts = list(generate_posts(topics * posts_per_topic, seed=seed, posts_per_topic=posts_per_topic))
+        self.posts = {post["id"]: post for post in posts}
+        self.topics = {}
+        for post in posts:
+            topic = self.topics.setdefault(post["topic_id"], {
+                "id": post["topic_id"], "slug": post["topic_slug"], "title": post["topic_title"], "post_ids": [],
+                "category_id": None,
+            })
+            topic["post_ids"].append(post["id"])
+            topic["bumped_at"] = post["created_at"]
+            topic["highest_post_number"] = post["post_number"]
+
+        self.categories = [{"id": i + 1, "slug": slug, "name": slug.replace("-", " ").title()}
+                           for i, slug in enumerate(category_slugs)]
+        self.topics_by_category = {c["id"]: [] for c in self.categories}
+        for i, topic_id in enumerate(sorted(self.topics)):
+            category_id = self.categories[i % len(self.categories)]["id"]
+            self.topics_by_category[category_id].append(topic_id)
+            self.topics[topic_id]["category_id"] = category_id
+
+        self.proposals = list(generate_proposals(proposals, seed=seed))
+        self.votes = {p["id"]: [] for p in self.proposals}
+        for vote in generate_votes(self.proposals, proposals * votes_per_proposal, seed=seed):
+            vote = dict(vote)
+            self.votes[vote.pop("proposal_id")].append(vote)
+        for votes in self.votes.values():
+            votes.sort(key=lambda v: (v["created"], v["id"]))
+
+    def tie_order(self, rows):
+        """
+        `rows` (ordered by created) with each run of equal `created` shuffled if shuffle_ties.
+        """
+        if not self.shuffle_ties:
+            return rows
+        shuffled = []
+        for _, run in groupby(rows, key=lambda row: row["created"]):
+            run = list(run)
+            self.rng.shuffle(run)
+            shuffled.extend(run)
+        return shuffled
+
+    def topic_listing(self, topic_id):
+        topic = self.topics[topic_id]
+        return {"id": topic_id, "slug": topic["slug"], "title": topic["title"], "category_id": topic["category_id"],
+                "posts_count": len(topic["post_ids"]), "bumped_at": topic["bumped_at"],
+                "highest_post_number": topic["highest_post_number"]}
+
+    def post_json(self, post_id):
+        post = self.posts[post_id]
+        return {
+            "id": post["id"], "post_number": post["post_number"], "username": post["username"],
+            "created_at": post["created_at"], "updated_at": post["updated_at"], "cooked": post["cooked"],
+            "raw": post["raw"], "reply_to_post_number": post["reply_to"], "topic_id": post["topic_id"],
+        }
+
+    # --- Discourse --------------------------------------------------------------
+
+    def discourse(self, path, query):
+        """
+        (status, body) for a Discourse GET.
+        """
+        if path == "/categories.json":
+            return 200, {"category_list": {"categories": self.categories}}
+        if match := re.fullmatch(r"/c/(\d+)\.json", path):
+            topic_ids = self.topics_by_category.get(int(match.group(1)))
+            if topic_ids is None:
+                return 404, {"errors": ["not found"]}
+            page = int(query.get("page", ["0"])[0])
+            page_ids = topic_ids[page * TOPICS_PER_PAGE:(page + 1) * TOPICS_PER_PAGE]
+            return 200, {"topic_list": {"topics": [self.topic_listing(t) for t in page_ids]}}
+        if match := re.fullmatch(r"/t/(\d+)\.json", path):
+            topic = self.topics.get(int(match.group(1)))
+            if topic is None:
+                return 404, {"errors": ["not found"]}
+            return 200, dict(self.topic_listing(topic["id"]), post_stream={
+                "stream": topic["post_ids"],
+                "posts": [self.post_json(p) for p in topic["post_ids"][:EMBEDDED_POSTS]],
+            })
+        if match := re.fullmatch(r"/t/(\d+)/posts\.json", path):
+            topic = self.topics.get(int(match.group(1)))
+            if topic is None:
+                return 404, {"errors": ["not found"]}
+            wanted = {int(p) for p in query.get("post_ids[]", [])}
+            return 200, {"post_stream": {"posts": [self.post_json(p) for p in topic["post_ids"] if p in wanted]}}
+        if match := re.fullmatch(r"/posts/(\d+)\.json", path):
+            post_id = int(match.group(1))
+            if post_id not in self.posts:
+                return 404, {"errors": ["not found"]}
+            return 200, self.post_json(post_id)
+        return 404, {"errors": ["not found"]}
+
+    # --- Snapshot -----------------------------------------------------------------
+
+    def graphql(self, payload):
+        query = payload.get("query", "")
+        variables = payload.get("variables") or {}
+        if re.search(r"\bvotes\s*\(", query):
+            votes = self.votes.get(variables.get("proposal"), [])
+            created_gte = variables.get("created_gte", 0)
+            votes = [v for v in votes if v["created"] >= created_gte]
+            if "created" in variables:
+                votes = [v for v in votes if v["created"] == variables["created"]]
+            if "orderDirection: desc" in query:
+                votes = votes[::-1]
+            votes = self.tie_order(votes)
+            skip = variables.get("skip", 0)
+            return 200, {"data": {"votes": votes[skip:skip + variables.get("first", 100)]}}
+        if re.search(r"\bproposals\s*\(", query):
+            proposals = self.proposals  # newest first
+            if "created_lte" in variables:
+                proposals = [p for p in proposals if p["created"] <= variables["created_lte"]]
+            if "created" in variables:
+                proposals = [p for p in proposals if p["created"] == variables["created"]]
+            proposals = self.tie_order(proposals)
+            if "ids" in variables:
+                ids = set(variables["ids"])
+                proposals = [p for p in proposals if p["id"] in ids]
+            first = variables.get("first")
+            if first is None:
+                match = re.search(r"first:\s*(\d+)", query)
+                first = int(match.group(1)) if match else 20
+            skip = variables.get("skip", 0)
+            fields = selected_fields(query, "proposals")
+            page = [{name: p.get(name) for name in fields} for p in proposals[skip:skip + first]]
+            return 200, {"data": {"proposals": page}}
+        return 400, {"errors": [{"message": "unsupported query"}]}
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients dropping idle keep-alive connections is not worth a traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+class MockServer:
+    """
+    Runs the mock on a background thread; port 0 picks a free port.
+    `requests` counts requests by status code.
+    """
+    def __init__(self, data, latency=0.0, jitter=0.0, throttle_rate=0.0, retry_after=1, host="127.0.0.1", port=0, seed=0):
+        self.data = data
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        self.httpd = QuietHTTPServer((host, port), self.handler_class())
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def graphql_url(self):
+        return f"{self.base_url}/graphql"
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def delay_and_throttle(self):
+        """
+        Sleeps the configured latency; True if this request is to be throttled.
+        """
+        with self.lock:
+            delay = self.latency + self.rng.random() * self.jitter
+            throttled = self.rng.random() < self.throttle_rate
+        time.sleep(delay)
+        return throttled
+
+    def count(self, status):
+        with self.lock:
+            self.requests[status] += 1
+
+    def handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real hosts
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status, body, headers=()):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+                server.count(status)
+
+            def throttle(self):
+                self.send_json(429, {"errors": ["too many requests"]},
+                               headers=[("Retry-After", str(server.retry_after))])
+
+            def do_GET(self):
+                if server.delay_and_throttle():
+                    return self.throttle()
+                url = urlparse(self.path)
+                path = re.sub("/+", "/", url.path)
+                self.send_json(*server.data.discourse(path, parse_qs(url.query)))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                if server.delay_and_throttle():
+                    return self.throttle()
+                if re.sub("/+", "/", urlparse(self.path).path) != "/graphql":
+                    return self.send_json(404, {"errors": ["not found"]})
+                try:
+                    payload = json.loads(body)
+                except ValueError:
+                    return self.send_json(400, {"errors": [{"message": "invalid JSON"}]})
+                self.send_json(*server.data.graphql(payload))
+
+        return Handler
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve synthetic Discourse and Snapshot data locally")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--topics", type=int, default=100)
+    parser.add_argument("--proposals", type=int, default=10)
+    parser.add_argument("--votes-per-proposal", type=int, default=1_000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds, uniformly")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After of the 429 responses (seconds)")
+    parser.add_argument("--shuffle-ties", action="store_true",
+                        help="answer rows sharing a created timestamp in a new order on every request")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data = MockData(topics=args.topics, proposals=args.proposals, votes_per_proposal=args.votes_per_proposal,
+                    shuffle_ties=args.shuffle_ties, seed=args.seed)
+    with MockServer(data, latency=args.latency, jitter=args.jitter, throttle_rate=args.throttle_rate,
+                    retry_after=args.retry_after, port=args.port, seed=args.seed) as server:
+        print(f"🧪 Discourse at {server.base_url}/, Snapshot at {server.graphql_url} (Ctrl+C to stop)")
+        try:
+            server.thread.join()
+        except KeyboardInterrupt:
+            pass
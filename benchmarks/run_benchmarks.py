@@ -0,0 +1,363 @@
+# run_benchmarks.py
+"""
+Times the pipeline's hot paths on synthetic data (synthetic.py) and, with --crawl,
+the crawlers against the local mock server (mock_server.py), and writes the
+results as JSON so runs can be compared over time.
+
+    python benchmarks/run_benchmarks.py                          # every benchmark at 10k
+    python benchmarks/run_benchmarks.py --scale 10k 1M --only join tally scorecards
+    python benchmarks/run_benchmarks.py --crawl --latency 0.05 --throttle-rate 0.05
+    python benchmarks/run_benchmarks.py --baseline data/benchmarks/benchmark_20250101T000000Z.json
+
+Scale is the number of items per benchmark: posts for extract_posts and
+extract_upload_links_from_html, votes for the join, the tally, the vote reads and the scorecards (with
+one proposal per 1,000 votes and one post per 10 votes). Inputs are generated
+before the clock starts; at 10M expect several GB of memory for the join.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "crawler_dao"))
+
+from synthetic import generate_posts, generate_proposals, generate_votes
+from mock_server import TOPICS_PER_PAGE, MockData, MockServer
+import daos
+
+RESULTS_DIR = ROOT / "data" / "benchmarks"
+VOTES_PER_PROPOSAL = 1_000
+VOTES_PER_POST = 10
+FORUM_URL = daos.get_dao(daos.DEFAULT_DAO)["forum"]  # the synthetic posts link to its uploads
+
+def parse_scale(value):
+    """
+    "10k" -> 10_000, "1M" -> 1_000_000, "500" -> 500.
+    """
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    suffix = value[-1].lower()
+    if suffix in multipliers:
+        return int(float(value[:-1]) * multipliers[suffix])
+    return int(value)
+
+def measure(fn, repeat):
+    """
+    Wall-clock seconds of `repeat` calls of fn().
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+def result(name, scale, items, seconds, **extra):
+    best = min(seconds)
+    return {
+        "name": name,
+        "scale": scale,
+        "items": items,
+        "seconds": [round(s, 6) for s in seconds],
+        "best": round(best, 6),
+        "median": round(statistics.median(seconds), 6),
+        "items_per_second": round(items / best, 1) if best else None,
+        **extra,
+    }
+
+# --- hot paths ----------------------------------------------------------------
+
+def bench_extract_upload_links(scale, repeat, seed):
+    from utils import extract_upload_links_from_html
+    html = [post["cooked"] for post in generate_posts(scale, seed=seed)]
+    links = []
+    seconds = measure(lambda: links.append(sum(len(extract_upload_links_from_html(h, FORUM_URL)) for h in html)), repeat)
+    return result("extract_upload_links_from_html", scale, len(html), seconds, links_found=links[-1])
+
+def bench_extract_posts(scale, repeat, seed):
+    from process import extract_posts
+    posts = list(generate_posts(scale, seed=seed))
+    seconds = measure(lambda: extract_posts(posts), repeat)
+    return result("extract_posts", scale, len(posts), seconds)
+
+def join_inputs(scale, seed):
+    from joiner import index_votes_by_proposal
+    proposals = list(generate_proposals(max(1, scale // VOTES_PER_PROPOSAL), seed=seed))
+    posts = list(generate_posts(max(1, scale // VOTES_PER_POST), seed=seed, cooked=False))
+    votes_by_pid = index_votes_by_proposal(generate_votes(proposals, scale, seed=seed))
+    return proposals, posts, votes_by_pid
+
+def bench_join(scale, repeat, seed, inputs=None):
+    from joiner import link_discourse_and_votes
+    proposals, posts, votes_by_pid = inputs or join_inputs(scale, seed)
+    seconds = measure(lambda: link_discourse_and_votes(proposals, posts, votes_by_pid, forum_url=FORUM_URL), repeat)
+    return result("link_discourse_and_votes", scale, sum(map(len, votes_by_pid.values())), seconds,
+                  proposals=len(proposals), posts=len(posts))
+
+def loop_tally(votes, choices, low_vp_threshold=0.01):
+    """
+    The per-vote loop the joiner tallied with before vote_tally.py, kept as its reference.
+    """
+    vote_dist = defaultdict(float)
+    voter_counter = Counter()
+    for vote in votes:
+        voter_counter[vote["voter"]] += 1
+        raw_choice = vote.get("choice")
+        if isinstance(raw_choice, int):
+            idx = raw_choice - 1
+            vote_dist[choices[idx] if 0 <= idx < len(choices) else "Unknown"] += vote.get("vp", 0)
+        elif isinstance(raw_choice, list):
+            flat_choices = []
+            for c in raw_choice:
+                flat_choices.extend(c if isinstance(c, list) else [c])
+            for idx in flat_choices:
+                try:
+                    i = int(idx) - 1
+                    vote_dist[choices[i] if 0 <= i < len(choices) else "Unknown"] += vote.get("vp", 0)
+                except (ValueError, TypeError):
+                    continue
+        elif isinstance(raw_choice, dict):
+            for idx_str, weight in raw_choice.items():
+                i = int(idx_str) - 1
+                vote_dist[choices[i] if 0 <= i < len(choices) else "Unknown"] += weight * vote.get("vp", 0)
+    return {
+        "vote_distribution": dict(vote_dist),
+        "total_voters": len(votes),
+        "total_vp": sum(v.get("vp", 0) for v in votes),
+        "unique_voters": len(voter_counter),
+        "repeat_voters": len([v for v, c in voter_counter.items() if c > 1]),
+        "low_vp_votes": len([v for v in votes if v.get("vp", 0) < low_vp_threshold]),
+    }
+
+def bench_tally(scale, repeat, seed, inputs=None):
+    """
+    vote_tally.tally_votes against the per-vote loop, on the synthetic mix of voting
+    types and on the same votes recast as single-choice.
+    """
+    from vote_tally import tally_votes
+    proposals, _, votes_by_pid = inputs or join_inputs(scale, seed)
+    single = {pid: [dict(v, choice=1 + i % 3) for i, v in enumerate(votes)] for pid, votes in votes_by_pid.items()}
+    results = []
+    for mix, by_pid in (("mixed", votes_by_pid), ("single_choice", single)):
+        work = [(by_pid.get(p["id"], []), p["choices"]) for p in proposals]
+        assert all(tally_votes(v, c) == loop_tally(v, c) for v, c in work), f"tally differs from the loop ({mix})"
+        loop_seconds = measure(lambda: [loop_tally(v, c) for v, c in work], repeat)
+        seconds = measure(lambda: [tally_votes(v, c) for v, c in work], repeat)
+        votes = sum(len(v) for v, _ in work)
+        results.append(result(f"tally_votes_{mix}", scale, votes, seconds, loop_best=round(min(loop_seconds), 6),
+                              speedup=round(min(loop_seconds) / min(seconds), 2)))
+    return results
+
+def bench_vote_reads(scale, repeat, seed, inputs=None):
+    """
+    Loading the join's votes by proposal from JSONL and from a Parquet dataset written
+    the way the Snapshot crawler writes it (proposal by proposal, through votes_writer).
+    """
+    import tempfile
+    from columnar import read_vote_columns, votes_writer
+    from joiner import index_votes_by_proposal
+    from records import iter_jsonl, save_jsonl
+    from vote_tally import VOTE_COLUMNS
+    _, _, votes_by_pid = inputs or join_inputs(scale, seed)
+    votes = sum(map(len, votes_by_pid.values()))
+    with tempfile.TemporaryDirectory() as tmp:
+        jsonl_path, parquet_root = Path(tmp) / "votes.jsonl", Path(tmp) / "votes.parquet"
+        save_jsonl(jsonl_path, (vote for pid_votes in votes_by_pid.values() for vote in pid_votes))
+        with votes_writer(parquet_root) as writer:
+            for pid_votes in votes_by_pid.values():
+                writer.write_many(pid_votes)
+        parts = sum(1 for _ in parquet_root.rglob("*.parquet"))
+        jsonl_seconds = measure(lambda: index_votes_by_proposal(iter_jsonl(jsonl_path)), repeat)
+        column_seconds = {
+            "read_vote_columns": measure(lambda: read_vote_columns(parquet_root), repeat),
+            # joiner.py --compact
+            "read_vote_columns_tallied": measure(lambda: read_vote_columns(parquet_root, columns=VOTE_COLUMNS), repeat),
+        }
+    return [result("read_votes_jsonl", scale, votes, jsonl_seconds)] + [
+        result(name, scale, votes, seconds, parts=parts, jsonl_best=round(min(jsonl_seconds), 6),
+               speedup=round(min(jsonl_seconds) / min(seconds), 2))
+        for name, seconds in column_seconds.items()
+    ]
+
+def bench_scorecards(scale, repeat, seed, inputs=None):
+    from joiner import link_discourse_and_votes
+    from proposal_scorecards import build_scorecard
+    proposals, posts, votes_by_pid = inputs or join_inputs(scale, seed)
+    linked = link_discourse_and_votes(proposals, posts, votes_by_pid, forum_url=FORUM_URL)
+    seconds = measure(lambda: [build_scorecard(p) for p in linked], repeat)
+    return result("build_scorecard", scale, len(linked), seconds,
+                  votes=sum(len(p["votes"]) for p in linked))
+
+# --- crawlers -------------------------------------------------------------------
+
+def bench_discourse_crawl(server, args):
+    """
+    Categories, topic listings and posts (batched) of every mock topic with the async engine.
+    """
+    import asyncio
+    import fetch
+
+    fetch.DISCOURSE_BASE_URL = server.base_url
+    max_pages = max(map(len, server.data.topics_by_category.values())) // TOPICS_PER_PAGE + 1
+
+    async def crawl():
+        async with fetch.AsyncFetcher(max_in_flight=args.max_in_flight, rate=args.rate, burst=args.max_in_flight,
+                                      min_rate=args.rate / 8, max_rate=2 * args.rate) as fetcher:
+            categories = await fetch.get_categories_async(fetcher)
+            topic_lists = await asyncio.gather(*(
+                fetch.get_category_topics_async(fetcher, c["id"], max_pages=max_pages)
+                for c in categories
+            ))
+            topics = [t for topic_list in topic_lists for t in topic_list]
+            posts = await asyncio.gather(*(fetch.get_full_topic_posts_batched_async(fetcher, t["id"]) for t in topics))
+            return sum(map(len, posts)), fetcher.metrics.snapshot()
+
+    start = time.perf_counter()
+    posts, metrics = asyncio.run(crawl())
+    seconds = time.perf_counter() - start
+    return result("discourse_crawl_async", args.crawl_topics, posts, [seconds],
+                  requests=sum(m["requests"] for m in metrics.values()), endpoints=metrics)
+
+def bench_snapshot_crawl(server, args):
+    """
+    Proposals and all their votes through downloader_snapshot's concurrent pager, with its
+    pagination counters (rows received twice, and the previous overlapping-window pager's).
+    """
+    import downloader_snapshot
+    from http_client import HttpClient
+
+    downloader_snapshot.SNAPSHOT_API = server.graphql_url
+    downloader_snapshot.CLIENT = HttpClient(rate=args.rate, max_rate=2 * args.rate, burst=args.max_in_flight,
+                                            pool_size=args.max_in_flight)
+    start = time.perf_counter()
+    proposals = downloader_snapshot.fetch_proposals()
+    vote_lists = [v for _, v, _ in downloader_snapshot.fetch_votes_concurrently(proposals, workers=args.max_in_flight)]
+    seconds = time.perf_counter() - start
+    metrics = downloader_snapshot.CLIENT.metrics.snapshot()
+    stats = downloader_snapshot.PAGINATION_STATS
+    return result("snapshot_crawl", args.crawl_proposals * args.votes_per_proposal, sum(map(len, vote_lists)),
+                  [seconds], requests=sum(m["requests"] for m in metrics.values()), endpoints=metrics,
+                  pagination={"pages": stats.pages, "refetched": stats.refetched, "tie_changes": stats.tie_changes,
+                              "duplicates_avoided": stats.duplicates_avoided, "legacy_pages": stats.legacy_pages,
+                              "legacy_refetched": stats.legacy_refetched, "legacy_missed": stats.legacy_missed})
+
+def run_crawl_benchmarks(args):
+    import http_cache
+    http_cache.disable()  # measure the network path, not the on-disk cache
+    sys.path.append(str(ROOT / "crawler_snapshot"))
+
+    data = MockData(topics=args.crawl_topics, proposals=args.crawl_proposals,
+                    votes_per_proposal=args.votes_per_proposal, shuffle_ties=args.shuffle_ties, seed=args.seed)
+    with MockServer(data, latency=args.latency, jitter=args.jitter, throttle_rate=args.throttle_rate,
+                    retry_after=args.retry_after, seed=args.seed) as server:
+        results = [bench_discourse_crawl(server, args), bench_snapshot_crawl(server, args)]
+        for r in results:
+            r["server"] = {"latency": args.latency, "jitter": args.jitter, "throttle_rate": args.throttle_rate,
+                           "responses": dict(server.requests)}
+    return results
+
+# --- entry point ------------------------------------------------------------------
+
+BENCHMARKS = {
+    "links": bench_extract_upload_links,
+    "extract": bench_extract_posts,
+    "join": bench_join,
+    "tally": bench_tally,
+    "reads": bench_vote_reads,
+    "scorecards": bench_scorecards,
+}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "git_commit": git_commit(),
+    }
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r["name"], r["scale"]): r for r in json.load(f)["results"]}
+    print(f"\n📊 vs {baseline_path}")
+    for r in results:
+        before = baseline.get((r["name"], r["scale"]))
+        if before:
+            print(f"   {r['name']:<32} {r['scale']:>10,}  {before['best']:.3f}s -> {r['best']:.3f}s "
+                  f"({before['best'] / r['best']:.2f}x)")
+
+def main(scales, only, repeat, seed, output, args):
+    results = []
+    for scale in scales:
+        join_data = join_inputs(scale, seed) if {"join", "tally", "reads", "scorecards"} & set(only) else None
+        for name in only:
+            kwargs = {"inputs": join_data} if name in ("join", "tally", "reads", "scorecards") else {}
+            rs = BENCHMARKS[name](scale, repeat, seed, **kwargs)
+            for r in rs if isinstance(rs, list) else [rs]:
+                print(f"⏱️ {r['name']:<32} {scale:>10,}  best {r['best']:.3f}s  "
+                      f"median {r['median']:.3f}s  {r['items_per_second']:,.0f} items/s"
+                      + (f"  ({r['speedup']:.2f}x {'JSONL' if 'jsonl_best' in r else 'the per-vote loop'})"
+                         if "speedup" in r else ""))
+                results.append(r)
+    if args.crawl:
+        for r in run_crawl_benchmarks(args):
+            print(f"⏱️ {r['name']:<32} {r['items']:>10,} items in {r['best']:.2f}s, {r['requests']} requests")
+            results.append(r)
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "seed": seed,
+        "repeat": repeat,
+        "environment": environment(),
+        "results": results,
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Saved {len(results)} results to {output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline's hot paths on synthetic data")
+    parser.add_argument("--scale", nargs="+", default=["10k"],
+                        help="items per benchmark, e.g. 10k 100k 1M 10M")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help="hot-path benchmarks to run")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark (the best is reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path,
+                        default=RESULTS_DIR / f"benchmark_{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json")
+    parser.add_argument("--baseline", type=Path, help="earlier results file to compare against")
+
+    crawl = parser.add_argument_group("crawler benchmarks (mock server)")
+    crawl.add_argument("--crawl", action="store_true", help="also time both crawlers against the mock server")
+    crawl.add_argument("--crawl-topics", type=int, default=200)
+    crawl.add_argument("--crawl-proposals", type=int, default=20)
+    crawl.add_argument("--votes-per-proposal", type=int, default=2_000)
+    crawl.add_argument("--latency", type=float, default=0.02, help="seconds added to every mock response")
+    crawl.add_argument("--jitter", type=float, default=0.0)
+    crawl.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of mock responses that are 429s")
+    crawl.add_argument("--retry-after", type=int, default=1)
+    crawl.add_argument("--shuffle-ties", action="store_true",
+                       help="mock hub returns rows sharing a created timestamp in a new order on every request")
+    crawl.add_argument("--rate", type=float, default=50.0, help="client requests per second per host, initially")
+    crawl.add_argument("--max-in-flight", type=int, default=8)
+    args = parser.parse_args()
+
+    main([parse_scale(s) for s in args.scale], args.only, args.repeat, args.seed, args.output, args)
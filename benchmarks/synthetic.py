@@ -0,0 +1,150 @@
+# synthetic.py
+"""
+Seeded generators of synthetic Discourse posts, Snapshot proposals and votes,
+shaped like the crawlers' raw records, for the benchmarks and the mock server.
+
+Every generator takes a `seed` and yields the same records for the same
+arguments, so runs at the same scale are comparable. They are generators:
+at 10M votes, only what the caller keeps is held in memory.
+
+    posts = list(generate_posts(100_000, seed=1))
+    proposals = list(generate_proposals(100, seed=1))
+    votes = generate_votes(proposals, 1_000_000, seed=1)
+"""
+
+import random
+from datetime import datetime, timedelta, timezone
+
+START = datetime(2022, 1, 1, tzinfo=timezone.utc)
+PERIOD_DAYS = 3 * 365  # records are spread over this many days from START
+POSTS_PER_TOPIC = 25
+USERS = 5_000
+VOTERS = 50_000
+WORDS = (
+    "proposal delegate vote treasury grant mission season retro funding citizen house token "
+    "upgrade budget council review milestone audit forum snapshot quorum onchain security "
+    "the a of to and in for is on that with as it be this are by will we our"
+).split()
+CHOICE_SETS = [["For", "Against", "Abstain"], ["Yes", "No"], ["Option A", "Option B", "Option C", "Option D"]]
+VOTING_TYPES = ["single-choice", "single-choice", "basic", "approval", "weighted"]
+
+def words(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+def iso(dt):
+    return dt.isoformat().replace("+00:00", "Z")
+
+def cooked_html(rng, post_id):
+    """
+    Post HTML with the elements the parsers care about: paragraphs, lists, quotes,
+    code, onebox previews, emoji, uploads, image lightboxes and PDF links.
+    """
+    parts = [f"<p>{words(rng, rng.randint(10, 60))}</p>"]
+    if rng.random() < 0.3:
+        user = f"user{rng.randrange(USERS)}"
+        parts.append(f'<aside class="quote" data-username="{user}" data-post="1" data-topic="{post_id % 997}">'
+                     f'<div class="title"><img alt="" src="/user_avatar/{user}.png" class="avatar"> {user}:</div>'
+                     f"<blockquote><p>{words(rng, rng.randint(5, 30))}</p></blockquote></aside>")
+    if rng.random() < 0.2:
+        parts.append("<ul>" + "".join(f"<li>{words(rng, 6)}</li>" for _ in range(rng.randint(2, 6))) + "</ul>")
+    if rng.random() < 0.1:
+        parts.append(f"<pre><code class=\"lang-python\">def f(x):\n    return x * {post_id}\n</code></pre>")
+    if rng.random() < 0.1:
+        parts.append('<aside class="onebox"><article><h3>Preview</h3><p>' + words(rng, 20) + "</p></article></aside>")
+    if rng.random() < 0.3:
+        parts.append(f'<p>{words(rng, 5)} <img src="/images/emoji/twitter/rocket.png" class="emoji" alt=":rocket:"></p>')
+    if rng.random() < 0.15:
+        name = f"report_{post_id}.pdf"
+        parts.append(f'<p><a class="attachment" href="/uploads/short-url/{post_id:x}.pdf">{name}</a></p>')
+    if rng.random() < 0.1:
+        parts.append(f'<div class="lightbox-wrapper"><a class="lightbox" href="https://gov.optimism.io/uploads/default/original/2X/{post_id:x}.png">'
+                     f'<img src="https://gov.optimism.io/uploads/default/optimized/2X/{post_id:x}_2_690x388.png"></a></div>')
+    if rng.random() < 0.05:
+        parts.append(f"<p>See https://example.org/docs/spec-{post_id}.pdf for details.</p>")
+    return "\n".join(parts)
+
+def generate_posts(n, seed=0, posts_per_topic=POSTS_PER_TOPIC, cooked=True):
+    """
+    `n` raw Discourse posts (downloader_dao.py records), topic by topic in creation order.
+    cooked=False leaves out the HTML (the join reads only dates, users and topics).
+    """
+    rng = random.Random(seed)
+    step = PERIOD_DAYS * 86_400 / max(n, 1)
+    for i in range(n):
+        topic_id = 1_000 + i // posts_per_topic
+        created = START + timedelta(seconds=i * step + rng.random() * step)
+        updated = created + timedelta(minutes=rng.randrange(0, 600)) if rng.random() < 0.2 else created
+        yield {
+            "id": 10_000 + i,
+            "post_number": i % posts_per_topic + 1,
+            "username": f"user{rng.randrange(USERS)}",
+            "created_at": iso(created),
+            "updated_at": iso(updated),
+            "cooked": cooked_html(rng, 10_000 + i) if cooked else None,
+            "raw": words(rng, rng.randint(10, 60)),
+            "reply_to": rng.randint(1, i % posts_per_topic) if i % posts_per_topic and rng.random() < 0.4 else None,
+            "topic_id": topic_id,
+            "topic_slug": f"topic-{topic_id}",
+            "topic_title": f"Topic {topic_id}: {words(rng, 4)}",
+        }
+
+def generate_proposals(n, seed=0, space="opcollective.eth"):
+    """
+    `n` Snapshot proposals, newest first (the order fetch_proposals returns).
+    """
+    rng = random.Random(seed)
+    step = PERIOD_DAYS * 86_400 / max(n, 1)
+    base = int(START.timestamp())
+    proposals = []
+    for i in range(n):
+        created = base + int(i * step + rng.random() * step)
+        choices = rng.choice(CHOICE_SETS)
+        proposals.append({
+            "id": f"0x{rng.getrandbits(256):064x}",
+            "title": f"Proposal {i}: {words(rng, 5)}",
+            "body": "\n".join(words(rng, rng.randint(10, 40)) for _ in range(rng.randint(3, 12))),
+            "author": f"0x{rng.getrandbits(160):040x}",
+            "start": created + 3_600,
+            "end": created + 3_600 + 7 * 86_400,
+            "created": created,
+            "choices": choices,
+            "type": rng.choice(VOTING_TYPES),
+            "plugins": {},
+            "strategies": [{"name": "erc20-votes", "params": {"symbol": "OP"}}],
+            "space": {"id": space, "name": "Optimism Collective"},
+        })
+    return iter(reversed(proposals))
+
+def voter_address(index):
+    return f"0x{index:040x}"
+
+def random_choice(rng, voting_type, n_choices):
+    if voting_type == "approval":
+        return sorted(rng.sample(range(1, n_choices + 1), rng.randint(1, n_choices)))
+    if voting_type == "weighted":
+        return {str(c): rng.randint(1, 100) for c in rng.sample(range(1, n_choices + 1), rng.randint(1, n_choices))}
+    return rng.randint(1, n_choices)
+
+def generate_votes(proposals, n, seed=0, voters=VOTERS):
+    """
+    About `n` votes spread over `proposals` (a list), each with "proposal_id" as the crawler
+    stores them. Voting power is heavy-tailed (Pareto) so whale detection has work to do;
+    a few percent of voters vote more than once.
+    """
+    rng = random.Random(seed)
+    if not proposals:
+        return
+    per_proposal = max(1, n // len(proposals))
+    for proposal in proposals:
+        n_choices = len(proposal["choices"])
+        duration = proposal["end"] - proposal["start"]
+        for j in range(per_proposal):
+            voter = min(int(rng.paretovariate(1.2)) - 1, voters - 1) if rng.random() < 0.03 else rng.randrange(voters)
+            yield {
+                "id": f"0x{rng.getrandbits(256):064x}",
+                "voter": voter_address(voter),
+                "choice": random_choice(rng, proposal["type"], n_choices),
+                "vp": round(rng.paretovariate(0.9) - 1, 6) * 1_000,
+                "created": proposal["start"] + int(duration * j / per_proposal),
+                "proposal_id": proposal["id"],
+            }
@@ -0,0 +1,243 @@
+# columnar.py
+"""
+Parquet storage for the two large artifacts: Snapshot votes (partitioned by
+proposal_id) and raw Discourse posts (unpartitioned; datasets from before are
+partitioned by topic_id and still read).
+
+ParquetDatasetWriter has the same write/write_many/flush/count interface as
+records.JsonlWriter, so a crawler can switch backends with --format parquet.
+It buffers ROW_GROUP_SIZE rows per part and merges a directory's small parts
+when it closes. Readers take a column list, so stages only decode the fields
+they use, and work on Arrow columns rather than one dict per row:
+read_vote_columns hands each proposal's votes over as VoteColumns.
+
+Vote `choice` is an int, a list or a dict depending on the proposal type; it is
+stored as JSON text and decoded again on read, a column at a time.
+"""
+
+import json
+import shutil
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from records import loads
+
+ROW_GROUP_SIZE = 128_000  # rows buffered before a flush writes them out
+
+VOTE_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("voter", pa.string()),
+    ("choice", pa.string()),  # JSON text
+    ("vp", pa.float64()),
+    ("created", pa.int64()),
+    ("proposal_id", pa.string()),
+])
+
+POST_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("post_number", pa.int64()),
+    ("username", pa.string()),
+    ("created_at", pa.string()),
+    ("updated_at", pa.string()),
+    ("cooked", pa.string()),
+    ("raw", pa.string()),
+    ("reply_to", pa.int64()),
+    ("downloaded_at", pa.string()),
+    ("topic_slug", pa.string()),
+    ("topic_title", pa.string()),
+    ("topic_id", pa.int64()),
+])
+
+JSON_COLUMNS = {"choice"}
+
+def encode_column(records, name):
+    """
+    The `name` field of every record, as the column stores it (JSON text for JSON columns).
+    """
+    values = [record.get(name) for record in records]
+    if name not in JSON_COLUMNS:
+        return values
+    # an int's JSON text is its str(); bools are not ints in JSON
+    return [None if v is None else str(v) if type(v) is int else json.dumps(v) for v in values]
+
+def column_values(column, name):
+    """
+    A column as a Python list; JSON columns are decoded with one loads() for the whole column.
+    """
+    if name not in JSON_COLUMNS:
+        return column.to_pylist()
+    texts = column.to_pylist()
+    if column.null_count:
+        texts = ["null" if text is None else text for text in texts]
+    return loads("[" + ",".join(texts) + "]")
+
+class ParquetDatasetWriter:
+    """
+    Buffers records and writes them as a Parquet dataset, hive-partitioned
+    (root/<partition_col>=<value>/part-<uuid>.parquet) unless partition_col is None.
+    A flush happens every `buffer_size` records and adds new part files; on close,
+    the parts smaller than a row group are merged (see compact_dataset), so the
+    parts that appends and checkpoints leave behind don't pile up.
+    """
+    def __init__(self, root, schema, partition_col, append=False, buffer_size=ROW_GROUP_SIZE):
+        self.root = Path(root)
+        self.schema = schema
+        self.partition_col = partition_col
+        self.append = append
+        self.buffer_size = buffer_size
+        self.rows = []
+        self.count = 0
+
+    def __enter__(self):
+        if not self.append and self.root.exists():
+            shutil.rmtree(self.root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+        compact_dataset(self.root, self.buffer_size)
+
+    def write(self, record):
+        self.rows.append(record)  # encoded a column at a time by flush()
+        self.count += 1
+        if len(self.rows) >= self.buffer_size:
+            self.flush()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        if not self.rows:
+            return
+        table = pa.Table.from_pydict({name: encode_column(self.rows, name) for name in self.schema.names},
+                                     schema=self.schema)
+        pq.write_to_dataset(
+            table,
+            root_path=str(self.root),
+            partition_cols=[self.partition_col] if self.partition_col else None,
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            compression="zstd",
+        )
+        self.rows = []
+
+def compact_dataset(root, row_group_size=ROW_GROUP_SIZE):
+    """
+    Merges the part files smaller than `row_group_size` rows into one part per directory
+    (per partition, or the root of an unpartitioned dataset). Returns the number of parts removed.
+    The merged part is written before the small ones are deleted, so a crash in between
+    leaves duplicates rather than losing rows.
+    """
+    removed = 0
+    by_dir = defaultdict(list)
+    for path in Path(root).rglob("part-*.parquet"):
+        by_dir[path.parent].append(path)
+    for directory, parts in by_dir.items():
+        small = sorted(path for path in parts if pq.ParquetFile(path).metadata.num_rows < row_group_size)
+        if len(small) < 2:
+            continue
+        # as stored: partition values live in the directory names, not in the files
+        table = pa.concat_tables(pq.ParquetFile(path).read() for path in small)
+        pq.write_table(table, directory / f"part-{uuid.uuid4().hex}-0.parquet",
+                       row_group_size=row_group_size, compression="zstd")
+        for path in small:
+            path.unlink()
+        removed += len(small) - 1
+    return removed
+
+def votes_writer(root, append=False):
+    return ParquetDatasetWriter(root, VOTE_SCHEMA, "proposal_id", append=append)
+
+def posts_writer(root, append=False):
+    return ParquetDatasetWriter(root, POST_SCHEMA, None, append=append)
+
+def open_dataset(root, schema, partition_col):
+    partitioning = ds.partitioning(pa.schema([schema.field(partition_col)]), flavor="hive")
+    return ds.dataset(str(root), schema=schema, format="parquet", partitioning=partitioning)
+
+def iter_dataset(root, schema, partition_col, columns=None, filter=None, drop_nulls=False, batch_size=65_536):
+    """
+    Yields records as dicts, reading only `columns` (all by default).
+    With drop_nulls, null fields are left out, as they would be absent from the JSONL record.
+    """
+    dataset = open_dataset(root, schema, partition_col)
+    for batch in dataset.to_batches(columns=columns, filter=filter, batch_size=batch_size):
+        names = batch.schema.names
+        values = [column_values(batch.column(name), name) for name in names]
+        if drop_nulls and any(batch.column(name).null_count for name in names):
+            for row in zip(*values):
+                yield {k: v for k, v in zip(names, row) if v is not None}
+        else:
+            for row in zip(*values):
+                yield dict(zip(names, row))
+
+def iter_votes(root, columns=None, proposal_ids=None):
+    return iter_dataset(root, VOTE_SCHEMA, "proposal_id", columns=columns, filter=proposal_filter(proposal_ids),
+                        drop_nulls=True)
+
+def iter_posts(root, columns=None, drop_nulls=False):
+    # topic_id partitions are only found in datasets written before posts were unpartitioned
+    return iter_dataset(root, POST_SCHEMA, "topic_id", columns=columns, drop_nulls=drop_nulls)
+
+def proposal_filter(proposal_ids):
+    return ds.field("proposal_id").isin(list(proposal_ids)) if proposal_ids is not None else None
+
+class VoteColumns:
+    """
+    One proposal's votes as column lists ({name: [values]}), without a dict per vote.
+    vote_tally.tally_votes and the scorecards read the columns directly; iterating
+    yields the vote dicts, as iter_votes would (null fields left out), for code that
+    wants records.
+    """
+    def __init__(self, proposal_id, columns):
+        self.proposal_id = proposal_id
+        self.columns = columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()), []))
+
+    def column(self, name, default=None):
+        """
+        The values of `name`, with `default` for nulls (and for every vote when it wasn't read).
+        """
+        values = self.columns.get(name)
+        if values is None:
+            return [default] * len(self)
+        if default is None:
+            return values
+        return [default if v is None else v for v in values]
+
+    def __iter__(self):
+        names = list(self.columns)
+        for row in zip(*self.columns.values()):
+            vote = {k: v for k, v in zip(names, row) if v is not None}
+            vote["proposal_id"] = self.proposal_id
+            yield vote
+
+def read_vote_columns(root, columns=None, proposal_ids=None):
+    """
+    {proposal_id: VoteColumns} of the Parquet vote dataset, reading only `columns`
+    (all by default). Each partition is one proposal, so the columns are read a
+    fragment at a time and no proposal_id column is materialized; votes keep the
+    order iter_votes yields them in.
+    """
+    dataset = open_dataset(root, VOTE_SCHEMA, "proposal_id")
+    names = [name for name in (columns or VOTE_SCHEMA.names) if name != "proposal_id"]
+    by_pid = {}
+    for fragment in dataset.get_fragments(filter=proposal_filter(proposal_ids)):
+        pid = ds.get_partition_keys(fragment.partition_expression)["proposal_id"]
+        table = fragment.to_table(columns=names, schema=dataset.schema)
+        values = {name: column_values(table.column(name), name) for name in names}
+        if pid in by_pid:  # parts appended by earlier runs
+            for name in names:
+                by_pid[pid].columns[name].extend(values[name])
+        else:
+            by_pid[pid] = VoteColumns(pid, values)
+    return by_pid
@@ -0,0 +1,165 @@
+# attachments.py
+"""
+Concurrent, deduplicated, resumable attachment downloads into a BlobStore.
+
+Every URL is fetched at most once per run, by a bounded thread pool. The store's
+manifest records each URL's SHA-256 and HTTP validators (ETag, Last-Modified,
+Content-Length), so a re-run skips attachments whose blob is already stored:
+without a network request by default, or after a conditional request
+(If-None-Match / If-Modified-Since) with revalidate=True. Files left in the flat
+download directory by older runs are moved into the store when their size
+matches the manifest or a HEAD request's Content-Length.
+"""
+
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+from blob_store import BlobStore
+from config import REQUEST_HEADERS
+from utils import get_clean_filename
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # shared modules at the repo root
+from http_client import HttpClient
+from instrumentation import TELEMETRY
+
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_TIMEOUT = 30  # seconds
+DOWNLOAD_REQUESTS_PER_SECOND = 10  # per host, adapted by http_client
+CHUNK_SIZE = 1 << 16
+
+class AttachmentDownloader:
+    """
+        with AttachmentDownloader("./data/downloads") as downloader:
+            for url in links:
+                downloader.submit(url)
+        print(downloader.summary())
+        print(downloader.client.metrics.summary())
+    """
+    def __init__(self, save_dir, workers=DOWNLOAD_WORKERS, revalidate=False):
+        self.save_dir = Path(save_dir)
+        self.store = BlobStore(save_dir)
+        self.workers = workers
+        self.revalidate = revalidate
+        self.seen = set()
+        self.lock = threading.Lock()
+        self.stats = {"downloaded": 0, "unchanged": 0, "adopted": 0, "failed": 0, "duplicate_urls": 0}
+        self.pool = None
+        self.client = None
+
+    def __enter__(self):
+        self.store.index  # load the manifest once, before the workers start
+        self.client = HttpClient(rate=DOWNLOAD_REQUESTS_PER_SECOND, burst=self.workers, pool_size=self.workers,
+                                 headers=REQUEST_HEADERS, timeout=DOWNLOAD_TIMEOUT)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers)
+        return self
+
+    def __exit__(self, *exc):
+        self.pool.shutdown(wait=True)
+        self.client.close()
+
+    def submit(self, url):
+        """
+        Queues `url` unless it was already queued in this run.
+        """
+        with self.lock:
+            if url in self.seen:
+                self.stats["duplicate_urls"] += 1
+                return
+            self.seen.add(url)
+        self.pool.submit(self.fetch, url)
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+        TELEMETRY.count(f"attachments.{key}")
+
+    def summary(self):
+        return ", ".join(f"{v} {k.replace('_', ' ')}" for k, v in self.stats.items())
+
+    def fetch(self, url):
+        try:
+            self.fetch_one(url)
+        except Exception as e:
+            self.count("failed")
+            print(f"⚠️ Failed to download {url}: {e}")
+
+    def fetch_one(self, url):
+        filename = get_clean_filename(url)
+        entry = self.store.lookup(url)
+
+        if entry is not None and self.store.has(entry.get("sha256")):
+            if not self.revalidate:
+                self.count("unchanged")
+                return
+            headers = {}
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+            self.download(url, filename, headers)
+            return
+
+        legacy_path = self.save_dir / filename
+        if legacy_path.is_file() and self.adopt(url, legacy_path, entry):
+            self.count("adopted")
+            return
+
+        self.download(url, filename)
+
+    def adopt(self, url, legacy_path, entry):
+        """
+        Moves a file from the old flat layout into the store if it matches `url`.
+        """
+        size = legacy_path.stat().st_size
+        headers = {}
+        if entry is None or entry.get("size") != size:
+            head = self.client.head(url, allow_redirects=True)
+            length = head.headers.get("Content-Length")
+            if not head.ok or length is None or int(length) != size:
+                return False
+            headers = head.headers
+
+        try:
+            sha256 = self.store.put_file(legacy_path)
+            readable = self.store.link_name(sha256, legacy_path.name)
+            legacy_path.unlink()
+        except FileNotFoundError:
+            return False  # adopted by another URL with the same file name
+
+        record = self.manifest_entry(url, legacy_path.name, sha256, size, headers, readable.name)
+        if not headers:
+            record.update({k: entry.get(k) for k in ("etag", "last_modified", "content_length")})
+        self.store.record(record)
+        return True
+
+    def download(self, url, filename, headers=None):
+        """
+        Streams `url` into the store. A 304 answer to a conditional request keeps the stored blob.
+        """
+        with self.client.get(url, headers=headers, stream=True) as r:
+            if r.status_code == 304:
+                self.count("unchanged")
+                return
+            r.raise_for_status()
+            sha256, size = self.store.put_stream(r.iter_content(chunk_size=CHUNK_SIZE))
+
+        readable = self.store.link_name(sha256, filename)
+        self.store.record(self.manifest_entry(url, filename, sha256, size, r.headers, readable.name))
+        self.count("downloaded")
+        TELEMETRY.count("attachments.bytes", size)
+
+    def manifest_entry(self, url, filename, sha256, size, headers, readable_name=None):
+        return {
+            "url": url,
+            "filename": filename,
+            "readable_name": readable_name or filename,
+            "sha256": sha256,
+            "size": size,
+            "etag": headers.get("ETag") if headers else None,
+            "last_modified": headers.get("Last-Modified") if headers else None,
+            "content_length": headers.get("Content-Length") if headers else None,
+            "fetched_at": datetime.now(timezone.utc).isoformat(),
+        }
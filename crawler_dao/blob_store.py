@@ -0,0 +1,159 @@
+# blob_store.py
+"""
+Content-addressed attachment store.
+
+    <root>/blobs/ab/abcdef...   one file per distinct content, named by its SHA-256
+    <root>/files/<name>         hard links to the blobs under their original names
+    <root>/manifest.jsonl       index: url -> sha256, original filename, size, HTTP validators
+
+Identical bytes served from several URLs are stored once; two different files with
+the same name get distinct readable names (<stem>-<sha256[:8]><ext>) instead of
+overwriting each other. Downstream stages resolve a URL to its blob with one dict
+lookup (BlobStore.path_for).
+"""
+
+import hashlib
+import os
+import shutil
+import sys
+import threading
+import uuid
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # shared modules at the repo root
+from records import append_jsonl, iter_jsonl
+
+CHUNK_SIZE = 1 << 16
+MANIFEST_NAME = "manifest.jsonl"
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_manifest(path):
+    """
+    Returns {url: entry}; later lines win.
+    """
+    if not Path(path).exists():
+        return {}
+    return {entry["url"]: entry for entry in iter_jsonl(path)}
+
+def link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if isinstance(e, FileExistsError):
+            raise
+        shutil.copy2(src, dst)  # filesystem without hard links
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = Path(root)
+        self.blobs_dir = self.root / "blobs"
+        self.names_dir = self.root / "files"
+        self.manifest_path = self.root / MANIFEST_NAME
+        self.lock = threading.Lock()
+        self._index = None
+
+    # --- blobs ------------------------------------------------------------
+
+    def blob_path(self, sha256):
+        return self.blobs_dir / sha256[:2] / sha256
+
+    def has(self, sha256):
+        return sha256 is not None and self.blob_path(sha256).exists()
+
+    def put_stream(self, chunks):
+        """
+        Writes the byte chunks to the store, hashing while streaming.
+        Returns (sha256, size); bytes already stored are not kept twice.
+        """
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.blobs_dir / f".{uuid.uuid4().hex}.part"
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            sha256 = digest.hexdigest()
+            blob = self.blob_path(sha256)
+            if blob.exists():
+                tmp_path.unlink()
+            else:
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, blob)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return sha256, size
+
+    def put_file(self, path):
+        """
+        Adds an existing file (hard-linked, not copied when possible). Returns its sha256.
+        """
+        sha256 = sha256_file(path)
+        blob = self.blob_path(sha256)
+        if not blob.exists():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                link_or_copy(path, blob)
+            except FileExistsError:
+                pass
+        return sha256
+
+    # --- readable names ---------------------------------------------------
+
+    def link_name(self, sha256, filename):
+        """
+        Exposes the blob as files/<filename>; if that name belongs to different bytes,
+        as files/<stem>-<sha256[:8]><ext>. Returns the readable path.
+        """
+        self.names_dir.mkdir(parents=True, exist_ok=True)
+        blob = self.blob_path(sha256)
+        stem, ext = os.path.splitext(filename or sha256)
+        candidates = [f"{stem}{ext}", f"{stem}-{sha256[:8]}{ext}", f"{stem}-{sha256}{ext}"]
+
+        with self.lock:
+            for name in candidates:
+                target = self.names_dir / name
+                if target.exists():
+                    if os.path.samefile(target, blob) or sha256_file(target) == sha256:
+                        return target
+                    continue
+                link_or_copy(blob, target)
+                return target
+        raise FileExistsError(f"no free name for {filename} ({sha256})")
+
+    # --- url index --------------------------------------------------------
+
+    @property
+    def index(self):
+        with self.lock:
+            if self._index is None:
+                self._index = load_manifest(self.manifest_path)
+            return self._index
+
+    def lookup(self, url):
+        return self.index.get(url)
+
+    def path_for(self, url):
+        """
+        Blob path holding the content of `url`, or None if it was never stored.
+        """
+        entry = self.lookup(url)
+        if entry is None or not self.has(entry.get("sha256")):
+            return None
+        return self.blob_path(entry["sha256"])
+
+    def record(self, entry):
+        index = self.index
+        with self.lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            append_jsonl(self.manifest_path, [entry])
+            index[entry["url"]] = entry
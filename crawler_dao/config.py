@@ -1,25 +1,6 @@
 # config.py
 
-# Base URL for the Discourse forum
-DISCOURSE_BASE_URL = "https://gov.optimism.io/"
-
-# Slugs of Discourse categories you want to crawl
-TARGET_CATEGORY_SLUGS = [
-    'get-started',
-    'gov-fund-missions',
-    'delegates',
-    'retrofunding',
-    'citizens',
-    'elected-reps',
-    'technical-proposals',
-    'policies-and-important-documents',
-    'collective-strategy',
-    'updates-and-announcements',
-    'gov-design',
-    'feedback',
-    'accountability',
-    'general'
-]
+# The forum to crawl and its categories come from the DAO registry (daos.py, --dao)
 
 # Headers for polite crawling
 REQUEST_HEADERS = {
@@ -29,3 +10,29 @@ REQUEST_HEADERS = {
 # Crawling options
 MAX_PAGES_PER_CATEGORY = 3
 SLEEP_BETWEEN_REQUESTS = 0.3  # seconds
+POSTS_CHUNK_SIZE = 20  # post ids per /t/{id}/posts.json request (--batch)
+
+# Async crawling options (downloader_dao.py --async)
+MAX_IN_FLIGHT_REQUESTS = 8
+REQUESTS_PER_SECOND_PER_HOST = 1 / SLEEP_BETWEEN_REQUESTS  # token bucket refill rate
+RATE_LIMIT_BURST = 5  # token bucket capacity
+REQUEST_TIMEOUT = 30  # seconds
+
+# Adaptive rate (http_client.py): the per-host rate starts at REQUESTS_PER_SECOND_PER_HOST
+# (the sync crawler at 1 / SLEEP_BETWEEN_REQUESTS), creeps up while the forum answers
+# normally and halves on every 429 / 503, staying between these bounds.
+MAX_REQUESTS_PER_SECOND_PER_HOST = 2 * REQUESTS_PER_SECOND_PER_HOST
+MIN_REQUESTS_PER_SECOND_PER_HOST = 0.2
+MAX_RETRIES = 5  # per request, on 429 / 5xx / network errors
+
+# HTTP response cache (http_cache.py): seconds a cached response is reused without asking
+# the forum again, by endpoint; the first matching pattern wins. Stale entries are
+# revalidated with conditional requests.
+HTTP_CACHE_TTLS = [
+    (r"/categories\.json", 60 * 60),
+    (r"/c/\d+\.json", 10 * 60),         # category topic listings
+    (r"/t/\d+\.json", 10 * 60),         # topic + post stream; --incremental also ignores entries older than bumped_at
+    (r"/t/\d+/posts\.json", 24 * 60 * 60),  # posts by id
+    (r"/posts/\d+\.json", 24 * 60 * 60),
+]
+HTTP_CACHE_DEFAULT_TTL = 10 * 60
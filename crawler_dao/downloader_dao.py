@@ -1,50 +1,281 @@
 # downloader_dao.py
+import argparse
+import asyncio
+import sys
 import time
 import json
+from collections import defaultdict
 from pathlib import Path
 from datetime import datetime, timezone
 
-from fetch import get_categories, get_category_topics, get_full_topic_posts
-from config import TARGET_CATEGORY_SLUGS, MAX_PAGES_PER_CATEGORY
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # shared modules at the repo root
+from records import JsonlWriter, iter_jsonl
+import http_cache
+import instrumentation
+from instrumentation import TELEMETRY
+from columnar import posts_writer, iter_posts
+import daos
 
-RAW_DATA_PATH = Path("./data/raw_discourse_posts.jsonl")
+import fetch
+from fetch import (
+    get_categories,
+    get_category_topics,
+    get_full_topic_posts,
+    get_full_topic_posts_batched,
+    fetch_topic_posts,
+    AsyncFetcher,
+    get_categories_async,
+    get_category_topics_async,
+    get_full_topic_posts_async,
+    get_full_topic_posts_batched_async,
+    fetch_topic_posts_async,
+    CLIENT,
+)
+from config import MAX_PAGES_PER_CATEGORY
 
-def get_target_category_ids():
-    categories = get_categories()
+DATA_DIR = Path("./data")
+
+# the crawled DAO's forum categories (None: all) and files in its partition of DATA_DIR, set by use_dao()
+CATEGORY_SLUGS = None
+RAW_DATA_PATH = None
+RAW_PARQUET_PATH = None  # --format parquet, partitioned by topic_id
+STATE_PATH = None
+DB_PATH = None  # --format sqlite
+
+def use_dao(name):
+    global CATEGORY_SLUGS, RAW_DATA_PATH, RAW_PARQUET_PATH, STATE_PATH, DB_PATH
+    dao = daos.get_dao(name)
+    fetch.use_forum(dao["forum"])
+    CATEGORY_SLUGS = dao["categories"]
+    out_dir = daos.partition(DATA_DIR, name)
+    RAW_DATA_PATH = out_dir / "raw_discourse_posts.jsonl"
+    RAW_PARQUET_PATH = out_dir / "raw_discourse_posts.parquet"
+    STATE_PATH = out_dir / "discourse_crawl_state.json"
+    DB_PATH = daos.db_path(name)
+
+def select_target_category_ids(categories):
     return [
         c["id"]
         for c in categories
-        if c["slug"] in TARGET_CATEGORY_SLUGS
+        if CATEGORY_SLUGS is None or c["slug"] in CATEGORY_SLUGS
     ]
 
-def save_jsonl(documents, out_path):
-    with open(out_path, "w") as f:
-        for doc in documents:
-            f.write(json.dumps(doc) + "\n")
+def get_target_category_ids():
+    return select_target_category_ids(get_categories())
+
+def annotate_posts(posts, topic):
+    # 💡 MINIMAL ANNOTATION ONLY — keep everything else raw
+    for post in posts:
+        post["downloaded_at"] = datetime.now(timezone.utc).isoformat()
+        post["topic_slug"] = topic.get("slug")
+        post["topic_title"] = topic.get("title")
+        post["topic_id"] = topic.get("id")
+    return posts
+
+def raw_output_path(fmt):
+    if fmt == "sqlite":
+        return DB_PATH
+    return RAW_PARQUET_PATH if fmt == "parquet" else RAW_DATA_PATH
+
+def open_raw_writer(fmt, append=False):
+    if fmt == "sqlite":
+        from sql_store import posts_db_writer
+        return posts_db_writer(append=append, path=DB_PATH)
+    if fmt == "parquet":
+        return posts_writer(RAW_PARQUET_PATH, append=append)
+    return JsonlWriter(RAW_DATA_PATH, append=append)
+
+def iter_existing_posts(fmt="jsonl"):
+    path = raw_output_path(fmt)
+    if not path.exists():
+        return iter(())
+    if fmt == "sqlite":
+        from sql_store import iter_rows, open_engine, posts
+        return iter_rows(open_engine(path), posts, columns=["id", "topic_id"])
+    if fmt == "parquet":
+        return iter_posts(path, columns=["id", "topic_id"])
+    return iter_jsonl(path)
+
+# --- incremental state --------------------------------------------------------
+# {topic_id: {"bumped_at": ..., "highest_post_number": ...}} as last seen in the
+# category listing, recorded only once every post of the topic is stored.
+
+def load_state(path):
+    if not path.exists():
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_state(state, path):
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    tmp_path.replace(path)
+
+def bumped_timestamp(topic):
+    """
+    Unix time of the topic's last bump: cached topic JSON older than that misses posts.
+    """
+    bumped_at = topic.get("bumped_at")
+    if not bumped_at:
+        return None
+    return datetime.fromisoformat(bumped_at.replace("Z", "+00:00")).timestamp()
 
-def main():
-    all_raw_posts = []
+def topic_watermark(topic):
+    return {
+        "bumped_at": topic.get("bumped_at"),
+        "highest_post_number": topic.get("highest_post_number"),
+    }
+
+class IncrementalPlan:
+    """
+    Decides which topics need fetching and which of their posts are already stored.
+    Only post ids are kept from the existing file, never the posts themselves.
+    """
+    def __init__(self, state, existing_posts):
+        self.state = state
+        self.stored_ids = set()
+        self.known_ids = defaultdict(set)
+        for post in existing_posts:
+            self.stored_ids.add(post["id"])
+            self.known_ids[post["topic_id"]].add(post["id"])
+        self.skipped = 0
+
+    def is_unchanged(self, topic):
+        if self.state.get(str(topic["id"])) == topic_watermark(topic):
+            self.skipped += 1
+            return True
+        return False
+
+    def new_posts(self, posts):
+        # dedup by post id (a post moved from another topic is already stored)
+        fresh = [post for post in posts if post["id"] not in self.stored_ids]
+        self.stored_ids.update(post["id"] for post in fresh)
+        return fresh
+
+    def record(self, topic, complete):
+        if complete:
+            self.state[str(topic["id"])] = topic_watermark(topic)
+
+# --- crawl ------------------------------------------------------------------
+# Posts are handed to the writer topic by topic and flushed in its buffer-sized
+# batches (large Parquet row groups rather than a part per topic), so memory
+# stays flat and a crash loses at most one buffer.
+
+def write_topic_posts(writer, posts, topic, plan):
+    posts = annotate_posts(posts, topic)
+    if plan is not None:
+        posts = plan.new_posts(posts)
+    writer.write_many(posts)
+    TELEMETRY.count("discourse.posts_written", len(posts))
+
+def crawl(writer, batched=False, plan=None):
+    fetch_posts = get_full_topic_posts_batched if batched else get_full_topic_posts
     category_ids = get_target_category_ids()
 
     for cat_id in category_ids:
         print(f"\n📥 Fetching topics from category ID {cat_id}")
-        topics = get_category_topics(cat_id, max_pages=MAX_PAGES_PER_CATEGORY)
+        with TELEMETRY.span("category", category_id=cat_id):
+            topics = get_category_topics(cat_id, max_pages=MAX_PAGES_PER_CATEGORY)
+
+            for topic in topics:
+                if plan is not None and plan.is_unchanged(topic):
+                    continue
+                with TELEMETRY.span("topic"):
+                    if plan is None:
+                        posts = fetch_posts(topic["id"])
+                    else:
+                        posts, complete = fetch_topic_posts(topic["id"], skip_ids=plan.known_ids[topic["id"]],
+                                                            not_before=bumped_timestamp(topic))
+                        plan.record(topic, complete)
+                    write_topic_posts(writer, posts, topic, plan)
+
+async def crawl_async(writer, batched=False, plan=None, rate_share=1.0):
+    """
+    Same records as crawl(), but categories, topic pages and posts are fetched concurrently
+    under the in-flight limit and per-host rate limit of AsyncFetcher. Topics are written
+    in completion order; their spans carry the category, as categories overlap in time.
+    `rate_share` is this crawl's fraction of the per-host request budget.
+    """
+    fetch_posts = get_full_topic_posts_batched_async if batched else get_full_topic_posts_async
+
+    async with AsyncFetcher(rate_share=rate_share) as fetcher:
+        async def crawl_topic(topic):
+            with TELEMETRY.span("topic", category_id=topic.get("category_id")):
+                if plan is None:
+                    posts = await fetch_posts(fetcher, topic["id"])
+                else:
+                    posts, complete = await fetch_topic_posts_async(
+                        fetcher, topic["id"], skip_ids=plan.known_ids[topic["id"]], not_before=bumped_timestamp(topic)
+                    )
+                    plan.record(topic, complete)
+                write_topic_posts(writer, posts, topic, plan)
+
+        async def list_category(cat_id):
+            with TELEMETRY.span("category_listing", category_id=cat_id):
+                return await get_category_topics_async(fetcher, cat_id, max_pages=MAX_PAGES_PER_CATEGORY)
+
+        category_ids = select_target_category_ids(await get_categories_async(fetcher))
+        print(f"\n📥 Fetching topics from {len(category_ids)} categories")
+        topic_lists = await asyncio.gather(*(list_category(cat_id) for cat_id in category_ids))
+        topics = [topic for topic_list in topic_lists for topic in topic_list]
+        if plan is not None:
+            topics = [topic for topic in topics if not plan.is_unchanged(topic)]
 
-        for topic in topics:
-            topic_id = topic["id"]
-            posts = get_full_topic_posts(topic_id)
+        print(f"📥 Fetching posts from {len(topics)} topics")
+        await asyncio.gather(*(crawl_topic(topic) for topic in topics))
+    print(f"📊 Discourse requests:\n{fetcher.metrics.summary()}")
 
-            # 💡 MINIMAL ANNOTATION ONLY — keep everything else raw
-            for post in posts:
-                post["downloaded_at"] = datetime.now(timezone.utc).isoformat()
-                post["topic_slug"] = topic.get("slug")
-                post["topic_title"] = topic.get("title")
-                post["topic_id"] = topic.get("id")
+def main(use_async=False, batched=False, incremental=False, fmt="jsonl", rate_share=1.0):
+    """
+    Crawls the forum of the DAO selected with use_dao().
+    """
+    start = time.time()
+    out_path = raw_output_path(fmt)
+    plan = IncrementalPlan(load_state(STATE_PATH), iter_existing_posts(fmt)) if incremental else None
+    CLIENT.share_rate(rate_share)
 
-            all_raw_posts.extend(posts)
+    # incremental runs append: posts already stored are never fetched again
+    with open_raw_writer(fmt, append=incremental) as writer, TELEMETRY.span("crawl"):
+        if use_async:
+            asyncio.run(crawl_async(writer, batched, plan, rate_share))
+        else:
+            crawl(writer, batched, plan)
+            print(f"📊 Discourse requests:\n{CLIENT.metrics.summary()}")
 
-    save_jsonl(all_raw_posts, RAW_DATA_PATH)
-    print(f"\n✅ Saved {len(all_raw_posts)} raw posts to {RAW_DATA_PATH}")
+    if plan is None:
+        print(f"\n✅ Saved {writer.count} raw posts to {out_path} in {time.time() - start:.1f}s")
+    else:
+        save_state(plan.state, STATE_PATH)
+        TELEMETRY.count("discourse.unchanged_topics", plan.skipped)
+        print(f"\n✅ Appended {writer.count} new posts ({plan.skipped} unchanged topics skipped) "
+              f"to {out_path} in {time.time() - start:.1f}s")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Download raw Discourse posts")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="fetch concurrently with the asyncio engine")
+    parser.add_argument("--batch", dest="batched", action="store_true",
+                        help="fetch posts in chunks via /t/{id}/posts.json instead of one request per post")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only fetch topics/posts that changed since the last run "
+                             "(state in data/<dao>/discourse_crawl_state.json); implies --batch")
+    parser.add_argument("--format", dest="fmt", choices=["jsonl", "parquet", "sqlite"], default="jsonl",
+                        help="write data/<dao>/raw_discourse_posts.jsonl, a Parquet dataset at "
+                             "data/<dao>/raw_discourse_posts.parquet, or the posts/topics tables of the "
+                             "DAO's SQLite store (sql_store.py)")
+    parser.add_argument("--no-http-cache", action="store_true",
+                        help="bypass the on-disk HTTP response cache (http_cache.py)")
+    daos.add_argument(parser)
+    parser.add_argument("--rate-share", type=float, default=1.0,
+                        help="fraction of the per-host request budget to use (pipeline.py sets it when "
+                             "several DAO crawls share a forum host)")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    if args.no_http_cache:
+        http_cache.disable()
+    use_dao(args.dao)
+    instrumentation.start("discourse_crawl", args)
+    main(use_async=args.use_async, batched=args.batched, incremental=args.incremental, fmt=args.fmt,
+         rate_share=args.rate_share)
+    instrumentation.finish(args)
@@ -1,18 +1,83 @@
 # fetch.py
 
-import requests
+import asyncio
+import json
+import re
+import sys
 import time
-from config import DISCOURSE_BASE_URL, REQUEST_HEADERS, SLEEP_BETWEEN_REQUESTS
+from pathlib import Path
+from urllib.parse import urlparse
+
+import aiohttp
+from config import (
+    REQUEST_HEADERS,
+    SLEEP_BETWEEN_REQUESTS,
+    POSTS_CHUNK_SIZE,
+    MAX_IN_FLIGHT_REQUESTS,
+    REQUESTS_PER_SECOND_PER_HOST,
+    RATE_LIMIT_BURST,
+    REQUEST_TIMEOUT,
+    MAX_REQUESTS_PER_SECOND_PER_HOST,
+    MIN_REQUESTS_PER_SECOND_PER_HOST,
+    MAX_RETRIES,
+    HTTP_CACHE_TTLS,
+    HTTP_CACHE_DEFAULT_TTL,
+)
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # shared modules at the repo root
+from http_cache import HTTP_CACHE, cached_request
+from instrumentation import TELEMETRY
+from http_client import (
+    RETRY_STATUSES,
+    THROTTLE_STATUSES,
+    AdaptiveRate,
+    HttpClient,
+    Metrics,
+    endpoint_name,
+    parse_retry_after,
+    retry_delay,
+)
+
+DISCOURSE_BASE_URL = None  # the forum being crawled, see use_forum()
+
+def use_forum(base_url):
+    global DISCOURSE_BASE_URL
+    DISCOURSE_BASE_URL = base_url.rstrip("/")
+
+TTL_RULES = [(re.compile(pattern), ttl) for pattern, ttl in HTTP_CACHE_TTLS]
+
+def ttl_for(url):
+    path = urlparse(url).path
+    for pattern, ttl in TTL_RULES:
+        if pattern.search(path):
+            return ttl
+    return HTTP_CACHE_DEFAULT_TTL
+
+# sync crawler: one request at a time, starting at SLEEP_BETWEEN_REQUESTS apart; cache hits do not wait
+CLIENT = HttpClient(
+    rate=1 / SLEEP_BETWEEN_REQUESTS,
+    min_rate=MIN_REQUESTS_PER_SECOND_PER_HOST,
+    max_rate=MAX_REQUESTS_PER_SECOND_PER_HOST,
+    max_retries=MAX_RETRIES,
+    headers=REQUEST_HEADERS,
+    timeout=REQUEST_TIMEOUT,
+)
+
+def get(url, not_before=None):
+    """
+    GET through the HTTP cache. `not_before` (Unix time) rejects entries stored before it.
+    """
+    return cached_request("GET", url, ttl_for(url), session=CLIENT, timeout=REQUEST_TIMEOUT, not_before=not_before)
 
 def get_categories():
-    resp = requests.get(f"{DISCOURSE_BASE_URL}/categories.json", headers=REQUEST_HEADERS)
+    resp = get(f"{DISCOURSE_BASE_URL}/categories.json")
     return resp.json()['category_list']['categories']
 
 def get_category_topics(category_id, max_pages=2):
     topics = []
     for page in range(max_pages):
         url = f"{DISCOURSE_BASE_URL}/c/{category_id}.json?page={page}"
-        resp = requests.get(url, headers=REQUEST_HEADERS)
+        resp = get(url)
         if resp.status_code != 200:
             break
         data = resp.json()
@@ -20,17 +85,31 @@ def get_category_topics(category_id, max_pages=2):
         if not page_topics:
             break
         topics.extend(page_topics)
-        time.sleep(SLEEP_BETWEEN_REQUESTS)
+    TELEMETRY.count("discourse.topics_listed", len(topics))
     return topics
 
+def post_record(post_data, topic_id):
+    return {
+        'id': post_data['id'],
+        'post_number': post_data['post_number'],
+        'username': post_data['username'],
+        'created_at': post_data['created_at'],
+        'updated_at': post_data.get('updated_at'),
+        'cooked': post_data['cooked'],  # rendered HTML
+        'raw': post_data.get('raw'),
+        'reply_to': post_data.get('reply_to_post_number'),
+        'topic_id': topic_id
+    }
+
 def get_full_topic_posts(topic_id):
     """
     Returns all posts in the topic (not just the first one),
     including raw and cooked content.
     """
     url = f"{DISCOURSE_BASE_URL}/t/{topic_id}.json"
-    resp = requests.get(url, headers=REQUEST_HEADERS)
+    resp = get(url)
     if resp.status_code != 200:
+        TELEMETRY.count("discourse.failed_topics")
         return []
 
     topic_data = resp.json()
@@ -39,24 +118,245 @@ def get_full_topic_posts(topic_id):
     all_posts = []
     for post_id in post_ids:
         post_url = f"{DISCOURSE_BASE_URL}/posts/{post_id}.json"
-        post_resp = requests.get(post_url, headers=REQUEST_HEADERS)
+        post_resp = get(post_url)
         if post_resp.status_code == 200:
-            post_data = post_resp.json()
-            all_posts.append({
-                'id': post_data['id'],
-                'post_number': post_data['post_number'],
-                'username': post_data['username'],
-                'created_at': post_data['created_at'],
-                'cooked': post_data['cooked'],  # rendered HTML
-                'raw': post_data['raw'],
-                'reply_to': post_data.get('reply_to_post_number'),
-                'topic_id': topic_id
-            })
-            print(f"process post id: {post_data['id']}, date: {post_data['created_at']}, user: {post_data['username']}")
-        time.sleep(SLEEP_BETWEEN_REQUESTS)
+            all_posts.append(post_record(post_resp.json(), topic_id))
+        else:
+            TELEMETRY.count("discourse.failed_posts")
 
+    TELEMETRY.count("discourse.posts_fetched", len(all_posts))
     return all_posts
 
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def topic_url(topic_id):
+    return f"{DISCOURSE_BASE_URL}/t/{topic_id}.json?include_raw=1"
+
+def posts_chunk_url(topic_id, post_ids):
+    params = "&".join(f"post_ids[]={post_id}" for post_id in post_ids)
+    return f"{DISCOURSE_BASE_URL}/t/{topic_id}/posts.json?include_raw=1&{params}"
+
+def missing_post_ids(topic_data, skip_ids=frozenset()):
+    """
+    Returns (stream, embedded posts by id, ids in the stream that are neither embedded
+    in the topic JSON nor in `skip_ids`).
+    """
+    post_stream = topic_data.get('post_stream', {})
+    stream = post_stream.get('stream', [])
+    by_id = {p['id']: p for p in post_stream.get('posts', [])}
+    return stream, by_id, [
+        post_id for post_id in stream
+        if post_id not in by_id and post_id not in skip_ids
+    ]
+
+def collect_topic_posts(topic_id, stream, by_id, skip_ids, complete):
+    posts = [
+        post_record(by_id[post_id], topic_id)
+        for post_id in stream
+        if post_id in by_id and post_id not in skip_ids
+    ]
+    complete = complete and all(post_id in by_id or post_id in skip_ids for post_id in stream)
+    TELEMETRY.count("discourse.posts_fetched", len(posts))
+    if not complete:
+        TELEMETRY.count("discourse.incomplete_topics")
+    return posts, complete
+
+def fetch_topic_posts(topic_id, skip_ids=frozenset(), chunk_size=POSTS_CHUNK_SIZE, not_before=None):
+    """
+    Fetches the posts of a topic whose ids are not in `skip_ids`, reusing the posts embedded
+    in the topic JSON and requesting the rest `chunk_size` posts per request.
+    A cached topic JSON stored before `not_before` (e.g. the topic's bumped_at) is not used.
+    Returns (posts, complete); `complete` is False if the topic or any chunk failed.
+    """
+    resp = get(topic_url(topic_id), not_before=not_before)
+    if resp.status_code != 200:
+        TELEMETRY.count("discourse.failed_topics")
+        return [], False
+
+    stream, by_id, missing = missing_post_ids(resp.json(), skip_ids)
+    complete = True
+    for ids in chunked(missing, chunk_size):
+        chunk_resp = get(posts_chunk_url(topic_id, ids))
+        if chunk_resp.status_code != 200:
+            complete = False
+            continue
+        for post_data in chunk_resp.json().get('post_stream', {}).get('posts', []):
+            by_id[post_data['id']] = post_data
+
+    return collect_topic_posts(topic_id, stream, by_id, skip_ids, complete)
+
+def get_full_topic_posts_batched(topic_id, chunk_size=POSTS_CHUNK_SIZE):
+    """
+    Same records as get_full_topic_posts, with far fewer requests (see fetch_topic_posts).
+    """
+    return fetch_topic_posts(topic_id, chunk_size=chunk_size)[0]
+
+# --- async engine -----------------------------------------------------------
+
+class AsyncFetcher:
+    """
+    Shared aiohttp session with a global in-flight limit, one adaptive rate per host
+    and the retry policy of http_client.HttpClient.
+
+        async with AsyncFetcher() as fetcher:
+            categories = await get_categories_async(fetcher)
+        print(fetcher.metrics.summary())
+    """
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT_REQUESTS, rate=REQUESTS_PER_SECOND_PER_HOST, burst=RATE_LIMIT_BURST,
+                 max_retries=MAX_RETRIES, min_rate=MIN_REQUESTS_PER_SECOND_PER_HOST, max_rate=MAX_REQUESTS_PER_SECOND_PER_HOST,
+                 rate_share=1.0):
+        self.max_in_flight = max_in_flight
+        # rate_share: this process's fraction of the per-host budget (HttpClient.share_rate)
+        self.rate = rate * rate_share
+        self.min_rate = min_rate * rate_share
+        self.max_rate = max_rate * rate_share
+        self.burst = burst
+        self.max_retries = max_retries
+        self.rates = {}
+        self.metrics = Metrics()
+        self.semaphore = None
+        self.session = None
+
+    async def __aenter__(self):
+        self.semaphore = asyncio.Semaphore(self.max_in_flight)
+        self.session = aiohttp.ClientSession(
+            headers=REQUEST_HEADERS,
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=self.max_in_flight),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    def rate_for(self, url):
+        host = urlparse(url).netloc
+        if host not in self.rates:
+            self.rates[host] = AdaptiveRate(self.rate, min_rate=self.min_rate, max_rate=self.max_rate, burst=self.burst)
+        return self.rates[host]
+
+    async def get_json(self, url, not_before=None):
+        """
+        Returns the decoded JSON body, or None on a non-200 response or once the retries
+        are exhausted. Goes through the HTTP cache like get(); cache hits take no rate-limit token.
+        """
+        key = HTTP_CACHE.key("GET", url)
+        meta = HTTP_CACHE.lookup(key)
+        if meta is not None and HTTP_CACHE.is_fresh(meta, ttl_for(url), not_before):
+            TELEMETRY.count("http_cache.hits")
+            return json.loads(HTTP_CACHE.read_body(key))
+        TELEMETRY.count("http_cache.misses" if meta is None else "http_cache.revalidations")
+
+        headers = HTTP_CACHE.validators(meta) if meta is not None else {}
+        rate = self.rate_for(url)
+        endpoint = endpoint_name("GET", url)
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(rate.reserve())
+            last_attempt = attempt == self.max_retries
+            async with self.semaphore:
+                start = time.perf_counter()
+                try:
+                    async with self.session.get(url, headers=headers) as resp:
+                        status = resp.status
+                        self.metrics.record(endpoint, status, time.perf_counter() - start, retried=attempt > 0)
+                        if status == 304 and meta is not None:
+                            rate.on_success()
+                            HTTP_CACHE.renew(key, meta)
+                            return json.loads(HTTP_CACHE.read_body(key))
+                        if status not in RETRY_STATUSES:
+                            rate.on_success()
+                            if status != 200:
+                                return None
+                            body = await resp.read()
+                            self.metrics.add_bytes(endpoint, len(body))
+                            HTTP_CACHE.store(key, url, resp.headers, body)
+                            return json.loads(body)
+                        retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self.metrics.record(endpoint, latency=time.perf_counter() - start, retried=attempt > 0, error=True)
+                    if last_attempt:
+                        print(f"⚠️ Failed to fetch {url}: {e}")
+                        return None
+                    status, retry_after = None, None
+
+            if status in THROTTLE_STATUSES:
+                rate.on_throttle(pause=retry_after or 0.0)
+            if last_attempt:
+                print(f"⚠️ Failed to fetch {url}: HTTP {status}")
+                return None
+            await asyncio.sleep(retry_delay(attempt, retry_after))
+
+async def get_categories_async(fetcher):
+    data = await fetcher.get_json(f"{DISCOURSE_BASE_URL}/categories.json")
+    return data['category_list']['categories']
+
+async def get_category_topics_async(fetcher, category_id, max_pages=2):
+    """
+    Fetches all pages concurrently, then keeps them up to the first empty or failed page,
+    matching get_category_topics.
+    """
+    urls = [f"{DISCOURSE_BASE_URL}/c/{category_id}.json?page={page}" for page in range(max_pages)]
+    pages = await asyncio.gather(*(fetcher.get_json(url) for url in urls))
+
+    topics = []
+    for data in pages:
+        if data is None:
+            break
+        page_topics = data.get("topic_list", {}).get("topics", [])
+        if not page_topics:
+            break
+        topics.extend(page_topics)
+    TELEMETRY.count("discourse.topics_listed", len(topics))
+    return topics
+
+async def get_full_topic_posts_async(fetcher, topic_id):
+    """
+    Async counterpart of get_full_topic_posts: posts of the topic are fetched concurrently.
+    """
+    topic_data = await fetcher.get_json(f"{DISCOURSE_BASE_URL}/t/{topic_id}.json")
+    if topic_data is None:
+        TELEMETRY.count("discourse.failed_topics")
+        return []
+
+    post_ids = topic_data.get('post_stream', {}).get('stream', [])
+    results = await asyncio.gather(*(
+        fetcher.get_json(f"{DISCOURSE_BASE_URL}/posts/{post_id}.json")
+        for post_id in post_ids
+    ))
+    posts = [post_record(post_data, topic_id) for post_data in results if post_data is not None]
+    TELEMETRY.count("discourse.posts_fetched", len(posts))
+    TELEMETRY.count("discourse.failed_posts", len(results) - len(posts))
+    return posts
+
+async def fetch_topic_posts_async(fetcher, topic_id, skip_ids=frozenset(), chunk_size=POSTS_CHUNK_SIZE, not_before=None):
+    """
+    Async counterpart of fetch_topic_posts: the chunks are fetched concurrently.
+    """
+    topic_data = await fetcher.get_json(topic_url(topic_id), not_before=not_before)
+    if topic_data is None:
+        TELEMETRY.count("discourse.failed_topics")
+        return [], False
+
+    stream, by_id, missing = missing_post_ids(topic_data, skip_ids)
+    chunks = await asyncio.gather(*(
+        fetcher.get_json(posts_chunk_url(topic_id, ids))
+        for ids in chunked(missing, chunk_size)
+    ))
+    complete = True
+    for data in chunks:
+        if data is None:
+            complete = False
+            continue
+        for post_data in data.get('post_stream', {}).get('posts', []):
+            by_id[post_data['id']] = post_data
+
+    return collect_topic_posts(topic_id, stream, by_id, skip_ids, complete)
+
+async def get_full_topic_posts_batched_async(fetcher, topic_id, chunk_size=POSTS_CHUNK_SIZE):
+    return (await fetch_topic_posts_async(fetcher, topic_id, chunk_size=chunk_size))[0]
+
 
 if False: # version 0
     import requests
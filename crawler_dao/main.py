@@ -1,34 +1,202 @@
 # main.py
 
-from process import extract_posts
-from save import save_jsonl
-from utils import extract_upload_links_from_html, download_file, extract_pdf_links_from_text
-import json
+import argparse
+import hashlib
+import os
+import sys
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+from pathlib import Path
 
-RAW_PATH = "./data/raw_discourse_posts.jsonl"
-OUT_PATH = "./data/optimism_discourse_corpus.jsonl"
+from process import extract_post, normalize_html
+from utils import extract_links
+from attachments import AttachmentDownloader, DOWNLOAD_WORKERS
 
-def load_jsonl(path):
-    with open(path, "r") as f:
-        return [json.loads(line) for line in f]
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # shared modules at the repo root
+from records import JsonlWriter, iter_jsonl, loads
+import daos
+import instrumentation
+from instrumentation import TELEMETRY
 
-def main():
-    raw_posts = load_jsonl(RAW_PATH)
+DATA_DIR = Path("./data")
 
-    print(f"🔍 Loaded {len(raw_posts)} raw posts")
+# the DAO's forum and files in its partition of DATA_DIR, set by use_dao()
+FORUM_URL = None
+RAW_PATH = None
+OUT_PATH = None
+DOWNLOADS_DIR = None
+PARSE_CACHE_PATH = None
 
-    all_docs = extract_posts(raw_posts)
-    print(f"📝 Extracted {len(all_docs)} structured docs")
+PARSE_CHUNK_SIZE = 64  # posts per task sent to a parser process
+PARSER_VERSION = 1  # bump when parse_html output changes, to invalidate the cache
 
-    for post in raw_posts:
-        html = post.get("cooked", "")
-        upload_links = extract_upload_links_from_html(html)
-        upload_links.extend(extract_pdf_links_from_text(html))
-        for url in upload_links:
-            download_file(url=url, save_dir='./data/downloads')
+def use_dao(name):
+    global FORUM_URL, RAW_PATH, OUT_PATH, DOWNLOADS_DIR, PARSE_CACHE_PATH
+    FORUM_URL = daos.get_dao(name)["forum"]
+    data_dir = daos.partition(DATA_DIR, name)
+    RAW_PATH = data_dir / "raw_discourse_posts.jsonl"
+    OUT_PATH = data_dir / "discourse_corpus.jsonl"
+    DOWNLOADS_DIR = data_dir / "downloads"
+    PARSE_CACHE_PATH = data_dir / "parsed_posts_cache.jsonl"
 
-    save_jsonl(all_docs, OUT_PATH)
-    print(f"\n✅ Saved {len(all_docs)} structured posts to {OUT_PATH}")
+def parse_html(html, base_url):
+    """
+    Everything derived from a post's `cooked` HTML: normalized text, quotes, code blocks,
+    attachment links (relative ones resolved against the forum at `base_url`).
+    """
+    parsed = normalize_html(html)
+    parsed["links"] = extract_links(html, base_url)
+    return parsed
+
+def parse_chunk(htmls, base_url):
+    return [parse_html(html, base_url) for html in htmls]
+
+def post_version(post):
+    """
+    Cache key part that changes when the post is edited: updated_at, or a hash of the
+    HTML for records crawled before updated_at was stored.
+    """
+    return post.get("updated_at") or hashlib.sha1((post.get("cooked") or "").encode()).hexdigest()
+
+class ParseCache:
+    """
+    parse_html results keyed by (post id, version). Only an index of
+    {id: (version, file offset)} is kept in memory; a hit reads its entry from the file.
+    Each run rewrites the cache with the entries of the posts it saw, so edited and
+    deleted posts drop out.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.index = {}
+        if self.path.exists():
+            with open(self.path, "rb") as f:
+                offset = 0
+                for line in f:
+                    try:
+                        entry = loads(line)
+                    except ValueError:
+                        entry = None  # truncated by a crash mid-write
+                    if entry is not None and entry.get("parser_version") == PARSER_VERSION:
+                        self.index[entry["id"]] = (entry["version"], offset)
+                    offset += len(line)
+        self.hits = 0
+        self.misses = 0
+        self.reader = None
+        self.writer = None
+
+    def __enter__(self):
+        if self.index:
+            self.reader = open(self.path, "rb")
+        self.tmp_path = self.path.with_suffix(".tmp")
+        self.writer = JsonlWriter(self.tmp_path).__enter__()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if self.reader is not None:
+            self.reader.close()
+        self.writer.__exit__(exc_type, *exc)
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        else:
+            self.tmp_path.unlink(missing_ok=True)
+
+    def get(self, post):
+        version, offset = self.index.get(post.get("id"), (None, None))
+        if version is not None and version == post_version(post):
+            self.hits += 1
+            self.reader.seek(offset)
+            return loads(self.reader.readline())["parsed"]
+        self.misses += 1
+        return None
+
+    def put(self, post, parsed):
+        self.writer.write({"id": post.get("id"), "version": post_version(post),
+                           "parser_version": PARSER_VERSION, "parsed": parsed})
+
+def chunked(iterable, size):
+    it = iter(iterable)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+def iter_parsed_posts(posts, cache, jobs, base_url):
+    """
+    Yields (post, parsed) in input order. Posts whose (id, version) is cached are not
+    re-parsed; the rest are parsed in chunks, across a process pool when jobs > 1,
+    with at most 2 * jobs chunks in flight.
+    """
+    def merge(chunk, results):
+        results = iter(results)
+        for post, cached in chunk:
+            parsed = cached if cached is not None else next(results)
+            cache.put(post, parsed)
+            yield post, parsed
+
+    def misses(chunk):
+        return [post.get("cooked") or "" for post, cached in chunk if cached is None]
+
+    chunks = ([(post, cache.get(post)) for post in chunk] for chunk in chunked(posts, PARSE_CHUNK_SIZE))
+    if jobs <= 1:
+        for chunk in chunks:
+            yield from merge(chunk, parse_chunk(misses(chunk), base_url))
+        return
+
+    with Pool(jobs) as pool:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append((chunk, pool.apply_async(parse_chunk, (misses(chunk), base_url))))
+            if len(in_flight) >= 2 * jobs:
+                chunk, result = in_flight.popleft()
+                yield from merge(chunk, result.get())
+        while in_flight:
+            chunk, result = in_flight.popleft()
+            yield from merge(chunk, result.get())
+
+def corpus_doc(post, parsed):
+    doc = extract_post(post)
+    doc["text"] = parsed["text"]
+    doc["quotes"] = parsed["quotes"]
+    doc["code_blocks"] = parsed["code_blocks"]
+    return doc
+
+def main(workers=DOWNLOAD_WORKERS, revalidate=False, jobs=1):
+    """
+    Builds the corpus of the DAO selected with use_dao().
+    """
+    # one pass over the raw posts: structured docs are written as they are extracted,
+    # attachments download in the background as their links are found
+    # the "corpus" span minus "parse" is the time spent waiting for the last downloads
+    with TELEMETRY.span("corpus"), \
+            AttachmentDownloader(DOWNLOADS_DIR, workers=workers, revalidate=revalidate) as downloader, \
+            ParseCache(PARSE_CACHE_PATH) as cache, \
+            JsonlWriter(OUT_PATH) as writer:
+        with TELEMETRY.span("parse", jobs=jobs):
+            for post, parsed in iter_parsed_posts(iter_jsonl(RAW_PATH), cache, jobs, FORUM_URL):
+                writer.write(corpus_doc(post, parsed))
+                for url in parsed["links"]:
+                    downloader.submit(url)
+
+        TELEMETRY.count("corpus.posts_written", writer.count)
+        TELEMETRY.count("corpus.parse_cache_hits", cache.hits)
+        TELEMETRY.count("corpus.parse_cache_misses", cache.misses)
+        print(f"\n✅ Saved {writer.count} structured posts to {OUT_PATH} "
+              f"({cache.misses} parsed, {cache.hits} from cache), waiting for downloads...")
+
+    print(f"📎 Attachments: {downloader.summary()}")
+    print(f"📊 Attachment requests:\n{downloader.client.metrics.summary()}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Build the Discourse corpus and mirror post attachments")
+    parser.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS,
+                        help="concurrent attachment downloads")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="re-check stored attachments with conditional requests instead of trusting the manifest")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="processes parsing post HTML (1 = in-process)")
+    daos.add_argument(parser)
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    use_dao(args.dao)
+    instrumentation.start("discourse_corpus", args)
+    main(workers=args.workers, revalidate=args.revalidate, jobs=args.jobs)
+    instrumentation.finish(args)
@@ -1,24 +1,132 @@
 # process.py
 
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
+
+BLOCK_TAGS = {
+    "p", "div", "br", "hr", "li", "ul", "ol", "table", "tr", "td", "th",
+    "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "aside", "pre", "details", "summary",
+}
+VOID_TAGS = {"br", "hr", "img", "input", "meta", "link", "wbr", "source", "area", "col", "embed"}
+SKIP_TAGS = {"script", "style"}
+
+def collapse_whitespace(fragments):
+    lines = (" ".join(line.split()) for line in "".join(fragments).split("\n"))
+    return "\n".join(line for line in lines if line)
+
+class TextNormalizer(HTMLParser):
+    """
+    Turns Discourse `cooked` HTML into clean text in one streaming pass.
+    Quotes (<aside class="quote">, <blockquote>) and code blocks (<pre>) are split out of
+    the body text; onebox previews, scripts and styles are dropped. Block elements become
+    line breaks and whitespace is collapsed within lines; code keeps its formatting.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []  # (tag, role) of the open elements
+        self.sinks = [[]]  # text fragments: body, then one per open quote
+        self.quotes = []
+        self.code_blocks = []
+        self.code = None
+        self.skip_depth = 0
+
+    def role(self, tag, attrs):
+        classes = (attrs.get("class") or "").split()
+        in_quote = bool(self.stack) and isinstance(self.stack[-1][1], tuple)
+        if tag in SKIP_TAGS or (tag == "aside" and "onebox" in classes):
+            return "skip"
+        if tag == "div" and "title" in classes and in_quote:
+            return "skip"  # "username:" header of a Discourse quote
+        if tag == "aside" and "quote" in classes:
+            return "quote"
+        if tag == "blockquote" and not in_quote:
+            return "quote"
+        if tag == "pre":
+            return "code"
+        return None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag in BLOCK_TAGS:
+            self.sinks[-1].append("\n")
+        if tag in VOID_TAGS:
+            return
+        role = self.role(tag, attrs) if not self.skip_depth else "skip"
+        if role == "skip":
+            self.skip_depth += 1
+        elif role == "quote":
+            self.sinks.append([])
+            self.quotes.append({"username": attrs.get("data-username"), "text": None})
+            role = ("quote", len(self.quotes) - 1)
+        elif role == "code" and self.code is None:
+            self.code = []
+        self.stack.append((tag, role))
+
+    def handle_endtag(self, tag):
+        if not any(open_tag == tag for open_tag, _ in self.stack):
+            return  # stray end tag
+        while self.stack:
+            open_tag, role = self.stack.pop()
+            self.close_role(role)
+            if open_tag == tag:
+                break
+        if tag in BLOCK_TAGS:
+            self.sinks[-1].append("\n")
+
+    def close_role(self, role):
+        if role == "skip":
+            self.skip_depth -= 1
+        elif role == "code" and not any(r == "code" for _, r in self.stack):
+            self.code_blocks.append("".join(self.code).strip("\n"))
+            self.code = None
+        elif isinstance(role, tuple):
+            self.quotes[role[1]]["text"] = collapse_whitespace(self.sinks.pop())
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            return
+        if self.code is not None:
+            self.code.append(data)
+        else:
+            self.sinks[-1].append(data)
+
+    def result(self):
+        self.close_all()
+        return {
+            "text": collapse_whitespace(self.sinks[0]),
+            "quotes": [q for q in self.quotes if q["text"]],
+            "code_blocks": [c for c in self.code_blocks if c],
+        }
+
+    def close_all(self):
+        while self.stack:
+            self.close_role(self.stack.pop()[1])
+
+def normalize_html(html):
+    """
+    Returns {"text", "quotes": [{"username", "text"}], "code_blocks": [str]} for a post's HTML.
+    """
+    parser = TextNormalizer()
+    parser.feed(html or "")
+    parser.close()
+    return parser.result()
 
 def html_to_text(html):
-    return BeautifulSoup(html, "html.parser").get_text()
+    return normalize_html(html)["text"]
+
+def extract_post(post):
+    return {
+        "id": post.get("id"),
+        "topic_id": post.get("topic_id"),
+        "topic_slug": post.get("topic_slug"),
+        "topic_title": post.get("topic_title"),
+        "post_number": post.get("post_number"),
+        "username": post.get("username"),
+        "created_at": post.get("created_at"),
+        "raw": post.get("raw"),
+    }
 
 def extract_posts(posts):
-    docs = []
-    for post in posts:
-        doc = {
-            "topic_id": post.get("topic_id"),
-            "topic_slug": post.get("topic_slug"),
-            "topic_title": post.get("topic_title"),
-            "post_number": post.get("post_number"),
-            "username": post.get("username"),
-            "created_at": post.get("created_at"),
-            "raw": post.get("raw"),
-        }
-        docs.append(doc)
-    return docs
+    return [extract_post(post) for post in posts]
 
 if False:
     def extract_posts(topic_json):
@@ -1,11 +1,18 @@
 # utils.py
 
 import re
-from config import DISCOURSE_BASE_URL
 import os
+import time
 import requests
+from datetime import datetime, timezone
+from html.parser import HTMLParser
 from urllib.parse import urlparse, unquote, urljoin
 
+from blob_store import BlobStore
+from http_cache import DAY, IMMUTABLE, HttpCache
+
+EXTERNAL_ATTACHMENT_TTL = DAY
+
 def get_clean_filename(url: str) -> str:
     """
     Extracts a clean filename from a URL by removing query parameters like ?dl=1
@@ -14,35 +21,112 @@ def get_clean_filename(url: str) -> str:
     filename = os.path.basename(parsed_url.path)
     return unquote(filename)
 
-def extract_upload_links_from_html(html: str) -> list[str]:
+DOWNLOAD_EXTENSIONS = (".pdf", ".docx", ".doc", ".png", ".jpg", ".jpeg")
+PDF_URL_RE = re.compile(r'https?://[^\s<>"\']+\.pdf', re.IGNORECASE)
+
+class LinkExtractor(HTMLParser):
     """
-    Extracts all links to PDFs/images from the post HTML, including external links.
+    Single streaming pass over a post's HTML collecting, in document order and deduplicated:
+    anchors and images pointing to documents/images, Discourse uploads
+    (/uploads/... and upload:// short URLs) and bare PDF URLs in the text.
+    Relative URLs are resolved against the forum at `base_url`.
     """
-    from bs4 import BeautifulSoup
-    soup = BeautifulSoup(html, "html.parser")
-    links = []
+    def __init__(self, base_url):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.links = []
+        self.seen = set()
+
+    def add(self, url):
+        if url.startswith("upload://"):
+            url = urljoin(self.base_url, "/uploads/short-url/" + url[len("upload://"):])
+        else:
+            url = urljoin(self.base_url, url)
+        if url not in self.seen:
+            self.seen.add(url)
+            self.links.append(url)
 
-    for a in soup.find_all("a", href=True):
-        href = a['href']
-        if any(href.lower().endswith(ext) for ext in [".pdf", ".docx", ".doc", ".png", ".jpg", ".jpeg"]):
-            links.append(href)
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href and is_download_link(href):
+                self.add(href)
+        elif tag == "img":
+            attrs = dict(attrs)
+            src = attrs.get("src")
+            if (src and "emoji" not in (attrs.get("class") or "")
+                    and "/optimized/" not in src  # Discourse thumbnail of an upload linked by the lightbox anchor
+                    and is_download_link(src)):
+                self.add(src)
 
-    return links
+    def handle_data(self, data):
+        for url in PDF_URL_RE.findall(data):
+            self.add(url)
+
+def is_download_link(url: str) -> bool:
+    path = urlparse(url).path.lower()
+    return path.endswith(DOWNLOAD_EXTENSIONS) or url.startswith("upload://") or "/uploads/short-url/" in path
+
+def extract_links(html: str, base_url: str) -> list[str]:
+    """
+    All attachment links of a post in one pass (see LinkExtractor).
+    """
+    if not html:
+        return []
+    parser = LinkExtractor(base_url)
+    parser.feed(html)
+    parser.close()
+    return parser.links
+
+def extract_upload_links_from_html(html: str, base_url: str) -> list[str]:
+    """
+    Extracts all links to PDFs/images from the post HTML, including external links.
+    """
+    return extract_links(html, base_url)
 
 def extract_pdf_links_from_text(html: str) -> list[str]:
-    return re.findall(r'https?://[^\s]+\.pdf', html)
+    return PDF_URL_RE.findall(html)
+
+def attachment_ttl(url: str) -> float:
+    # Discourse uploads are content-addressed: a URL always serves the same bytes
+    return IMMUTABLE if "/uploads/" in urlparse(url).path else EXTERNAL_ATTACHMENT_TTL
+
+def is_fresh(entry, ttl) -> bool:
+    if ttl == IMMUTABLE:
+        return True
+    fetched_at = entry.get("fetched_at")
+    return fetched_at is not None and time.time() - datetime.fromisoformat(fetched_at).timestamp() < ttl
 
 def download_file(url: str, save_dir: str = "downloads"):
-    os.makedirs(save_dir, exist_ok=True)
+    """
+    Downloads `url` into the content-addressed store at `save_dir` (see blob_store.py)
+    and returns its sha256, or None on failure.
+    The store's manifest doubles as the HTTP cache: a stored URL is not requested again
+    within its TTL (attachment_ttl), and after that only conditionally.
+    """
+    store = BlobStore(save_dir)
     filename = get_clean_filename(url)
-    file_path = os.path.join(save_dir, filename)
+    entry = store.lookup(url)
+    headers = {}
+    if entry is not None and store.has(entry.get("sha256")):
+        if is_fresh(entry, attachment_ttl(url)):
+            return entry["sha256"]
+        headers = HttpCache.validators(entry)
 
     try:
-        with requests.get(url, stream=True, timeout=10) as r:
+        with requests.get(url, headers=headers, stream=True, timeout=10) as r:
+            if r.status_code == 304:
+                store.record(dict(entry, fetched_at=datetime.now(timezone.utc).isoformat()))
+                return entry["sha256"]
             r.raise_for_status()
-            with open(file_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
-        print(f"✅ Downloaded: {filename}")
+            sha256, size = store.put_stream(r.iter_content(chunk_size=8192))
+        readable = store.link_name(sha256, filename)
+        store.record({"url": url, "filename": filename, "readable_name": readable.name,
+                      "sha256": sha256, "size": size,
+                      "etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified"),
+                      "fetched_at": datetime.now(timezone.utc).isoformat()})
+        print(f"✅ Downloaded: {readable.name}")
+        return sha256
     except Exception as e:
         print(f"⚠️ Failed to download {url}: {e}")
+        return None
@@ -1,139 +1,655 @@
 # main.py
 
+import argparse
+import bisect
 import requests
 import json
+import re
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-SNAPSHOT_API = "https://hub.snapshot.org/graphql"
-SPACE = "opcollective.eth"
+from tqdm import tqdm
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # shared modules at the repo root
+from records import JsonlWriter, iter_jsonl, save_jsonl
+from columnar import votes_writer, iter_votes
+import daos
+import http_cache
+import instrumentation
+from http_cache import IMMUTABLE, MINUTE, cached_request
+from http_client import HttpClient, retry_delay
+from instrumentation import TELEMETRY
+
+SNAPSHOT_API = daos.SNAPSHOT_API
 
 OUTPUT_DIR = Path("./data/")
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
-PROPOSALS_PATH = OUTPUT_DIR / "proposals.jsonl"
-VOTES_PATH = OUTPUT_DIR / "votes.jsonl"
-
-def fetch_proposals(limit=1000):
-    query = f"""
-    query {{
-      proposals(
-        first: {limit},
-        where: {{ space_in: ["{SPACE}"] }},
-        orderBy: "created",
-        orderDirection: desc
-      ) {{
-        id
-        title
-        body
-        author
-        start
-        end
-        created
-        choices
-        type
-        plugins
-        strategies {{
-          name
-          params
-        }}
-        space {{
-          id
-          name
-        }}
-      }}
-    }}
-    """
-    resp = requests.post(SNAPSHOT_API, json={"query": query})
+
+# the DAO's Snapshot space and files in its partition of OUTPUT_DIR, set by use_dao()
+SPACE = None
+PROPOSALS_PATH = None
+VOTES_PATH = None
+VOTES_PARQUET_PATH = None  # --format parquet, partitioned by proposal_id
+SYNC_STATE_PATH = None
+DB_PATH = None  # --format sqlite
+
+# Concurrency options
+MAX_CONCURRENT_PROPOSALS = 4    # proposals paged at the same time
+REQUESTS_PER_SECOND = 5         # starting budget for hub.snapshot.org, adapted between the bounds below
+MAX_REQUESTS_PER_SECOND = 10
+MIN_REQUESTS_PER_SECOND = 0.5
+MAX_RETRIES = 3                 # per proposal (GraphQL errors, exhausted HTTP retries), with jittered backoff
+RETRY_BACKOFF_SECONDS = 2
+
+# --incremental flushes the votes and saves the watermarks every this many votes,
+# so a Parquet dataset gets large parts instead of one per proposal
+CHECKPOINT_VOTES = 100_000
+
+# HTTP cache TTLs (http_cache.py). Votes of an ended proposal never change, so their
+# pages are kept for good, provided they were fetched after the end.
+PROPOSALS_TTL = 5 * MINUTE
+OPEN_VOTES_TTL = 1 * MINUTE
+
+# every request to the Snapshot API shares this client: pooled connections (resized to
+# --workers), HTTP-level retries on 429 / 5xx and one adaptive rate for the host
+CLIENT = HttpClient(
+    rate=REQUESTS_PER_SECOND,
+    min_rate=MIN_REQUESTS_PER_SECOND,
+    max_rate=MAX_REQUESTS_PER_SECOND,
+    pool_size=MAX_CONCURRENT_PROPOSALS,
+    timeout=30,
+)
+
+def use_dao(name):
+    global SPACE, PROPOSALS_PATH, VOTES_PATH, VOTES_PARQUET_PATH, SYNC_STATE_PATH, DB_PATH
+    SPACE = daos.get_dao(name)["space"]
+    out_dir = daos.partition(OUTPUT_DIR, name)
+    PROPOSALS_PATH = out_dir / "proposals.jsonl"
+    VOTES_PATH = out_dir / "votes.jsonl"
+    VOTES_PARQUET_PATH = out_dir / "votes.parquet"
+    SYNC_STATE_PATH = out_dir / "snapshot_sync_state.json"
+    DB_PATH = daos.db_path(name)
+
+def is_graphql_success(body):
+    try:
+        return "errors" not in json.loads(body)
+    except ValueError:
+        return False
+
+def post_graphql(query, variables=None, ttl=0, not_before=None):
+    """
+    POSTs the query through the HTTP cache: a response younger than `ttl` seconds (and
+    stored after `not_before`) is reused; responses with GraphQL errors are not cached.
+    """
+    payload = {"query": query}
+    if variables is not None:
+        payload["variables"] = variables
+    resp = cached_request("POST", SNAPSHOT_API, ttl, session=CLIENT, json_body=payload, timeout=30,
+                          not_before=not_before, cacheable=is_graphql_success)
     resp.raise_for_status()
-    return resp.json()["data"]["proposals"]
+    return resp.json()["data"]
+
+def votes_cache_policy(proposal):
+    """
+    (ttl, not_before) for the vote pages of `proposal`.
+    """
+    end = proposal.get("end")
+    if end is not None and end < time.time():
+        return IMMUTABLE, end
+    return OPEN_VOTES_TTL, None
+
+# Proposal field sets. "listing" is all an incremental run needs to find new and
+# edited proposals; the others are what gets stored (the stored records carry
+# `updated` so later listings can be compared with them).
+PROPOSAL_FIELDS = {
+    "listing": "id created updated",
+    # what the joiner and the scorecards read: no body, strategy names only
+    "core": "id title author start end created updated choices type strategies { name } space { id name }",
+    "full": "id title body author start end created updated choices type plugins strategies { name params } space { id name }",
+}
+PROPOSALS_PAGE_SIZE = 1000  # the hub's maximum `first`
+PROPOSAL_DETAILS_BATCH = 100  # ids per detail query
+
+PROPOSALS_QUERY = """
+query Proposals($space: String!, $first: Int!, $created_lte: Int!) {{
+  proposals(
+    first: $first
+    where: {{ space_in: [$space], created_lte: $created_lte }}
+    orderBy: "created"
+    orderDirection: desc
+  ) {{
+    {fields}
+  }}
+}}
+"""
+
+# the proposals created in one second, for the rare page that second fills (see page_by_created)
+PROPOSALS_RUN_QUERY = """
+query ProposalRun($space: String!, $first: Int!, $skip: Int!, $created: Int!) {{
+  proposals(
+    first: $first
+    skip: $skip
+    where: {{ space_in: [$space], created: $created }}
+    orderBy: "created"
+    orderDirection: desc
+  ) {{
+    {fields}
+  }}
+}}
+"""
+
+PROPOSAL_DETAILS_QUERY = """
+query ProposalDetails($ids: [String]!, $first: Int!) {{
+  proposals(first: $first, where: {{ id_in: $ids }}) {{
+    {fields}
+  }}
+}}
+"""
+
+def field_names(fields):
+    """
+    Top-level names of a field set: "id strategies { name }" -> ["id", "strategies"].
+    """
+    while "{" in fields:
+        fields = re.sub(r"\{[^{}]*\}", " ", fields)
+    return fields.split()
 
-def fetch_all_votes(proposal_id, overlap_seconds=10):
-    all_votes = {}
-    page_size = 1000
-    last_timestamp = int(time.time())
+# --- keyset pagination on `created` ---------------------------------------------
+# The hub orders rows by `created` only; rows sharing a timestamp come back in no
+# documented order, and an id can't bound a page either, as its where filters have no
+# id_gt (string fields only compare for equality). So a page never ends inside a
+# timestamp: the rows at the last `created` of a full page are dropped, and the next
+# page starts at that value and gets all of them in one response. Only a timestamp
+# shared by more rows than a page is paged with skip (read_created_run).
 
-    # alternatively: Use the Snapshot Subgraph (The Graph), more robust and faster (?)
+def page_by_created(fetch_page, fetch_run, cursor, page_size, descending=False):
+    """
+    Every row from `cursor` on (down from it when descending), by id.
+    fetch_page(cursor) returns the first `page_size` rows from `cursor` inclusive, in
+    `created` order; fetch_run(created, skip) pages through the rows with exactly `created`.
+    Returns (rows by id, pages, rows received twice, runs whose order changed).
+    """
+    rows = {}
+    pages = refetched = tie_changes = 0
     while True:
-        query = """
-        query Votes($proposal: String!, $first: Int!, $created_lt: Int!) {
-          votes(
-            first: $first
-            where: { proposal: $proposal, created_lt: $created_lt }
-            orderBy: "created"
-            orderDirection: desc
-          ) {
-            id
-            voter
-            choice
-            vp
-            created
-          }
-        }
-        """
-        variables = {
-            "proposal": proposal_id,
-            "first": page_size,
-            "created_lt": last_timestamp,
-        }
+        page = fetch_page(cursor)
+        pages += 1
+        if len(page) < page_size:
+            rows.update((row["id"], row) for row in page)
+            break
 
-        resp = requests.post(SNAPSHOT_API, json={"query": query, "variables": variables})
-        resp.raise_for_status() # TODO: need retry logic
-        data = resp.json()
-        page_votes = data["data"]["votes"]
+        edge = page[-1]["created"]
+        if page[0]["created"] == edge:
+            # one timestamp fills the page
+            run, run_pages, changes = read_created_run(fetch_run, edge, page_size)
+            rows.update(run)
+            pages += run_pages
+            refetched += len(page)
+            tie_changes += changes
+            cursor = edge - 1 if descending else edge + 1
+        else:
+            # the rows at `edge` may go on past this page: the next one starts with all of them
+            for row in page:
+                if row["created"] == edge:
+                    refetched += 1
+                else:
+                    rows[row["id"]] = row
+            cursor = edge
+    return rows, pages, refetched, tie_changes
 
-        if not page_votes:
+def read_created_run(fetch_run, created, page_size, passes=MAX_RETRIES + 1):
+    """
+    Every row with exactly `created`, paged with skip, which relies on a stable tie
+    order. A row received twice in one pass shows the order changed (and that another
+    row was skipped), so the run is read again, keeping the rows of every pass, up to
+    `passes` times. Returns (rows by id, pages, passes whose order changed).
+    """
+    rows = {}
+    pages = changes = 0
+    for _ in range(passes):
+        seen = set()
+        changed = False
+        skip = 0
+        while True:
+            page = fetch_run(created, skip)
+            pages += 1
+            for row in page:
+                changed |= row["id"] in seen
+                seen.add(row["id"])
+                rows[row["id"]] = row
+            skip += len(page)
+            if len(page) < page_size:
+                break
+        if not changed:
             break
+        changes += 1
+    return rows, pages, changes
+
+def fetch_proposals(fields="full", page_size=PROPOSALS_PAGE_SIZE):
+    """
+    Every proposal of SPACE, newest first, with the `fields` of PROPOSAL_FIELDS,
+    paginated with page_by_created from the newest `created` down.
+    """
+    query = PROPOSALS_QUERY.format(fields=PROPOSAL_FIELDS[fields])
+    run_query = PROPOSALS_RUN_QUERY.format(fields=PROPOSAL_FIELDS[fields])
+
+    def fetch_page(created_lte):
+        variables = {"space": SPACE, "first": page_size, "created_lte": created_lte}
+        return post_graphql(query, variables, ttl=PROPOSALS_TTL)["proposals"]
+
+    def fetch_run(created, skip):
+        variables = {"space": SPACE, "first": page_size, "skip": skip, "created": created}
+        return post_graphql(run_query, variables, ttl=PROPOSALS_TTL)["proposals"]
+
+    proposals, pages, refetched, tie_changes = page_by_created(
+        fetch_page, fetch_run, 2 ** 31 - 1, page_size, descending=True  # GraphQL Int max
+    )
+    TELEMETRY.count("snapshot.proposal_pages", pages)
+    TELEMETRY.count("snapshot.proposals_refetched", refetched)
+    if tie_changes:
+        TELEMETRY.count("snapshot.proposal_tie_changes", tie_changes)
+        print(f"⚠️ {tie_changes} times the order of proposals sharing a timestamp changed while they were "
+              f"paged; they were read again, but proposals may be missing")
+    return list(proposals.values())
+
+def fetch_proposal_details(ids, fields="full", workers=MAX_CONCURRENT_PROPOSALS, batch_size=PROPOSAL_DETAILS_BATCH):
+    """
+    {id: proposal with the `fields` of PROPOSAL_FIELDS} for `ids`, `batch_size` ids per query.
+    Proposals deleted since they were listed are missing.
+    """
+    query = PROPOSAL_DETAILS_QUERY.format(fields=PROPOSAL_FIELDS[fields])
+    batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+
+    def fetch_batch(batch):
+        return post_graphql(query, {"ids": batch, "first": len(batch)}, ttl=PROPOSALS_TTL)["proposals"]
+
+    details = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for page in pool.map(fetch_batch, batches):
+            details.update((p["id"], p) for p in page)
+    return details
+
+def needs_details(stored, listed, fields):
+    """
+    True if the listed proposal is new, was edited since it was stored, or was stored
+    with fewer fields than `fields` asks for.
+    """
+    return (
+        stored is None
+        or stored.get("updated") != listed.get("updated")
+        or any(name not in stored for name in field_names(PROPOSAL_FIELDS[fields]))
+    )
+
+def sync_proposals(fields="full", workers=MAX_CONCURRENT_PROPOSALS):
+    """
+    Lists the space's proposals with the "listing" fields, then fetches the details of
+    the new and edited ones only; the others are reused from PROPOSALS_PATH.
+    Returns every proposal, newest first. Proposals deleted from the hub drop out.
+    """
+    stored = {p["id"]: p for p in iter_jsonl(PROPOSALS_PATH)} if PROPOSALS_PATH.exists() else {}
+    listing = fetch_proposals(fields="listing")
+    changed = [p["id"] for p in listing if needs_details(stored.get(p["id"]), p, fields)]
+    details = fetch_proposal_details(changed, fields, workers)
+
+    TELEMETRY.count("snapshot.proposals_listed", len(listing))
+    TELEMETRY.count("snapshot.proposal_details_fetched", len(details))
+    print(f"📥 {len(listing)} proposals listed, {len(changed)} new or edited")
+    proposals = []
+    for p in listing:
+        proposal = details.get(p["id"]) or stored.get(p["id"])
+        if proposal is not None:
+            proposals.append(proposal)
+    return proposals
+
+class PaginationStats:
+    """
+    Thread-safe counters for vote pagination: pages, rows, the rows received twice
+    (the last timestamp of a full page, read again with the next one) and the runs of
+    votes sharing a timestamp whose order changed while they were paged (see
+    page_by_created). For comparison, the pages the previous overlapping-window pager
+    would have requested on the same votes, and the rows it would have downloaded twice
+    or never reached (replay_overlapping_pager); duplicates_avoided is the difference
+    in rows downloaded twice.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pages = 0
+        self.rows = 0
+        self.refetched = 0
+        self.tie_changes = 0
+        self.legacy_pages = 0
+        self.legacy_refetched = 0
+        self.legacy_missed = 0
+
+    def add(self, pages=0, rows=0, refetched=0, tie_changes=0, legacy_pages=0, legacy_refetched=0, legacy_missed=0):
+        with self.lock:
+            self.pages += pages
+            self.rows += rows
+            self.refetched += refetched
+            self.tie_changes += tie_changes
+            self.legacy_pages += legacy_pages
+            self.legacy_refetched += legacy_refetched
+            self.legacy_missed += legacy_missed
+
+    @property
+    def duplicates_avoided(self):
+        return self.legacy_refetched - self.refetched
+
+    def summary(self):
+        summary = (f"{self.pages} pages, {self.rows} rows, {self.refetched} received twice; "
+                   f"{self.duplicates_avoided} duplicates avoided against the overlapping-window pager "
+                   f"({self.legacy_pages} pages, {self.legacy_refetched} received twice, {self.legacy_missed} missed)")
+        if self.tie_changes:
+            summary += (f", ⚠️ {self.tie_changes} runs of votes sharing a timestamp changed order while paged "
+                        f"(read again, votes may be missing)")
+        return summary
+
+PAGINATION_STATS = PaginationStats()
+
+VOTES_QUERY = """
+query Votes($proposal: String!, $first: Int!, $created_gte: Int!) {
+  votes(
+    first: $first
+    where: { proposal: $proposal, created_gte: $created_gte }
+    orderBy: "created"
+    orderDirection: asc
+  ) {
+    id
+    voter
+    choice
+    vp
+    created
+  }
+}
+"""
 
-        for v in page_votes:
-            all_votes[v["id"]] = v  # deduping by unique vote id
+# the votes cast in one second, for the page that second fills (see page_by_created)
+VOTES_RUN_QUERY = """
+query VoteRun($proposal: String!, $first: Int!, $skip: Int!, $created: Int!) {
+  votes(
+    first: $first
+    skip: $skip
+    where: { proposal: $proposal, created: $created }
+    orderBy: "created"
+    orderDirection: asc
+  ) {
+    id
+    voter
+    choice
+    vp
+    created
+  }
+}
+"""
 
-        # Set new upper bound (overlapping window to avoid missing ties)
-        min_created = min(v["created"] for v in page_votes)
-        last_timestamp = min_created + 1 - overlap_seconds
+def fetch_all_votes(proposal_id, created_gte=0, page_size=1000, stats=PAGINATION_STATS, cache_policy=(0, None)):
+    """
+    Returns all votes of the proposal with created >= created_gte, oldest first,
+    paginated with page_by_created.
+    `cache_policy` is the (ttl, not_before) of the pages in the HTTP cache.
+    """
+    def fetch_page(cursor):
+        variables = {"proposal": proposal_id, "first": page_size, "created_gte": cursor}
+        return post_graphql(VOTES_QUERY, variables, *cache_policy)["votes"]
+
+    def fetch_run(created, skip):
+        variables = {"proposal": proposal_id, "first": page_size, "skip": skip, "created": created}
+        return post_graphql(VOTES_RUN_QUERY, variables, *cache_policy)["votes"]
 
-        if last_timestamp <= 0:
+    by_id, pages, refetched, tie_changes = page_by_created(fetch_page, fetch_run, created_gte, page_size)
+    votes = list(by_id.values())
+    legacy_pages, legacy_refetched, legacy_missed = replay_overlapping_pager(votes, page_size)
+    TELEMETRY.count("snapshot.vote_pages", pages)
+    TELEMETRY.count("snapshot.votes_fetched", len(votes))
+    TELEMETRY.count("snapshot.votes_refetched", refetched)
+    if tie_changes:
+        TELEMETRY.count("snapshot.vote_tie_changes", tie_changes)
+    stats.add(pages=pages, rows=len(votes), refetched=refetched, tie_changes=tie_changes,
+              legacy_pages=legacy_pages, legacy_refetched=legacy_refetched, legacy_missed=legacy_missed)
+    return votes
+
+def replay_overlapping_pager(votes, page_size=1000, overlap_seconds=10):
+    """
+    Replays the pager this module used before page_by_created (descending pages of
+    `created_lt`, reset to min(created) + 1 - overlap_seconds after each page) over
+    one proposal's `votes`. Returns (pages it would have requested, rows it would
+    have downloaded twice, rows it would never have reached).
+    """
+    # ascending keys of the descending order, so bisect finds "first row with created < t"
+    keys = sorted(-v["created"] for v in votes)
+    if not keys:
+        return 1, 0, 0
+
+    pages = refetched = downloaded = 0
+    seen_end = 0  # pages only move forward, so rows before seen_end were downloaded
+    last_timestamp = -keys[0] + 1
+    while last_timestamp > 0:
+        pages += 1  # an empty page ends it too
+        start = bisect.bisect_right(keys, -last_timestamp)
+        end = min(start + page_size, len(keys))
+        if start >= end:
             break
+        refetched += max(0, min(end, seen_end) - start)
+        downloaded += end - max(start, seen_end)
+        seen_end = max(seen_end, end)
+        last_timestamp = -keys[end - 1] + 1 - overlap_seconds
+    return pages, refetched, len(keys) - downloaded
+
+def fetch_votes_with_retry(proposal, created_gte=0, retries=MAX_RETRIES):
+    proposal_id = proposal["id"]
+    for attempt in range(retries + 1):
+        try:
+            with TELEMETRY.span("proposal_votes"):
+                return fetch_all_votes(proposal_id=proposal_id, created_gte=created_gte,
+                                       cache_policy=votes_cache_policy(proposal))
+        except (requests.RequestException, KeyError, ValueError) as e:
+            if attempt == retries:
+                TELEMETRY.count("snapshot.failed_proposals")
+                raise
+            TELEMETRY.count("snapshot.proposal_retries")
+            delay = retry_delay(attempt, base=RETRY_BACKOFF_SECONDS)
+            tqdm.write(f"    ↻ Retrying {proposal_id} in {delay:.1f}s ({attempt + 1}/{retries}): {e}")
+            time.sleep(delay)
 
-        time.sleep(0.2)  # Be polite to API
+def fetch_votes_concurrently(proposals, created_gte_by_id=None, workers=MAX_CONCURRENT_PROPOSALS):
+    """
+    Pages the votes of several proposals at once (all requests share CLIENT).
+    Yields (proposal, votes, error) in completion order; error is the last
+    exception once a proposal ran out of retries, else None.
+    """
+    created_gte_by_id = created_gte_by_id or {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(fetch_votes_with_retry, p, created_gte_by_id.get(p["id"], 0)): p
+            for p in proposals
+        }
+        with tqdm(total=len(futures), desc="proposals", unit="proposal") as progress:
+            for future in as_completed(futures):
+                proposal = futures[future]
+                progress.update(1)
+                try:
+                    yield proposal, future.result(), None
+                except Exception as e:
+                    yield proposal, [], e
 
-    return list(all_votes.values())
+def votes_output_path(fmt):
+    if fmt == "sqlite":
+        return DB_PATH
+    return VOTES_PARQUET_PATH if fmt == "parquet" else VOTES_PATH
 
-def save_jsonl(filename, items):
-    with open(filename, "w", encoding="utf-8") as f:
-        for item in items:
-            f.write(json.dumps(item) + "\n")
+def open_votes_writer(fmt, append=False):
+    if fmt == "sqlite":
+        from sql_store import votes_db_writer
+        return votes_db_writer(append=append, path=DB_PATH)
+    if fmt == "parquet":
+        return votes_writer(VOTES_PARQUET_PATH, append=append)
+    return JsonlWriter(VOTES_PATH, append=append)
 
-def append_jsonl(filename, items):
-    with open(filename, "a", encoding="utf-8") as f:
-        for item in items:
-            f.write(json.dumps(item) + "\n")
+def load_vote_ids(fmt="jsonl"):
+    path = votes_output_path(fmt)
+    if not path.exists():
+        return set()
+    if fmt == "sqlite":
+        from sql_store import iter_rows, open_engine, votes
+        return {vote["id"] for vote in iter_rows(open_engine(path), votes, columns=["id"])}
+    if fmt == "parquet":
+        return {vote["id"] for vote in iter_votes(path, columns=["id"])}
+    return {vote["id"] for vote in iter_jsonl(path)}
 
-def main():
-    print("📥 Fetching proposals...")
-    proposals = fetch_proposals(limit=1000)
+def save_proposals(proposals, fmt="jsonl"):
+    # proposals.jsonl is always written; the SQLite store also gets its own copy
     save_jsonl(PROPOSALS_PATH, proposals)
+    if fmt == "sqlite":
+        from sql_store import save_proposals as save_proposals_db
+        save_proposals_db(proposals, path=DB_PATH)
     print(f"✅ Saved {len(proposals)} proposals to {PROPOSALS_PATH}")
 
-    print("📥 Fetching votes for each proposal...")
-    all_votes = []
-    for i, proposal in enumerate(proposals):
-        proposal_id = proposal["id"]
-        title = proposal["title"][:60].replace("\n", " ")
-        print(f"  [{i+1}/{len(proposals)}] → {proposal_id} — {title}...")
+def report_failures(failed):
+    for proposal_id, e in failed:
+        print(f"    ❌ Failed to fetch votes for {proposal_id} after {MAX_RETRIES} retries: {e}")
+
+# --- incremental sync state ---------------------------------------------------
+# {proposal_id: {"end": ..., "last_vote_created": ..., "synced_at": ...}}
+# synced_at is when the last successful fetch started; once it is past `end`
+# the proposal is closed and every vote is stored.
+
+def load_sync_state(path):
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_sync_state(state, path):
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    tmp_path.replace(path)
+
+def is_fully_synced(proposal, entry):
+    return (
+        entry is not None
+        and entry.get("end") == proposal.get("end")
+        and entry.get("synced_at", 0) > proposal["end"]
+    )
+
+def sync_votes(proposals, state, fmt="jsonl", workers=MAX_CONCURRENT_PROPOSALS):
+    """
+    Appends the votes not yet stored to the votes file/dataset (dedup by vote id).
+    Closed proposals synced after their end are skipped; others only fetch
+    votes created at or after their watermark.
+    Returns (appended vote count, skipped proposal count, failed [(proposal_id, error)]).
+    """
+    stored_ids = load_vote_ids(fmt)
+    pending = [p for p in proposals if not is_fully_synced(p, state.get(p["id"]))]
+    watermarks = {p["id"]: state.get(p["id"], {}).get("last_vote_created", 0) for p in pending}
+    failed = []
+
+    # synced_at must not be later than the start of the fetch it describes
+    synced_at = int(time.time())
+    unflushed = 0
+    with open_votes_writer(fmt, append=True) as writer:
+        for proposal, votes, error in fetch_votes_concurrently(pending, watermarks, workers):
+            proposal_id = proposal["id"]
+            if error is not None:
+                failed.append((proposal_id, error))
+                continue
 
-        try:
-            votes = fetch_all_votes(proposal_id=proposal_id)
             for vote in votes:
+                if vote["id"] in stored_ids:
+                    continue
                 vote["proposal_id"] = proposal_id
-            all_votes.extend(votes)
-            time.sleep(0.5)
-        except Exception as e:
-            print(f"    ❌ Failed to fetch votes for {proposal_id}: {e}")
+                stored_ids.add(vote["id"])
+                writer.write(vote)
+                unflushed += 1
+
+            state[proposal_id] = {
+                "end": proposal.get("end"),
+                "last_vote_created": max((v["created"] for v in votes), default=watermarks[proposal_id]),
+                "synced_at": synced_at,
+            }
+            # votes must be on disk before the watermark that covers them
+            if unflushed >= CHECKPOINT_VOTES:
+                writer.flush()
+                save_sync_state(state, SYNC_STATE_PATH)
+                unflushed = 0
+    save_sync_state(state, SYNC_STATE_PATH)
+
+    return writer.count, len(proposals) - len(pending), failed
+
+def fetch_and_save_proposals(fmt, fields="full", workers=MAX_CONCURRENT_PROPOSALS):
+    print("📥 Fetching proposals...")
+    with TELEMETRY.span("proposals"):
+        proposals = sync_proposals(fields, workers)
+        save_proposals(proposals, fmt)
+    TELEMETRY.count("snapshot.proposals", len(proposals))
+    return proposals
+
+def main_incremental(workers=MAX_CONCURRENT_PROPOSALS, fmt="jsonl", fields="full"):
+    proposals = fetch_and_save_proposals(fmt, fields, workers)
 
-    save_jsonl(VOTES_PATH, all_votes)
-    print(f"✅ Saved {len(all_votes)} votes to {VOTES_PATH}")
+    print("📥 Syncing new votes...")
+    state = load_sync_state(SYNC_STATE_PATH)
+    with TELEMETRY.span("votes"):
+        appended, skipped, failed = sync_votes(proposals, state, fmt=fmt, workers=workers)
+    TELEMETRY.count("snapshot.votes_written", appended)
+    TELEMETRY.count("snapshot.synced_proposals_skipped", skipped)
+    report_failures(failed)
+    print(f"📊 Vote pagination: {PAGINATION_STATS.summary()}")
+    print(f"📊 Snapshot API:\n{CLIENT.metrics.summary()}")
+    print(f"✅ Appended {appended} new votes to {votes_output_path(fmt)} ({skipped} closed proposals already synced)")
+    print("🏁 Done.")
+
+def main(workers=MAX_CONCURRENT_PROPOSALS, fmt="jsonl", fields="full"):
+    proposals = fetch_and_save_proposals(fmt, fields, workers)
+
+    print("📥 Fetching votes for each proposal...")
+    failed = []
+    # votes are written proposal by proposal, in completion order, and flushed in the writer's batches
+    with open_votes_writer(fmt) as writer, TELEMETRY.span("votes"):
+        for proposal, votes, error in fetch_votes_concurrently(proposals, workers=workers):
+            if error is not None:
+                failed.append((proposal["id"], error))
+                continue
+            for vote in votes:
+                vote["proposal_id"] = proposal["id"]
+            writer.write_many(votes)
+    TELEMETRY.count("snapshot.votes_written", writer.count)
+    report_failures(failed)
+    print(f"📊 Vote pagination: {PAGINATION_STATS.summary()}")
+    print(f"📊 Snapshot API:\n{CLIENT.metrics.summary()}")
+    print(f"✅ Saved {writer.count} votes to {votes_output_path(fmt)}")
     print("🏁 Done.")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Download Snapshot proposals and votes")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only fetch votes newer than the per-proposal watermarks in data/<dao>/snapshot_sync_state.json")
+    parser.add_argument("--workers", type=int, default=MAX_CONCURRENT_PROPOSALS,
+                        help="proposals whose votes are paged concurrently")
+    parser.add_argument("--format", dest="fmt", choices=["jsonl", "parquet", "sqlite"], default="jsonl",
+                        help="write votes to data/<dao>/votes.jsonl, a Parquet dataset at data/<dao>/votes.parquet, "
+                             "or the proposals/votes tables of the DAO's SQLite store (sql_store.py)")
+    parser.add_argument("--fields", choices=["core", "full"], default="full",
+                        help="proposal fields to store: everything, or only what the joiner and scorecards read "
+                             "(no body, no strategy params)")
+    parser.add_argument("--no-http-cache", action="store_true",
+                        help="bypass the on-disk HTTP response cache (http_cache.py)")
+    daos.add_argument(parser)
+    parser.add_argument("--rate-share", type=float, default=1.0,
+                        help="fraction of the Snapshot API request budget to use (pipeline.py sets it when "
+                             "several DAO crawls run at once)")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    if args.no_http_cache:
+        http_cache.disable()
+    use_dao(args.dao)
+    CLIENT.share_rate(args.rate_share)
+    CLIENT.set_pool_size(max(args.workers, MAX_CONCURRENT_PROPOSALS))
+    instrumentation.start("snapshot_crawl", args)
+    if args.incremental:
+        main_incremental(workers=args.workers, fmt=args.fmt, fields=args.fields)
+    else:
+        main(workers=args.workers, fmt=args.fmt, fields=args.fields)
+    instrumentation.finish(args)
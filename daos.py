@@ -0,0 +1,87 @@
+# daos.py
+"""
+Registry of the DAOs the pipeline tracks. Each DAO has a Discourse forum, the
+category slugs to crawl there (None for every category) and a Snapshot space.
+Adding a DAO is adding an entry here.
+
+Every script takes --dao NAME and keeps that DAO's files in its own partition:
+
+    crawler_dao/data/<dao>/        raw posts, crawl state, corpus, attachments
+    crawler_snapshot/data/<dao>/   proposals, votes, vote sync state
+    data/<dao>/                    linked proposals, scorecards, SQLite store
+
+The HTTP response cache (.cache/http) is shared, as it is keyed by URL.
+pipeline.py runs the stages of several DAOs concurrently, splitting the request
+budget of a host (the Snapshot hub, a forum hosting several DAOs) between the
+crawls that share it.
+"""
+
+from pathlib import Path
+from urllib.parse import urlparse
+
+ROOT = Path(__file__).resolve().parent
+
+SNAPSHOT_API = "https://hub.snapshot.org/graphql"
+
+DAOS = {
+    "optimism": {
+        "forum": "https://gov.optimism.io",
+        "categories": [
+            'get-started',
+            'gov-fund-missions',
+            'delegates',
+            'retrofunding',
+            'citizens',
+            'elected-reps',
+            'technical-proposals',
+            'policies-and-important-documents',
+            'collective-strategy',
+            'updates-and-announcements',
+            'gov-design',
+            'feedback',
+            'accountability',
+            'general'
+        ],
+        "space": "opcollective.eth",
+    },
+    "arbitrum": {
+        "forum": "https://forum.arbitrum.foundation",
+        "categories": None,
+        "space": "arbitrumfoundation.eth",
+    },
+    "uniswap": {
+        "forum": "https://gov.uniswap.org",
+        "categories": None,
+        "space": "uniswapgovernance.eth",
+    },
+}
+DEFAULT_DAO = "optimism"
+
+def get_dao(name):
+    """
+    The registry entry of `name`, with its "name" filled in.
+    """
+    if name not in DAOS:
+        raise ValueError(f"unknown DAO {name!r} (registered: {', '.join(DAOS)})")
+    return {"name": name, **DAOS[name]}
+
+def host(url):
+    return urlparse(url).netloc
+
+def partition(data_dir, name):
+    """
+    The directory holding DAO `name`'s files under `data_dir`, created if missing.
+    """
+    path = Path(data_dir) / name
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+def db_path(name):
+    """
+    The SQLite store (sql_store.py) of DAO `name`.
+    """
+    return partition(ROOT / "data", name) / "dao.sqlite"
+
+def add_argument(parser):
+    parser.add_argument("--dao", choices=list(DAOS), default=DEFAULT_DAO,
+                        help=f"DAO to work on, from the registry in daos.py (default {DEFAULT_DAO})")
@@ -0,0 +1,171 @@
+# http_cache.py
+"""
+Persistent on-disk HTTP response cache shared by the crawlers.
+
+    <root>/ab/<key>.json   metadata: url, stored_at, ETag / Last-Modified
+    <root>/ab/<key>.body   response body
+
+The key is the SHA-256 of the method, URL and request body, so GraphQL POSTs are
+cached per query and variables. Only successful responses are stored.
+Freshness is decided by the caller, per request, with a TTL for its endpoint class:
+a fresh entry is returned without any network request; a stale one is revalidated
+with If-None-Match / If-Modified-Since when the server gave validators, and a 304
+renews it. A crawl that dies halfway therefore replays everything it already
+fetched from disk.
+
+Delete the directory to drop the cache; --no-http-cache on the crawlers bypasses it.
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+import requests
+
+from instrumentation import TELEMETRY
+
+# outside data/, so pipeline.py --backup never copies it
+CACHE_DIR = Path(__file__).resolve().parent / ".cache" / "http"
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+IMMUTABLE = float("inf")  # TTL of responses that can never change
+
+class CachedResponse:
+    """
+    The subset of requests.Response the crawlers use.
+    """
+    def __init__(self, status_code, content, from_cache=False):
+        self.status_code = status_code
+        self.content = content
+        self.from_cache = from_cache
+
+    @property
+    def ok(self):
+        return 200 <= self.status_code < 400
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(f"HTTP {self.status_code}")
+
+class HttpCache:
+    def __init__(self, root=CACHE_DIR, enabled=True):
+        self.root = Path(root)
+        self.enabled = enabled
+
+    @staticmethod
+    def key(method, url, body=None):
+        digest = hashlib.sha256(f"{method.upper()} {url}\n".encode())
+        if body is not None:
+            digest.update(json.dumps(body, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def paths(self, key):
+        folder = self.root / key[:2]
+        return folder / f"{key}.json", folder / f"{key}.body"
+
+    def lookup(self, key):
+        """
+        Stored metadata for `key`, or None (also when the body is missing).
+        """
+        if not self.enabled:
+            return None
+        meta_path, body_path = self.paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return meta if body_path.exists() else None
+
+    @staticmethod
+    def is_fresh(meta, ttl, not_before=None):
+        """
+        Younger than `ttl` seconds, and stored after `not_before` (a Unix time) if given.
+        """
+        if not_before is not None and meta["stored_at"] < not_before:
+            return False
+        return time.time() - meta["stored_at"] < ttl
+
+    @staticmethod
+    def validators(meta):
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def read_body(self, key):
+        with open(self.paths(key)[1], "rb") as f:
+            return f.read()
+
+    def write_atomic(self, path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def store(self, key, url, headers, body):
+        if not self.enabled:
+            return
+        meta_path, body_path = self.paths(key)
+        self.write_atomic(body_path, body)  # body first: metadata marks a complete entry
+        self.write_meta(meta_path, {
+            "url": url,
+            "stored_at": time.time(),
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+        })
+
+    def renew(self, key, meta):
+        """
+        Marks a revalidated entry (304) as fresh again.
+        """
+        meta = dict(meta, stored_at=time.time())
+        self.write_meta(self.paths(key)[0], meta)
+
+    def write_meta(self, path, meta):
+        self.write_atomic(path, json.dumps(meta).encode())
+
+HTTP_CACHE = HttpCache()
+
+def disable():
+    HTTP_CACHE.enabled = False
+
+def cached_request(method, url, ttl, session=None, headers=None, json_body=None, timeout=None,
+                   not_before=None, throttle=None, cacheable=None, cache=HTTP_CACHE):
+    """
+    Sends the request unless a fresh response is cached, revalidating stale entries.
+    `throttle` is called before each network request (rate limiting), `cacheable`
+    gets the body of a 200 response and may veto storing it (e.g. GraphQL errors).
+    Returns a CachedResponse.
+    """
+    key = cache.key(method, url, json_body)
+    meta = cache.lookup(key)
+    if meta is not None and cache.is_fresh(meta, ttl, not_before):
+        TELEMETRY.count("http_cache.hits")
+        return CachedResponse(200, cache.read_body(key), from_cache=True)
+    TELEMETRY.count("http_cache.misses" if meta is None else "http_cache.revalidations")
+
+    request_headers = dict(headers or {})
+    if meta is not None:
+        request_headers.update(cache.validators(meta))
+    if throttle is not None:
+        throttle()
+    resp = (session or requests).request(method, url, headers=request_headers, json=json_body, timeout=timeout)
+
+    if resp.status_code == 304 and meta is not None:
+        cache.renew(key, meta)
+        return CachedResponse(200, cache.read_body(key), from_cache=True)
+    if resp.status_code == 200 and (cacheable is None or cacheable(resp.content)):
+        cache.store(key, url, resp.headers, resp.content)
+    return CachedResponse(resp.status_code, resp.content)
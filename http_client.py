@@ -0,0 +1,270 @@
+# http_client.py
+"""
+Shared HTTP client layer for the crawlers: pooled connections, retries with
+jittered exponential backoff, Retry-After handling, an adaptive per-host request
+rate and per-endpoint metrics.
+
+Rate: each host gets an AdaptiveRate scheduler starting at the configured rate.
+After every `healthy_streak` consecutive successful responses the rate grows by
+`increase` (up to max_rate); a 429 or 503 halves it (down to min_rate), at most
+once per second so a burst of concurrent 429s counts as one, and, with
+Retry-After, pauses the whole host for that long. Retries use "full
+jitter" backoff, uniform(0, min(cap, base * 2**attempt)), unless the server
+says how long to wait.
+
+HttpClient wraps requests.Session for threads; AdaptiveRate, retry_delay and
+Metrics are also used by the aiohttp engine in crawler_dao/fetch.py. Metrics
+also feed the run's instrumentation (http.* counters and the http.latency histogram).
+"""
+
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import TELEMETRY
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0  # seconds
+BACKOFF_CAP = 60.0
+MAX_RETRY_AFTER = 300.0  # never trust a server asking for more than this
+
+class AdaptiveRate:
+    """
+    Request scheduler whose rate follows the server's health (AIMD). reserve() books the next
+    send slot, 1 / rate after the previous one (`burst` slots may be taken at once after an idle
+    period), and returns how long to wait for it, so threads and coroutines can share it.
+    A rate change only spaces out the slots booked after it.
+    """
+    def __init__(self, rate, min_rate=None, max_rate=None, burst=1, increase=0.1, healthy_streak=20):
+        self.rate = rate
+        self.min_rate = min(min_rate, rate) if min_rate is not None else rate / 8
+        self.max_rate = max(max_rate, rate) if max_rate is not None else rate * 2
+        self.burst = burst
+        self.increase = increase
+        self.healthy_streak = healthy_streak
+        self.next_slot = float("-inf")
+        self.blocked_until = 0.0
+        self.decreased_at = float("-inf")
+        self.successes = 0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now - (self.burst - 1) / self.rate, self.blocked_until)
+            self.next_slot = slot + 1 / self.rate
+            return max(0.0, slot - now)
+
+    def on_success(self):
+        with self.lock:
+            self.successes += 1
+            if self.successes >= self.healthy_streak:
+                self.successes = 0
+                self.rate = min(self.max_rate, self.rate * (1 + self.increase))
+
+    def on_throttle(self, pause=0.0):
+        with self.lock:
+            now = time.monotonic()
+            self.successes = 0
+            if now - self.decreased_at >= max(1.0, 1 / self.rate):  # requests sent before the last decrease
+                self.decreased_at = now
+                self.rate = max(self.min_rate, self.rate / 2)
+            self.blocked_until = max(self.blocked_until, now + pause)
+
+def parse_retry_after(value):
+    """
+    Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None.
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+def retry_delay(attempt, retry_after=None, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+GRAPHQL_FIELD = re.compile(r"\{\s*(\w+)")
+
+def endpoint_name(method, url, json_body=None):
+    """
+    Metrics label: method, host and path with numbers replaced by {id}; GraphQL
+    requests are labelled by their top-level field (e.g. "POST hub.snapshot.org/graphql votes").
+    """
+    parsed = urlparse(url)
+    path = re.sub(r"\d+", "{id}", re.sub("/+", "/", parsed.path))
+    name = f"{method.upper()} {parsed.netloc}{path}"
+    if isinstance(json_body, dict) and "query" in json_body:
+        match = GRAPHQL_FIELD.search(json_body["query"])
+        if match and match.group(1) == "query":
+            match = GRAPHQL_FIELD.search(json_body["query"], match.end())
+        if match:
+            name += f" {match.group(1)}"
+    return name
+
+class Metrics:
+    """
+    Thread-safe per-endpoint counters: requests sent, retries, throttled responses,
+    network errors, status codes, bytes received and latency.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = defaultdict(lambda: {
+            "requests": 0, "retries": 0, "throttled": 0, "errors": 0, "bytes": 0,
+            "statuses": defaultdict(int), "latency_total": 0.0, "latency_max": 0.0,
+        })
+
+    def record(self, endpoint, status=None, latency=0.0, retried=False, error=False):
+        with self.lock:
+            stats = self.endpoints[endpoint]
+            stats["requests"] += 1
+            stats["retries"] += int(retried)
+            stats["errors"] += int(error)
+            if status is not None:
+                stats["statuses"][status] += 1
+                stats["throttled"] += int(status in THROTTLE_STATUSES)
+            stats["latency_total"] += latency
+            stats["latency_max"] = max(stats["latency_max"], latency)
+        TELEMETRY.count("http.requests", endpoint=endpoint, status=status if status is not None else "error")
+        TELEMETRY.observe("http.latency", latency, endpoint=endpoint)
+        if retried:
+            TELEMETRY.count("http.retries", endpoint=endpoint)
+
+    def add_bytes(self, endpoint, size):
+        with self.lock:
+            self.endpoints[endpoint]["bytes"] += size
+        TELEMETRY.count("http.bytes", size, endpoint=endpoint)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                endpoint: {
+                    "requests": s["requests"], "retries": s["retries"], "throttled": s["throttled"],
+                    "errors": s["errors"], "bytes": s["bytes"], "statuses": dict(s["statuses"]),
+                    "latency_mean": s["latency_total"] / s["requests"] if s["requests"] else 0.0,
+                    "latency_max": s["latency_max"],
+                }
+                for endpoint, s in self.endpoints.items()
+            }
+
+    def summary(self):
+        lines = []
+        for endpoint, s in sorted(self.snapshot().items()):
+            lines.append(f"   {endpoint}: {s['requests']} requests, {s['retries']} retries, "
+                         f"{s['throttled']} throttled, {s['errors']} errors, {s['bytes'] / 2 ** 20:.1f} MB, "
+                         f"latency mean {s['latency_mean'] * 1000:.0f} ms / max {s['latency_max'] * 1000:.0f} ms")
+        return "\n".join(lines) or "   no requests"
+
+class HttpClient:
+    """
+    requests.Session with connection pooling, retries and adaptive per-host rates.
+
+        client = HttpClient(rate=3, headers=REQUEST_HEADERS)
+        resp = client.get(url)          # retried on 429/5xx/network errors
+        print(client.metrics.summary())
+
+    After the last retry the final response is returned (or the network error raised),
+    so callers keep their own status handling.
+    """
+    def __init__(self, rate, min_rate=None, max_rate=None, burst=1, pool_size=10,
+                 max_retries=MAX_RETRIES, headers=None, timeout=30):
+        self.rate_args = {"rate": rate, "min_rate": min_rate, "max_rate": max_rate, "burst": burst}
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.rates = {}
+        self.rates_lock = threading.Lock()
+        self.metrics = Metrics()
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        self.set_pool_size(pool_size)
+
+    def set_pool_size(self, pool_size):
+        """
+        Keep-alive connections kept per host; at least the number of threads sharing the
+        client, or urllib3 discards the extra connections and every request pays a new
+        handshake. Connections already open are dropped.
+        """
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def share_rate(self, share):
+        """
+        Scales the starting rate and its bounds to `share` of the configured budget, for a
+        process sharing its hosts with others (pipeline.py runs several DAO crawls per host).
+        Hosts already contacted keep their rate.
+        """
+        for key in ("rate", "min_rate", "max_rate"):
+            if self.rate_args[key] is not None:
+                self.rate_args[key] *= share
+
+    def rate_for(self, url):
+        host = urlparse(url).netloc
+        with self.rates_lock:
+            if host not in self.rates:
+                self.rates[host] = AdaptiveRate(**self.rate_args)
+            return self.rates[host]
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        rate = self.rate_for(url)
+        endpoint = endpoint_name(method, url, kwargs.get("json"))
+
+        for attempt in range(self.max_retries + 1):
+            delay = rate.reserve()
+            if delay > 0:
+                time.sleep(delay)
+            last_attempt = attempt == self.max_retries
+            start = time.perf_counter()
+            try:
+                resp = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.metrics.record(endpoint, latency=time.perf_counter() - start, retried=attempt > 0, error=True)
+                if last_attempt:
+                    raise
+                time.sleep(retry_delay(attempt))
+                continue
+
+            self.metrics.record(endpoint, resp.status_code, time.perf_counter() - start, retried=attempt > 0)
+            # streamed bodies (attachments) are not read here; count what the server announced
+            size = resp.headers.get("Content-Length", 0) if kwargs.get("stream") else len(resp.content)
+            self.metrics.add_bytes(endpoint, int(size))
+            if resp.status_code not in RETRY_STATUSES or last_attempt:
+                if resp.status_code not in RETRY_STATUSES:
+                    rate.on_success()
+                return resp
+
+            retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            if resp.status_code in THROTTLE_STATUSES:
+                rate.on_throttle(pause=retry_after or 0.0)
+            resp.close()
+            time.sleep(retry_delay(attempt, retry_after))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.session.close()
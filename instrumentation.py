@@ -0,0 +1,282 @@
+# instrumentation.py
+"""
+Run instrumentation shared by the crawlers, the joiner and the scorecards:
+counters, latency histograms and spans, written as a JSON run report at the end
+of a run and, with --otel, exported to OpenTelemetry as well.
+
+    from instrumentation import TELEMETRY
+
+    with TELEMETRY.span("category", category_id=cat_id):    # timed, nestable
+        ...
+        TELEMETRY.count("discourse.posts", len(posts))
+        TELEMETRY.observe("http.latency", seconds, endpoint=name)
+
+Metrics are keyed by name plus labels; keep label values low-cardinality
+(endpoints, categories, statuses; never post or vote ids). Recording is
+in-memory and thread-safe, so it belongs in hot loops where print() does not.
+
+Scripts call start() after parsing their arguments and finish() at the end:
+
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.start("discourse_crawl", args)
+    ...
+    instrumentation.finish(args)    # data/run_reports/<dao>/discourse_crawl.json
+
+The report has the run's wall and CPU time, peak RSS, every counter (with its
+per-second rate over the run), histogram percentiles and span timings by path
+("crawl > category").
+"""
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPORTS_DIR = Path(__file__).resolve().parent / "data" / "run_reports"
+# latency histogram bucket upper bounds, seconds
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf")]
+
+current_span = contextvars.ContextVar("current_span", default=())
+
+def label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q-quantile (capped at the observed max).
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "min": round(self.min, 6) if self.count else None,
+            "max": round(self.max, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": round(self.quantile(0.5), 6),
+            "p95": round(self.quantile(0.95), 6),
+            "p99": round(self.quantile(0.99), 6),
+            "buckets": {("+Inf" if b == float("inf") else str(b)): c for b, c in zip(self.buckets, self.counts) if c},
+        }
+
+class OpenTelemetryExporter:
+    """
+    Mirrors counters, histograms and spans to the OpenTelemetry SDK. Exports over
+    OTLP/gRPC (OTEL_EXPORTER_OTLP_ENDPOINT, default localhost:4317) when the
+    exporter package is installed, else to the console.
+    """
+    def __init__(self, service_name, dao=None):
+        from opentelemetry import metrics, trace
+        from opentelemetry.sdk.metrics import MeterProvider
+        from opentelemetry.sdk.metrics.export import ConsoleMetricExporter, PeriodicExportingMetricReader
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        try:
+            from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+            metric_exporter, span_exporter = OTLPMetricExporter(), OTLPSpanExporter()
+        except ImportError:
+            print("⚠️ opentelemetry-exporter-otlp is not installed, exporting telemetry to the console", file=sys.stderr)
+            metric_exporter, span_exporter = ConsoleMetricExporter(), ConsoleSpanExporter()
+
+        resource = Resource.create({"service.name": service_name, **({"dao": dao} if dao else {})})
+        self.meter_provider = MeterProvider(resource=resource,
+                                            metric_readers=[PeriodicExportingMetricReader(metric_exporter)])
+        self.tracer_provider = TracerProvider(resource=resource)
+        self.tracer_provider.add_span_processor(BatchSpanProcessor(span_exporter))
+        metrics.set_meter_provider(self.meter_provider)
+        trace.set_tracer_provider(self.tracer_provider)
+        self.meter = self.meter_provider.get_meter("dao-pipeline")
+        self.tracer = self.tracer_provider.get_tracer("dao-pipeline")
+        self.instruments = {}
+        self.lock = threading.Lock()
+
+    def instrument(self, kind, name):
+        with self.lock:
+            if (kind, name) not in self.instruments:
+                create = self.meter.create_counter if kind == "counter" else self.meter.create_histogram
+                self.instruments[kind, name] = create(name, unit="" if kind == "counter" else "s")
+            return self.instruments[kind, name]
+
+    def count(self, name, value, labels):
+        self.instrument("counter", name).add(value, labels)
+
+    def observe(self, name, value, labels):
+        self.instrument("histogram", name).record(value, labels)
+
+    def span(self, name, labels):
+        return self.tracer.start_as_current_span(name, attributes=labels)
+
+    def shutdown(self):
+        self.tracer_provider.shutdown()
+        self.meter_provider.shutdown()
+
+class Telemetry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, name=None, dao=None):
+        with self.lock:
+            self.name = name
+            self.dao = dao
+            self.started_at = datetime.now(timezone.utc)
+            self.start_time = time.perf_counter()
+            self.start_cpu = time.process_time()
+            self.counters = {}
+            self.histograms = {}
+            self.spans = {}
+            self.otel = None
+
+    def count(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        if self.otel is not None:
+            self.otel.count(name, value, labels)
+
+    def observe(self, name, seconds, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+        if self.otel is not None:
+            self.otel.observe(name, seconds, labels)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """
+        Times the block under `name` (nested inside the enclosing span, also across
+        asyncio tasks started within it).
+        """
+        path = current_span.get() + (name,)
+        token = current_span.set(path)
+        otel_span = self.otel.span(name, labels) if self.otel is not None else None
+        start = time.perf_counter()
+        try:
+            if otel_span is None:
+                yield
+            else:
+                with otel_span:
+                    yield
+        finally:
+            seconds = time.perf_counter() - start
+            current_span.reset(token)
+            key = (" > ".join(path), label_key(labels))
+            with self.lock:
+                stats = self.spans.setdefault(key, {"count": 0, "total": 0.0, "max": 0.0})
+                stats["count"] += 1
+                stats["total"] += seconds
+                stats["max"] = max(stats["max"], seconds)
+
+    def counter(self, name, **labels):
+        with self.lock:
+            return self.counters.get((name, label_key(labels)), 0)
+
+    def report(self):
+        wall = time.perf_counter() - self.start_time
+        with self.lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value,
+                         "per_second": round(value / wall, 3) if wall else None}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = [{"name": name, "labels": dict(labels), **histogram.to_dict()}
+                          for (name, labels), histogram in sorted(self.histograms.items())]
+            spans = [{"path": path, "labels": dict(labels), "count": s["count"],
+                      "total_seconds": round(s["total"], 6), "max_seconds": round(s["max"], 6)}
+                     for (path, labels), s in sorted(self.spans.items())]
+        return {
+            "run": {
+                "name": self.name,
+                "dao": self.dao,
+                "argv": sys.argv,
+                "started_at": self.started_at.isoformat(),
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+                "wall_seconds": round(wall, 3),
+                "cpu_seconds": round(time.process_time() - self.start_cpu, 3),
+                **peak_memory(),
+            },
+            "counters": counters,
+            "histograms": histograms,
+            "spans": spans,
+        }
+
+    def write_report(self, path=None):
+        if not path:
+            path = (REPORTS_DIR / self.dao if self.dao else REPORTS_DIR) / f"{self.name or 'run'}.json"
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+def peak_memory():
+    """
+    High-water RSS of this process and of its finished children (process pools), in MB.
+    """
+    try:
+        import resource
+    except ImportError:  # Windows
+        return {"max_rss_mb": None, "children_max_rss_mb": None}
+    unit = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KB elsewhere
+    to_mb = lambda usage: round(usage.ru_maxrss * unit / 2 ** 20, 1)
+    return {"max_rss_mb": to_mb(resource.getrusage(resource.RUSAGE_SELF)),
+            "children_max_rss_mb": to_mb(resource.getrusage(resource.RUSAGE_CHILDREN))}
+
+TELEMETRY = Telemetry()
+
+def add_arguments(parser):
+    group = parser.add_argument_group("instrumentation")
+    group.add_argument("--report", type=Path, default=None,
+                       help=f"where to write the JSON run report (default {REPORTS_DIR}/<dao>/<stage>.json)")
+    group.add_argument("--otel", action="store_true",
+                       help="also export metrics and spans to OpenTelemetry (OTLP endpoint from OTEL_EXPORTER_OTLP_ENDPOINT)")
+
+def start(name, args=None):
+    dao = getattr(args, "dao", None)
+    TELEMETRY.reset(name, dao)
+    if getattr(args, "otel", False):
+        TELEMETRY.otel = OpenTelemetryExporter(service_name=name, dao=dao)
+
+def finish(args=None):
+    path = TELEMETRY.write_report(getattr(args, "report", None))
+    if TELEMETRY.otel is not None:
+        TELEMETRY.otel.shutdown()
+    print(f"📊 Run report: {path}")
+    return path
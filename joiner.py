@@ -1,16 +1,45 @@
-import json
+import argparse
+import time
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from collections import defaultdict, Counter
-
-def load_jsonl(path):
-    with open(path, "r", encoding="utf-8") as f:
-        return [json.loads(line) for line in f]
-
-def save_jsonl(path, items):
-    with open(path, "w", encoding="utf-8") as f:
-        for item in items:
-            f.write(json.dumps(item) + "\n")
+from collections import defaultdict
+
+import daos
+import instrumentation
+from instrumentation import TELEMETRY
+from records import iter_jsonl, load_jsonl, save_jsonl
+from vote_tally import VOTE_COLUMNS, tally_votes
+
+SNAPSHOT_DATA_DIR = Path("crawler_snapshot/data")
+DISCOURSE_DATA_DIR = Path("crawler_dao/data")
+DATA_DIR = Path("./data")
+
+# the DAO's forum, its partitions of the crawlers' data and its output, set by use_dao()
+FORUM_URL = None
+PROPOSALS_PATH = None
+VOTES_PATH = None
+DISCOURSE_PATH = None
+# --format parquet: datasets written by the crawlers with --format parquet
+VOTES_PARQUET_PATH = None
+POSTS_PARQUET_PATH = None
+DB_PATH = None  # --format sqlite
+LINKED_PATH = None
+
+# the only post fields the join reads
+POST_COLUMNS = ["created_at", "username", "topic_id", "topic_slug", "post_number"]
+
+def use_dao(name):
+    global FORUM_URL, PROPOSALS_PATH, VOTES_PATH, DISCOURSE_PATH, LINKED_PATH
+    global VOTES_PARQUET_PATH, POSTS_PARQUET_PATH, DB_PATH
+    FORUM_URL = daos.get_dao(name)["forum"]
+    PROPOSALS_PATH = SNAPSHOT_DATA_DIR / name / "proposals.jsonl"
+    VOTES_PATH = SNAPSHOT_DATA_DIR / name / "votes.jsonl"
+    VOTES_PARQUET_PATH = SNAPSHOT_DATA_DIR / name / "votes.parquet"
+    DISCOURSE_PATH = DISCOURSE_DATA_DIR / name / "discourse_corpus.jsonl"
+    POSTS_PARQUET_PATH = DISCOURSE_DATA_DIR / name / "raw_discourse_posts.parquet"
+    DB_PATH = daos.db_path(name)
+    LINKED_PATH = daos.partition(DATA_DIR, name) / "linked_proposals.jsonl"
 
 def parse_iso(dt_str):
     return datetime.fromisoformat(dt_str.replace("Z", "+00:00"))
@@ -21,76 +50,82 @@ def index_votes_by_proposal(votes):
         by_pid[v["proposal_id"]].append(v)
     return by_pid
 
+class PostTimeIndex:
+    """
+    Discourse posts sorted by created_at, parsed once; `between` finds a time window
+    with two binary searches instead of scanning every post.
+    """
+    def __init__(self, posts):
+        dated = sorted(
+            (parse_iso(post["created_at"]), i)
+            for i, post in enumerate(posts)
+            if "created_at" in post
+        )
+        self.posts = posts
+        self.times = [t for t, _ in dated]
+        self.order = [i for _, i in dated]
+
+    def between(self, min_time, max_time):
+        """
+        Posts with min_time <= created_at <= max_time, in their original order.
+        """
+        lo = bisect_left(self.times, min_time)
+        hi = bisect_right(self.times, max_time)
+        return [self.posts[i] for i in sorted(self.order[lo:hi])]
+
 def format_utc(ts):
     if ts is None:
         return None
     return datetime.utcfromtimestamp(ts).replace(tzinfo=timezone.utc).isoformat()
 
-def link_discourse_and_votes(proposals, discourse_posts, votes_by_pid, day_window=3):
-    linked = []
+def votes_reference(fmt, proposal_id):
+    """
+    Where the votes of `proposal_id` live in the joiner's input, for compact records.
+    """
+    if fmt == "parquet":
+        return {"format": "parquet", "path": f"{VOTES_PARQUET_PATH}/proposal_id={proposal_id}"}
+    if fmt == "sqlite":
+        return {"format": "sqlite", "path": str(DB_PATH), "table": "votes", "proposal_id": proposal_id}
+    return {"format": "jsonl", "path": str(VOTES_PATH), "proposal_id": proposal_id}
+
+def link_discourse_and_votes(proposals, discourse_posts, votes_by_pid, day_window=3, forum_url=None):
+    return list(iter_linked_proposals(proposals, discourse_posts, votes_by_pid, day_window, forum_url=forum_url))
+
+def iter_linked_proposals(proposals, discourse_posts, votes_by_pid, day_window=3, compact_fmt=None, forum_url=None):
+    """
+    Yields the joined record of each proposal, so callers can write them as they go.
+    `discourse_posts` may be a list of posts or anything with PostTimeIndex.between
+    (a prebuilt index, or sql_store.PostWindowQuery); `votes_by_pid` needs only .get.
+    discourse_url links into the forum at `forum_url` (None without one).
+
+    With compact_fmt (the format the votes were read from), records carry
+    "vote_aggregates" and a "votes_ref" to the vote partition instead of the raw votes.
+    """
+    post_index = discourse_posts if hasattr(discourse_posts, "between") else PostTimeIndex(discourse_posts)
 
     for proposal in proposals:
+        start = time.perf_counter()
         prop_time = datetime.utcfromtimestamp(proposal["created"]).replace(tzinfo=timezone.utc)
         min_time = prop_time - timedelta(days=day_window)
         max_time = prop_time + timedelta(days=day_window)
 
         # Match Discourse posts
-        matching_posts = [
-            post for post in discourse_posts
-            if "created_at" in post and min_time <= parse_iso(post["created_at"]) <= max_time
-        ]
+        matching_posts = post_index.between(min_time, max_time)
 
         votes = votes_by_pid.get(proposal["id"], [])
-        vote_dist = defaultdict(float)
-        voter_counter = Counter()
-        very_low_vp_threshold = 0.01
-
-        for vote in votes:
-            voter_counter[vote["voter"]] += 1
-            raw_choice = vote.get("choice")
-
-            if isinstance(raw_choice, int):
-                idx = raw_choice - 1
-                choices = proposal.get("choices", [])
-                label = choices[idx] if 0 <= idx < len(choices) else "Unknown"
-                vote_dist[label] += vote.get("vp", 0)
-
-            elif isinstance(raw_choice, list):
-                flat_choices = []
-                for c in raw_choice:
-                    flat_choices.extend(c if isinstance(c, list) else [c])
-                choices = proposal.get("choices", [])
-
-                for idx in flat_choices:
-                    try:
-                        i = int(idx) - 1
-                        label = choices[i] if 0 <= i < len(choices) else "Unknown"
-                        vote_dist[label] += vote.get("vp", 0)
-                    except (ValueError, TypeError):
-                        continue  # skip malformed choice
-
-            elif isinstance(raw_choice, dict):
-                choices = proposal.get("choices", [])
-                for idx_str, weight in raw_choice.items():
-                    i = int(idx_str) - 1
-                    label = choices[i] if 0 <= i < len(choices) else "Unknown"
-                    vote_dist[label] += weight * vote.get("vp", 0)
-
-        total_voters = len(votes)
-        total_vp = sum(v.get("vp", 0) for v in votes)
+        tally = tally_votes(votes, proposal.get("choices", []), aggregates=compact_fmt is not None)
+        vote_dist = tally["vote_distribution"]
+
+        total_voters = tally["total_voters"]
+        total_vp = tally["total_vp"]
         winning_choice = max(vote_dist.items(), key=lambda x: x[1])[0] if vote_dist else None
         turnout_percent = round((total_vp / 10_000_000) * 100, 2) if total_vp else 0.0
 
-        # Stats
-        unique_voters = len(voter_counter)
-        voters_with_multiple_votes = [v for v, c in voter_counter.items() if c > 1]
-        voters_with_very_low_vp = [v for v in votes if v.get("vp", 0) < very_low_vp_threshold]
-
         # Determine Discourse URL from any matching post with topic_id and topic_slug
         discourse_url = None
         for post in matching_posts:
-            if "topic_id" in post and "topic_slug" in post and "post_number" in post:
-                discourse_url = f"https://gov.optimism.io/t/{post['topic_slug']}/{post['topic_id']}/{post['post_number']}"
+            if forum_url and "topic_id" in post and "topic_slug" in post and "post_number" in post:
+                discourse_url = f"{forum_url.rstrip('/')}/t/{post['topic_slug']}/{post['topic_id']}/{post['post_number']}"
                 break
 
         joined = {
@@ -115,9 +150,9 @@ def link_discourse_and_votes(proposals, discourse_posts, votes_by_pid, day_windo
                     "vote_distribution": {k: round(v, 2) for k, v in vote_dist.items()},
                 },
                 "voter_stats": {
-                    "unique_voters": unique_voters,
-                    "voters_with_multiple_votes": len(voters_with_multiple_votes),
-                    "low_vp_votes": len(voters_with_very_low_vp),
+                    "unique_voters": tally["unique_voters"],
+                    "voters_with_multiple_votes": tally["repeat_voters"],
+                    "low_vp_votes": tally["low_vp_votes"],
                 },
             },
             "engagement": {
@@ -126,20 +161,55 @@ def link_discourse_and_votes(proposals, discourse_posts, votes_by_pid, day_windo
                 "discussion_start": min((p["created_at"] for p in matching_posts), default=None),
                 "discussion_end": max((p["created_at"] for p in matching_posts), default=None),
             },
-            "votes": votes,
         }
-
-        linked.append(joined)
-
-    return linked
+        if compact_fmt is None:
+            joined["votes"] = votes if isinstance(votes, list) else list(votes)
+        else:
+            joined["vote_aggregates"] = tally["aggregates"]
+            joined["votes_ref"] = votes_reference(compact_fmt, proposal["id"])
+
+        TELEMETRY.observe("join.proposal_seconds", time.perf_counter() - start)
+        TELEMETRY.count("join.votes", len(votes))
+        TELEMETRY.count("join.posts_matched", len(matching_posts))
+        yield joined
+
+def load_inputs(fmt="jsonl", compact=False):
+    """
+    Returns (proposals, discourse posts, votes by proposal id) from JSONL, Parquet or SQLite.
+    With SQLite, posts and votes stay in the database and are fetched per proposal
+    through its created_ts and proposal_id indexes; with Parquet, each proposal's
+    votes are columnar.VoteColumns, of only the tallied fields when `compact`.
+    """
+    if fmt == "sqlite":
+        from sql_store import PostWindowQuery, VoteLookup, load_proposals, open_engine
+        engine = open_engine(DB_PATH)
+        return load_proposals(engine), PostWindowQuery(engine, POST_COLUMNS), VoteLookup(engine)
+    proposals = load_jsonl(PROPOSALS_PATH)
+    if fmt == "parquet":
+        from columnar import iter_posts, read_vote_columns
+        discourse = list(iter_posts(POSTS_PARQUET_PATH, columns=POST_COLUMNS, drop_nulls=True))
+        return proposals, discourse, read_vote_columns(VOTES_PARQUET_PATH, columns=VOTE_COLUMNS if compact else None)
+    discourse = load_jsonl(DISCOURSE_PATH)
+    return proposals, discourse, index_votes_by_proposal(iter_jsonl(VOTES_PATH))
 
 if __name__ == "__main__":
-    proposals = load_jsonl("crawler_snapshot/data/proposals.jsonl")
-    discourse = load_jsonl("crawler_dao/data/optimism_discourse_corpus.jsonl")
-    votes = load_jsonl("crawler_snapshot/data/votes.jsonl")
-
-    votes_by_pid = index_votes_by_proposal(votes)
-    linked_data = link_discourse_and_votes(proposals, discourse, votes_by_pid)
-
-    save_jsonl("./data/linked_proposals.jsonl", linked_data)
-    print(f"✅ Linked {len(linked_data)} proposals and saved to linked_proposals.jsonl")
+    parser = argparse.ArgumentParser(description="Join Snapshot proposals, votes and Discourse posts")
+    parser.add_argument("--format", dest="fmt", choices=["jsonl", "parquet", "sqlite"], default="jsonl",
+                        help="read votes and posts from JSONL, the crawlers' Parquet datasets, or the SQLite store")
+    parser.add_argument("--compact", action="store_true",
+                        help="store per-proposal vote aggregates and a reference to the votes instead of the raw vote list")
+    daos.add_argument(parser)
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    use_dao(args.dao)
+    instrumentation.start("join", args)
+
+    with TELEMETRY.span("load_inputs", format=args.fmt):
+        proposals, discourse, votes_by_pid = load_inputs(args.fmt, compact=args.compact)
+    linked = iter_linked_proposals(proposals, discourse, votes_by_pid,
+                                   compact_fmt=args.fmt if args.compact else None, forum_url=FORUM_URL)
+    with TELEMETRY.span("link_and_write"):
+        count = save_jsonl(LINKED_PATH, linked)
+    TELEMETRY.count("join.proposals", count)
+    print(f"✅ Linked {count} proposals and saved to {LINKED_PATH}")
+    instrumentation.finish(args)
@@ -0,0 +1,356 @@
+# pipeline.py
+"""
+Runs the crawl -> corpus -> join -> scorecards pipeline (plus the voter index,
+built from the Snapshot crawl) as a DAG of stages.
+
+Each stage declares its code files, input files and output files. Before a stage
+runs, its fingerprint (SHA-256 over its command, the content of its code and of
+its inputs) is compared with the one stored after its last successful run in
+data/pipeline_state.json; if they match and every output exists, the stage is
+skipped. Stages start as soon as the stages producing their inputs are done, so
+the Discourse and Snapshot branches run concurrently.
+
+Every DAO of the registry (daos.py) gets its own copy of the stages, reading and
+writing its own data partitions, so the DAOs are processed concurrently too.
+Crawls are additionally limited per host: at most MAX_CRAWLS_PER_HOST run against
+one host at a time (the Snapshot hub serves every DAO), each with that share of
+the host's request budget (--rate-share), so adding DAOs never raises the request
+rate a host sees.
+
+Crawl stages read from the network, which cannot be fingerprinted: they run
+unless --skip-crawl is given, and then downstream stages rerun only if the
+crawlers actually changed their outputs.
+
+    python pipeline.py                  # full run
+    python pipeline.py --incremental    # crawlers only fetch what changed
+    python pipeline.py --skip-crawl     # rebuild from the data on disk (e.g. after editing the scorecards)
+    python pipeline.py --dao optimism arbitrum --workers 8
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import daos
+
+ROOT = Path(__file__).resolve().parent
+STATE_PATH = ROOT / "data" / "pipeline_state.json"
+OUTPUTS_DIR = ROOT / "data"
+# caches and rebuildable stores left out of --backup
+BACKUP_EXCLUDE = ["backup_*", "http_cache", "downloads", "parsed_posts_cache.jsonl", "voter_index"]
+HASH_CHUNK_SIZE = 1 << 20
+MAX_CRAWLS_PER_HOST = 2
+
+class Stage:
+    def __init__(self, name, script, cwd=ROOT, code=(), inputs=(), outputs=(), args=(), source=False,
+                 dao=None, hosts=(), params=None):
+        self.kind = name
+        self.name = f"{dao}/{name}" if dao else name
+        self.script = script
+        self.cwd = cwd
+        self.code = [ROOT / path for path in (script, *code)]
+        self.inputs = [ROOT / path for path in inputs]
+        self.outputs = [ROOT / path for path in outputs]
+        self.args = list(args)
+        self.source = source  # reads from the network
+        self.hosts = list(hosts)  # hosts it crawls, see host_slots
+        self.params = params  # fingerprinted with the args (the DAO's registry entry)
+
+    @property
+    def command(self):
+        return [sys.executable, str(ROOT / self.script), *self.args]
+
+def dao_stages(name, incremental=False, compact=False):
+    dao = daos.get_dao(name)
+    dao_args = ["--dao", name]
+    crawl_args = [*dao_args, "--incremental"] if incremental else dao_args
+    shared = ["records.py", "columnar.py", "sql_store.py", "http_cache.py", "http_client.py", "instrumentation.py"]
+    discourse_dir, snapshot_dir, out_dir = f"crawler_dao/data/{name}", f"crawler_snapshot/data/{name}", f"data/{name}"
+    return [
+        Stage("discourse_crawl", "crawler_dao/downloader_dao.py", cwd=ROOT / "crawler_dao",
+              code=["crawler_dao/fetch.py", "crawler_dao/config.py", *shared],
+              outputs=[f"{discourse_dir}/raw_discourse_posts.jsonl"],
+              args=crawl_args, source=True, dao=name, hosts=[daos.host(dao["forum"])], params=dao),
+        Stage("discourse_corpus", "crawler_dao/main.py", cwd=ROOT / "crawler_dao",
+              code=["crawler_dao/process.py", "crawler_dao/utils.py", "crawler_dao/attachments.py",
+                    "crawler_dao/blob_store.py", "crawler_dao/config.py", "records.py",
+                    "http_cache.py", "http_client.py", "instrumentation.py"],
+              inputs=[f"{discourse_dir}/raw_discourse_posts.jsonl"],
+              outputs=[f"{discourse_dir}/discourse_corpus.jsonl"],
+              args=dao_args, dao=name, params=dao),
+        Stage("snapshot_crawl", "crawler_snapshot/downloader_snapshot.py", cwd=ROOT / "crawler_snapshot",
+              code=shared,
+              outputs=[f"{snapshot_dir}/proposals.jsonl", f"{snapshot_dir}/votes.jsonl"],
+              args=crawl_args, source=True, dao=name, hosts=[daos.host(daos.SNAPSHOT_API)], params=dao),
+        Stage("join", "joiner.py",
+              code=["vote_tally.py", "daos.py", *shared],
+              inputs=[f"{snapshot_dir}/proposals.jsonl", f"{snapshot_dir}/votes.jsonl",
+                      f"{discourse_dir}/discourse_corpus.jsonl"],
+              outputs=[f"{out_dir}/linked_proposals.jsonl"],
+              args=[*dao_args, "--compact"] if compact else dao_args, dao=name, params=dao),
+        Stage("scorecards", "proposal_scorecards.py",
+              code=["scorecard_metrics.py", "vote_tally.py", "daos.py", *shared],
+              inputs=[f"{out_dir}/linked_proposals.jsonl"],
+              outputs=[f"{out_dir}/scorecards.jsonl"],
+              args=dao_args, dao=name, params=dao),
+        Stage("voter_index", "voter_index.py",
+              code=["daos.py", *shared],
+              inputs=[f"{snapshot_dir}/proposals.jsonl", f"{snapshot_dir}/votes.jsonl"],
+              outputs=[f"{out_dir}/voter_index/{file}"
+                       for file in ("voters.npy", "offsets.npy", "votes.npy", "proposals.json", "meta.json")],
+              args=dao_args, dao=name, params=dao),
+    ]
+
+def host_slots(stages):
+    """
+    {host: crawl stages allowed to run against it at once}
+    """
+    crawls = Counter(host for stage in stages for host in stage.hosts)
+    return {host: min(count, MAX_CRAWLS_PER_HOST) for host, count in crawls.items()}
+
+def build_stages(dao_names=(daos.DEFAULT_DAO,), incremental=False, compact=False):
+    stages = [stage for name in dao_names for stage in dao_stages(name, incremental, compact)]
+    # a crawl sharing a host with others gets an equal share of its request budget
+    slots = host_slots(stages)
+    for stage in stages:
+        share = 1 / max((slots[host] for host in stage.hosts), default=1)
+        if share < 1:
+            stage.args += ["--rate-share", f"{share:.3g}"]
+    return stages
+
+# --- fingerprints -----------------------------------------------------------
+
+class FileHasher:
+    """
+    SHA-256 of file contents, remembered by (path, size, mtime) across runs so
+    unchanged multi-GB inputs are not re-read every time.
+    """
+    def __init__(self, cache, lock):
+        self.cache = cache
+        self.lock = lock  # shared with whoever serializes the cache
+
+    def digest(self, path):
+        if not path.exists():
+            return "missing"
+        stat = path.stat()
+        key = str(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        with self.lock:
+            cached = self.cache.get(key)
+        if cached and cached[0] == signature:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        with self.lock:
+            self.cache[key] = [signature, digest.hexdigest()]
+        return digest.hexdigest()
+
+def fingerprint(stage, hasher):
+    digest = hashlib.sha256(json.dumps([stage.args, stage.params]).encode())
+    for path in stage.code + stage.inputs:
+        digest.update(f"{path.relative_to(ROOT)}:{hasher.digest(path)}\n".encode())
+    return digest.hexdigest()
+
+def load_state(path=STATE_PATH):
+    if not path.exists():
+        return {"stages": {}, "file_hashes": {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_state(state, path=STATE_PATH):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+# --- scheduling ---------------------------------------------------------------
+
+def dependencies(stages):
+    """
+    {stage name: names of the stages producing its inputs}
+    """
+    producers = {path: stage.name for stage in stages for path in stage.outputs}
+    return {stage.name: {producers[path] for path in stage.inputs if path in producers} for stage in stages}
+
+def run_command(stage):
+    """
+    Runs the stage's script, prefixing its output lines with the stage name.
+    """
+    process = subprocess.Popen(stage.command, cwd=stage.cwd, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True, bufsize=1)
+    for line in process.stdout:
+        print(f"[{stage.name}] {line}", end="", flush=True)
+    return process.wait()
+
+class Pipeline:
+    def __init__(self, stages, state, force=(), skip_crawl=False):
+        self.stages = {stage.name: stage for stage in stages}
+        self.deps = dependencies(stages)
+        self.state = state
+        self.lock = threading.Lock()
+        self.hasher = FileHasher(state.setdefault("file_hashes", {}), self.lock)
+        self.force = set(force)
+        self.skip_crawl = skip_crawl
+        self.results = {}  # name -> (status, seconds)
+        self.slots = host_slots(stages)
+        self.crawling = Counter()  # host -> running stages crawling it
+
+    def has_host_slot(self, stage):
+        return all(self.crawling[host] < self.slots[host] for host in stage.hosts)
+
+    def is_up_to_date(self, stage, stage_fingerprint):
+        if stage.kind in self.force or stage.name in self.force:
+            return False
+        if not all(path.exists() for path in stage.outputs):
+            return False
+        if stage.source:
+            return self.skip_crawl
+        return self.state["stages"].get(stage.name, {}).get("fingerprint") == stage_fingerprint
+
+    def run_stage(self, stage):
+        start = time.perf_counter()
+        stage_fingerprint = fingerprint(stage, self.hasher)
+        if self.is_up_to_date(stage, stage_fingerprint):
+            return "skipped", time.perf_counter() - start
+
+        print(f"▶️ {stage.name}: {' '.join(stage.command[1:])}")
+        if run_command(stage) != 0:
+            return "failed", time.perf_counter() - start
+
+        seconds = time.perf_counter() - start
+        with self.lock:
+            self.state["stages"][stage.name] = {
+                "fingerprint": stage_fingerprint,
+                "seconds": round(seconds, 2),
+                "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            }
+            save_state(self.state)
+        return "ran", seconds
+
+    def run(self, workers):
+        pending = dict(self.deps)
+        futures = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while pending or futures:
+                changed = True
+                while changed:  # until no stage is newly blocked or started
+                    changed = False
+                    for name, deps in list(pending.items()):
+                        if any(self.results.get(dep, ("",))[0] in ("failed", "blocked") for dep in deps):
+                            self.results[name] = ("blocked", 0.0)
+                        elif (all(dep in self.results for dep in deps) and len(futures) < workers
+                              and self.has_host_slot(self.stages[name])):
+                            self.crawling.update(self.stages[name].hosts)
+                            futures[pool.submit(self.run_stage, self.stages[name])] = name
+                        else:
+                            continue
+                        del pending[name]
+                        changed = True
+                if not futures:
+                    if pending:
+                        raise ValueError(f"stages with unresolvable dependencies: {sorted(pending)}")
+                    break
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = futures.pop(future)
+                    self.crawling.subtract(self.stages[name].hosts)
+                    try:
+                        self.results[name] = future.result()
+                    except Exception as e:
+                        print(f"❌ {name}: {e}")
+                        self.results[name] = ("failed", 0.0)
+        return all(status in ("ran", "skipped") for status, _ in self.results.values())
+
+    def report(self, wall_seconds):
+        width = max(18, *map(len, self.stages))
+        print(f"\n📊 {'stage':<{width}} {'status':<9} {'wall time':>9}")
+        for name in self.stages:
+            status, seconds = self.results.get(name, ("not run", 0.0))
+            print(f"   {name:<{width}} {status:<9} {seconds:8.1f}s")
+        print(f"   {'total':<{width}} {'':<9} {wall_seconds:8.1f}s")
+
+# --- entry point --------------------------------------------------------------
+
+def backup_outputs(data_dir=OUTPUTS_DIR):
+    """
+    Copies the root data directory (linked proposals, scorecards, SQLite stores, run
+    reports) to data/backup_NNN, leaving out BACKUP_EXCLUDE. The crawlers' raw data
+    directories are not copied.
+    """
+    if not data_dir.exists():
+        return None
+    i = 1
+    while (data_dir / f"backup_{i:03d}").exists():
+        i += 1
+    backup_dir = data_dir / f"backup_{i:03d}"
+    ignore = shutil.ignore_patterns(*BACKUP_EXCLUDE)
+    items = list(data_dir.iterdir())
+    ignored = ignore(str(data_dir), [item.name for item in items])
+    backup_dir.mkdir()
+    for item in items:
+        if item.name in ignored:
+            continue
+        if item.is_dir():
+            shutil.copytree(item, backup_dir / item.name, ignore=ignore)
+        else:
+            shutil.copy2(item, backup_dir / item.name)
+    print(f"✅ Copied {data_dir} to {backup_dir}")
+    return backup_dir
+
+def keep_awake():
+    """
+    On macOS, keeps the machine awake until this process exits (what run_pipeline.sh
+    used caffeinate for); elsewhere a no-op.
+    """
+    caffeinate = shutil.which("caffeinate")
+    if caffeinate:
+        subprocess.Popen([caffeinate, "-dimsu", "-w", str(os.getpid())])
+
+def main(dao_names=(daos.DEFAULT_DAO,), incremental=False, compact=False, skip_crawl=False, force=(), backup=False,
+         workers=4):
+    start = time.perf_counter()
+    if backup:
+        backup_outputs()
+    keep_awake()
+
+    state = load_state()
+    stages = build_stages(dao_names, incremental=incremental, compact=compact)
+    pipeline = Pipeline(stages, state, force=force, skip_crawl=skip_crawl)
+    ok = pipeline.run(workers)
+    save_state(state)
+    pipeline.report(time.perf_counter() - start)
+    print("✅ pipeline executed" if ok else "❌ pipeline failed")
+    return ok
+
+if __name__ == "__main__":
+    stage_names = [stage.kind for stage in dao_stages(daos.DEFAULT_DAO)]
+    parser = argparse.ArgumentParser(description="Run the data pipeline, skipping stages whose inputs and code are unchanged")
+    parser.add_argument("--dao", nargs="+", dest="dao_names", choices=list(daos.DAOS), default=list(daos.DAOS),
+                        metavar="DAO", help=f"DAOs to process (default: all of daos.py: {', '.join(daos.DAOS)})")
+    parser.add_argument("--incremental", action="store_true",
+                        help="pass --incremental to both crawlers")
+    parser.add_argument("--compact", action="store_true",
+                        help="join with vote aggregates instead of raw votes (joiner.py --compact)")
+    parser.add_argument("--skip-crawl", action="store_true",
+                        help="treat the crawl stages as up to date when their outputs exist")
+    parser.add_argument("--force", nargs="+", default=[], choices=stage_names, metavar="STAGE",
+                        help=f"rerun these stages of every DAO even if unchanged ({', '.join(stage_names)})")
+    parser.add_argument("--backup", action="store_true",
+                        help="copy ./data (the pipeline's outputs, without caches) to data/backup_NNN first")
+    parser.add_argument("--workers", type=int, default=4, help="stages run at the same time")
+    args = parser.parse_args()
+    ok = main(dao_names=args.dao_names, incremental=args.incremental, compact=args.compact, skip_crawl=args.skip_crawl,
+              force=args.force, backup=args.backup, workers=args.workers)
+    sys.exit(0 if ok else 1)
@@ -1,15 +1,36 @@
-import json
+import argparse
+import os
+import time
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
 from pathlib import Path
 from datetime import datetime, timezone
 
-def load_jsonl(path):
-    with open(path, "r", encoding="utf-8") as f:
-        return [json.loads(line) for line in f]
+import daos
+import instrumentation
+from instrumentation import TELEMETRY
+from records import iter_jsonl_lines, loads, save_jsonl
+from scorecard_metrics import METRICS, voter_power
+from vote_tally import WHALE_THRESHOLD
 
-def save_jsonl(path, items):
-    with open(path, "w", encoding="utf-8") as f:
-        for item in items:
-            f.write(json.dumps(item) + "\n")
+DATA_DIR = Path("./data")
+SNAPSHOT_DATA_DIR = Path("crawler_snapshot/data")
+SCORECARD_CHUNK_SIZE = 32  # proposals per task sent to a scorecard process
+
+# the DAO's files, set by use_dao()
+LINKED_PATH = None
+SCORECARDS_PATH = None
+VOTES_PARQUET_PATH = None
+DB_PATH = None
+
+def use_dao(name):
+    global LINKED_PATH, SCORECARDS_PATH, VOTES_PARQUET_PATH, DB_PATH
+    out_dir = daos.partition(DATA_DIR, name)
+    LINKED_PATH = out_dir / "linked_proposals.jsonl"
+    SCORECARDS_PATH = out_dir / "scorecards.jsonl"
+    VOTES_PARQUET_PATH = SNAPSHOT_DATA_DIR / name / "votes.parquet"
+    DB_PATH = daos.db_path(name)
 
 def extract_summary(body, max_len=280):
     if not body:
@@ -17,7 +38,12 @@ def extract_summary(body, max_len=280):
     summary = " ".join(body.strip().splitlines())
     return summary[:max_len].rsplit(" ", 1)[0] + "..." if len(summary) > max_len else summary
 
-def build_scorecard(proposal):
+def build_scorecard(proposal, votes=None):
+    """
+    `votes` overrides the vote list embedded in the linked proposal (see load_vote_power).
+    Compact linked proposals (joiner.py --compact) carry no votes; their precomputed
+    vote_aggregates are used instead.
+    """
     prop_id = proposal["proposal_id"]
     space_id = proposal.get("space", {}).get("id", "unknown")
     discourse_url = None
@@ -60,7 +86,7 @@ def build_scorecard(proposal):
         },
 
         "notable_behaviors": {
-            "whale_support": detect_whales(proposal.get("votes", [])),
+            "whale_support": whale_support(proposal, votes),
             "sybil_signals": {
                 "num_low_vp_votes": voter_stats.get("low_vp_votes", 0),
                 "threshold_vp": 0.01
@@ -72,7 +98,82 @@ def build_scorecard(proposal):
         "status": "passed" if result.get("winning_choice") else "undecided"
     }
 
-def detect_whales(votes, whale_threshold=500_000):
+def chunked(iterable, size):
+    it = iter(iterable)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+def score_chunk(items, metric_classes):
+    """
+    [(scorecard, {metric: compute() result}, seconds)] for a chunk of (proposal, votes);
+    proposals may be raw JSON lines, decoded here.
+    """
+    metrics = [cls() for cls in metric_classes]
+    results = []
+    for proposal, votes in items:
+        start = time.perf_counter()
+        if isinstance(proposal, bytes):
+            proposal = loads(proposal)
+        scorecard = build_scorecard(proposal, votes)
+        if metrics:
+            power = voter_power(proposal.get("votes") if votes is None else votes)
+            partials = {m.name: m.compute(proposal, power) for m in metrics}
+        else:
+            partials = {}
+        results.append((scorecard, partials, time.perf_counter() - start))
+    return results
+
+def build_scorecards(proposals, vote_power=None, metrics=(), jobs=1):
+    """
+    Yields the scorecard of each linked proposal (dicts, or raw JSON lines, see
+    iter_jsonl_lines, which are decoded in the workers), in input order; `vote_power`
+    ({proposal_id: votes}, see load_vote_power / load_vote_lookup) overrides the
+    embedded votes. `metrics` are names from scorecard_metrics.METRICS, computed in the
+    same pass. Proposals are scored in chunks, across a process pool when jobs > 1,
+    with at most 2 * jobs chunks in flight, so the input is never held in memory.
+    """
+    metric_classes = [METRICS[name] for name in metrics]
+    finishers = [cls() for cls in metric_classes]  # stateful across proposals, so in this process
+
+    def items(chunk):
+        if vote_power is None:
+            return [(proposal, None) for proposal in chunk]
+        # the override replaces the embedded votes, so don't ship both to the workers
+        chunk = [loads(proposal) if isinstance(proposal, bytes) else proposal for proposal in chunk]
+        return [({k: v for k, v in proposal.items() if k != "votes"}, vote_power.get(proposal["proposal_id"], []))
+                for proposal in chunk]
+
+    def merge(results):
+        for scorecard, partials, seconds in results:
+            TELEMETRY.observe("scorecards.build_seconds", seconds)
+            if finishers:
+                scorecard["metrics"] = {m.name: m.finish(partials[m.name]) for m in finishers}
+            yield scorecard
+
+    chunks = (items(chunk) for chunk in chunked(proposals, SCORECARD_CHUNK_SIZE))
+    if jobs <= 1:
+        for chunk in chunks:
+            yield from merge(score_chunk(chunk, metric_classes))
+        return
+
+    with Pool(jobs) as pool:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append(pool.apply_async(score_chunk, (chunk, metric_classes)))
+            if len(in_flight) >= 2 * jobs:
+                yield from merge(in_flight.popleft().get())
+        while in_flight:
+            yield from merge(in_flight.popleft().get())
+
+def whale_support(proposal, votes=None):
+    aggregates = proposal.get("vote_aggregates")
+    if votes is None and aggregates is not None and aggregates.get("whale_threshold") == WHALE_THRESHOLD:
+        return aggregates["whales"]
+    return detect_whales(proposal.get("votes", []) if votes is None else votes)
+
+def detect_whales(votes, whale_threshold=WHALE_THRESHOLD):
+    if hasattr(votes, "column"):  # columnar.VoteColumns
+        return [voter for voter, vp in zip(votes.column("voter"), votes.column("vp", 0)) if vp >= whale_threshold]
     return [
         v["voter"]
         for v in votes
@@ -93,8 +194,51 @@ def calc_controversy(vote_percentages):
     second = sorted_percents[1]
     return round(1 - abs(top - second) / 100, 4)
 
+def load_vote_power(votes_root):
+    """
+    Reads only (proposal_id, voter, vp) from the Parquet vote dataset, as
+    columnar.VoteColumns per proposal.
+    """
+    from columnar import read_vote_columns
+    return read_vote_columns(votes_root, columns=["voter", "vp"])
+
+def load_vote_lookup(min_vp=WHALE_THRESHOLD):
+    """
+    Per-proposal lookup of the (voter, vp) of votes at or above `min_vp` (None for every
+    vote) in the SQLite store: one indexed query per proposal, no vote list in memory.
+    """
+    from sql_store import VoteLookup, open_engine
+    return VoteLookup(open_engine(DB_PATH), columns=["voter", "vp"], min_vp=min_vp)
+
 if __name__ == "__main__":
-    proposals = load_jsonl("./data/linked_proposals.jsonl")
-    scorecards = [build_scorecard(p) for p in proposals]
-    save_jsonl("./data/scorecards_opcollective.jsonl", scorecards)
-    print(f"✅ Generated {len(scorecards)} scorecards → scorecards_opcollective.jsonl")
+    parser = argparse.ArgumentParser(description="Build proposal scorecards from linked proposals")
+    parser.add_argument("--votes-parquet", action="store_true",
+                        help="take voter/vp from the DAO's Parquet vote dataset instead of the votes embedded in "
+                             "its linked proposals")
+    parser.add_argument("--votes-db", action="store_true",
+                        help="query votes from the SQLite store (sql_store.py) instead of the embedded votes (only "
+                             "whale votes when no --metrics need every voter)")
+    parser.add_argument("--metrics", nargs="*", choices=list(METRICS), default=list(METRICS),
+                        help="metrics to add to each scorecard, from scorecard_metrics.py (default all; none "
+                             "with a bare --metrics)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="scorecard processes (1 builds them in this process)")
+    daos.add_argument(parser)
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    use_dao(args.dao)
+    instrumentation.start("scorecards", args)
+
+    proposals = iter_jsonl_lines(LINKED_PATH)  # decoded by the scorecard workers
+    vote_power = None
+    if args.votes_parquet or args.votes_db:
+        with TELEMETRY.span("load_votes", source="sqlite" if args.votes_db else "parquet"):
+            if args.votes_db:
+                vote_power = load_vote_lookup(min_vp=None if args.metrics else WHALE_THRESHOLD)
+            else:
+                vote_power = load_vote_power(VOTES_PARQUET_PATH)
+    with TELEMETRY.span("build_and_write", jobs=args.jobs):
+        count = save_jsonl(SCORECARDS_PATH, build_scorecards(proposals, vote_power, args.metrics, args.jobs))
+    TELEMETRY.count("scorecards.written", count)
+    print(f"✅ Generated {count} scorecards → {SCORECARDS_PATH}")
+    instrumentation.finish(args)
@@ -0,0 +1,138 @@
+# records.py
+"""
+JSONL record I/O shared by every pipeline stage.
+
+Readers are generators, so a file is never held in memory as a whole; writers
+are buffered and can be flushed at checkpoints, so a crash keeps every record
+written so far. Records are encoded with orjson when it is installed.
+"""
+
+import json
+import os
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+WRITE_BUFFER_SIZE = 1 << 20  # bytes
+
+if orjson is not None:
+    def dumps(record):
+        return orjson.dumps(record, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+
+    loads = orjson.loads
+else:
+    def dumps(record):
+        return (json.dumps(record) + "\n").encode("utf-8")
+
+    loads = json.loads
+
+def iter_jsonl(path):
+    """
+    Yields one record per line. A truncated last line (left by a crash mid-write) is skipped.
+    """
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield loads(line)
+            except ValueError:
+                if line.endswith(b"\n"):
+                    raise
+                print(f"⚠️ Skipping truncated last line of {path}")
+
+def iter_jsonl_lines(path):
+    """
+    Yields each record's line undecoded, for decoding in another process. A truncated
+    last line is skipped, as in iter_jsonl.
+    """
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            if not line.endswith(b"\n"):
+                try:
+                    loads(line)
+                except ValueError:
+                    print(f"⚠️ Skipping truncated last line of {path}")
+                    continue
+            yield line
+
+def load_jsonl(path):
+    return list(iter_jsonl(path))
+
+def repair_tail(path):
+    """
+    Cuts a partially written last line so appended records start on a fresh line.
+    """
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        pos = size
+        while pos > 0:
+            step = min(pos, 1 << 16)
+            f.seek(pos - step)
+            chunk = f.read(step)
+            newline = chunk.rfind(b"\n")
+            if newline != -1:
+                f.truncate(pos - step + newline + 1)
+                return
+            pos -= step
+        f.truncate(0)
+
+class JsonlWriter:
+    """
+    Buffered incremental JSONL writer.
+
+        with JsonlWriter(path, append=True) as writer:
+            for batch in batches:
+                writer.write_many(batch)
+                writer.flush()  # checkpoint
+    """
+    def __init__(self, path, append=False, buffer_size=WRITE_BUFFER_SIZE):
+        self.path = Path(path)
+        self.append = append
+        self.buffer_size = buffer_size
+        self.count = 0
+        self.f = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.append and self.path.exists():
+            repair_tail(self.path)
+        self.f = open(self.path, "ab" if self.append else "wb", buffering=self.buffer_size)
+        return self
+
+    def __exit__(self, *exc):
+        self.f.close()
+
+    def write(self, record):
+        self.f.write(dumps(record))
+        self.count += 1
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        self.f.flush()
+
+def save_jsonl(path, records):
+    """
+    Writes `records` (any iterable) to `path`, replacing it. Returns the record count.
+    """
+    with JsonlWriter(path) as writer:
+        writer.write_many(records)
+    return writer.count
+
+def append_jsonl(path, records):
+    with JsonlWriter(path, append=True) as writer:
+        writer.write_many(records)
+    return writer.count
@@ -0,0 +1,128 @@
+# scorecard_metrics.py
+"""
+Metric plugins for proposal_scorecards.py, computed in the same pass as the
+scorecards and written under scorecard["metrics"][name].
+
+A metric is a Metric subclass registered with @register:
+
+    @register
+    class TurnoutSpread(Metric):
+        name = "turnout_spread"
+
+        def compute(self, proposal, voter_power):
+            ...
+
+compute() runs in the scorecard worker processes, once per proposal, with the
+linked proposal and its voters' VP ({voter: vp}, one entry per voter; None when
+the votes are unknown, e.g. compact linked proposals without --votes-parquet or
+--votes-db). Its result goes through finish(), which runs in the writing
+process, one proposal at a time in output order; metrics spanning several
+proposals keep their state there. Both results must be picklable and JSON
+serializable respectively.
+
+Plugins defined elsewhere are registered by importing their module before the
+scorecards are built.
+"""
+
+import numpy as np
+
+from vote_tally import WHALE_THRESHOLD
+
+METRICS = {}
+
+def register(cls):
+    METRICS[cls.name] = cls
+    return cls
+
+class Metric:
+    name = None
+
+    def compute(self, proposal, voter_power):
+        raise NotImplementedError
+
+    def finish(self, value):
+        return value
+
+def voter_power(votes):
+    """
+    {voter: vp} of a vote list; a voter who voted more than once keeps their last vote.
+    """
+    if votes is None:
+        return None
+    if hasattr(votes, "column"):  # columnar.VoteColumns
+        return dict(zip(votes.column("voter"), votes.column("vp", 0)))
+    return {v["voter"]: v.get("vp", 0) or 0 for v in votes}
+
+def vp_array(voter_power):
+    vp = np.fromiter(voter_power.values(), dtype=np.float64, count=len(voter_power))
+    return np.clip(vp, 0, None)
+
+@register
+class VpGini(Metric):
+    """
+    Gini coefficient of the VP cast: 0 when every voter has the same VP, towards 1 when one holds it all.
+    """
+    name = "vp_gini"
+
+    def compute(self, proposal, voter_power):
+        if not voter_power:
+            return None
+        vp = np.sort(vp_array(voter_power))
+        total = vp.sum()
+        if total == 0:
+            return None
+        n = len(vp)
+        ranks = np.arange(1, n + 1)
+        return round(float(2 * (ranks * vp).sum() / (n * total) - (n + 1) / n), 4)
+
+@register
+class VpNakamoto(Metric):
+    """
+    Fewest voters holding more than half of the VP cast.
+    """
+    name = "vp_nakamoto"
+
+    def compute(self, proposal, voter_power):
+        if not voter_power:
+            return None
+        vp = -np.sort(-vp_array(voter_power))
+        total = vp.sum()
+        if total == 0:
+            return None
+        return int(np.searchsorted(np.cumsum(vp), total / 2, side="right")) + 1
+
+@register
+class WhaleShare(Metric):
+    """
+    Fraction of the VP cast by voters at or above WHALE_THRESHOLD.
+    """
+    name = "whale_share"
+
+    def compute(self, proposal, voter_power):
+        if not voter_power:
+            return None
+        vp = vp_array(voter_power)
+        total = vp.sum()
+        if total == 0:
+            return None
+        return round(float(vp[vp >= WHALE_THRESHOLD].sum() / total), 4)
+
+@register
+class VoterOverlap(Metric):
+    """
+    Jaccard similarity of the proposal's voters with those of the proposal before it in
+    the output (the next newer one, as linked proposals are newest first).
+    """
+    name = "voter_overlap"
+
+    def __init__(self):
+        self.previous = None
+
+    def compute(self, proposal, voter_power):
+        return frozenset(voter_power) if voter_power is not None else None
+
+    def finish(self, voters):
+        previous, self.previous = self.previous, voters
+        if voters is None or previous is None or not (voters or previous):
+            return None
+        return round(len(voters & previous) / len(voters | previous), 4)
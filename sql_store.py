@@ -0,0 +1,284 @@
+# sql_store.py
+"""
+SQLite store for the crawled data: one database per DAO (data/<dao>/dao.sqlite at
+the repo root, see daos.db_path) with posts, topics, proposals and votes tables, written
+by both crawlers with --format sqlite and queried by the joiner and the scorecards.
+
+The writers have the same write/write_many/flush/count interface as
+records.JsonlWriter and columnar.ParquetDatasetWriter; every flush is one
+transaction of bulk upserts keyed by the Discourse/Snapshot ids, so re-crawled
+records replace the stored ones instead of duplicating them.
+
+Indexed columns: posts.created_ts (created_at as epoch seconds, for time-window
+queries), posts.topic_id, posts.(username, created_ts), proposals.created,
+proposals.space, votes.(proposal_id, created) and votes.voter.
+"""
+
+import json
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import (
+    JSON, Column, Float, Index, Integer, MetaData, String, Table, Text,
+    create_engine, delete, event, literal_column, select,
+)
+from sqlalchemy.dialects.sqlite import insert
+
+DB_PATH = Path(__file__).resolve().parent / "data" / "dao.sqlite"
+WRITE_BUFFER_SIZE = 5_000  # rows per upsert transaction when flush() is not called earlier
+
+metadata = MetaData()
+
+topics = Table(
+    "topics", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("slug", String),
+    Column("title", Text),
+)
+
+posts = Table(
+    "posts", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("topic_id", Integer, index=True),
+    Column("post_number", Integer),
+    Column("username", String),
+    Column("created_at", String),
+    Column("created_ts", Float, index=True),
+    Column("updated_at", String),
+    Column("cooked", Text),
+    Column("raw", Text),
+    Column("reply_to", Integer),
+    Column("downloaded_at", String),
+    Column("topic_slug", String),
+    Column("topic_title", Text),
+    Index("ix_posts_username_created_ts", "username", "created_ts"),
+)
+
+proposals = Table(
+    "proposals", metadata,
+    Column("id", String, primary_key=True),
+    Column("space", String, index=True),
+    Column("created", Integer, index=True),
+    Column("start", Integer),
+    Column("end", Integer),
+    Column("state", String),
+    Column("title", Text),
+    Column("data", JSON),  # the full Snapshot record
+)
+
+votes = Table(
+    "votes", metadata,
+    Column("id", String, primary_key=True),
+    Column("proposal_id", String),
+    Column("voter", String, index=True),
+    Column("choice", JSON),
+    Column("vp", Float),
+    Column("created", Integer),
+    Index("ix_votes_proposal_id_created", "proposal_id", "created"),
+)
+VOTES_ROWID = literal_column("votes.rowid")  # upserts keep a row's rowid: first-stored order
+
+def parse_timestamp(dt_str):
+    if not dt_str:
+        return None
+    return datetime.fromisoformat(dt_str.replace("Z", "+00:00")).timestamp()
+
+def open_engine(path=DB_PATH):
+    """
+    Engine for the SQLite file at `path`, with the tables created. WAL mode lets the
+    joiner read while a crawler writes; writers wait up to a minute for each other.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": 60})
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    metadata.create_all(engine)
+    return engine
+
+# --- encoding ---------------------------------------------------------------
+
+def table_row(table, record):
+    return {column.name: record.get(column.name) for column in table.columns}
+
+def encode_post(record):
+    row = table_row(posts, record)
+    row["created_ts"] = parse_timestamp(record.get("created_at"))
+    return row
+
+def encode_vote(record):
+    return table_row(votes, record)
+
+def encode_proposal(record):
+    row = table_row(proposals, record)
+    space = record.get("space")
+    row["space"] = space.get("id") if isinstance(space, dict) else space
+    row["data"] = record
+    return row
+
+def topic_rows(post_rows):
+    rows = {}
+    for row in post_rows:
+        if row["topic_id"] is not None:
+            rows[row["topic_id"]] = {"id": row["topic_id"], "slug": row["topic_slug"], "title": row["topic_title"]}
+    return list(rows.values())
+
+def upsert(conn, table, rows):
+    """
+    Bulk INSERT ... ON CONFLICT(primary key) DO UPDATE for `rows`.
+    """
+    if not rows:
+        return
+    stmt = insert(table)
+    keys = [column.name for column in table.primary_key.columns]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={column.name: stmt.excluded[column.name] for column in table.columns if column.name not in keys},
+    )
+    conn.execute(stmt, rows)
+
+# --- writers ----------------------------------------------------------------
+
+class SqlTableWriter:
+    """
+    Buffers records and upserts them into `table`. Without append the table is
+    emptied first, the same as rewriting a JSONL file.
+    """
+    def __init__(self, table, encode, append=False, path=DB_PATH, buffer_size=WRITE_BUFFER_SIZE):
+        self.table = table
+        self.encode = encode
+        self.append = append
+        self.path = path
+        self.buffer_size = buffer_size
+        self.rows = []
+        self.count = 0
+        self.engine = None
+
+    def __enter__(self):
+        self.engine = open_engine(self.path)
+        if not self.append:
+            with self.engine.begin() as conn:
+                conn.execute(delete(self.table))
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+        self.engine.dispose()
+
+    def write(self, record):
+        self.rows.append(self.encode(record))
+        self.count += 1
+        if len(self.rows) >= self.buffer_size:
+            self.flush()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        if not self.rows:
+            return
+        with self.engine.begin() as conn:
+            self.upsert_rows(conn, self.rows)
+        self.rows = []
+
+    def upsert_rows(self, conn, rows):
+        upsert(conn, self.table, rows)
+
+class PostsWriter(SqlTableWriter):
+    """
+    Upserts posts and, from their topic annotations, the topics table.
+    """
+    def __init__(self, append=False, path=DB_PATH):
+        super().__init__(posts, encode_post, append=append, path=path)
+
+    def upsert_rows(self, conn, rows):
+        upsert(conn, topics, topic_rows(rows))
+        upsert(conn, posts, rows)
+
+def posts_db_writer(append=False, path=DB_PATH):
+    return PostsWriter(append=append, path=path)
+
+def votes_db_writer(append=False, path=DB_PATH):
+    return SqlTableWriter(votes, encode_vote, append=append, path=path)
+
+def save_proposals(records, path=DB_PATH):
+    """
+    Upserts Snapshot proposals; returns how many were written.
+    """
+    with SqlTableWriter(proposals, encode_proposal, append=True, path=path) as writer:
+        writer.write_many(records)
+    return writer.count
+
+# --- readers ----------------------------------------------------------------
+
+def row_dict(row, drop_nulls=True):
+    return {k: v for k, v in row._mapping.items() if v is not None or not drop_nulls}
+
+def iter_rows(engine, table, columns=None):
+    cols = [table.c[name] for name in columns] if columns else [table]
+    with engine.connect() as conn:
+        for row in conn.execute(select(*cols)):
+            yield row_dict(row)
+
+def load_proposals(engine):
+    """
+    Stored Snapshot proposals, newest first (the order the crawler fetches them in).
+    """
+    with engine.connect() as conn:
+        rows = conn.execute(select(proposals.c.data).order_by(proposals.c.created.desc(), proposals.c.id))
+        return [row.data if isinstance(row.data, dict) else json.loads(row.data) for row in rows]
+
+def query_votes(conn, proposal_id, columns=None, min_vp=None):
+    """
+    Votes of one proposal in the order they were first stored (the crawl order),
+    through the proposal_id index. `min_vp` keeps only votes with vp >= min_vp.
+    """
+    cols = [votes.c[name] for name in columns] if columns else [votes]
+    stmt = select(*cols).where(votes.c.proposal_id == proposal_id)
+    if min_vp is not None:
+        stmt = stmt.where(votes.c.vp >= min_vp)
+    return [row_dict(row) for row in conn.execute(stmt.order_by(VOTES_ROWID))]
+
+class VoteLookup:
+    """
+    Dict-like view of the votes by proposal id (`.get(proposal_id, default)`),
+    answered by indexed queries instead of holding every vote in memory.
+    """
+    def __init__(self, engine, columns=None, min_vp=None):
+        self.conn = engine.connect()
+        self.columns = columns
+        self.min_vp = min_vp
+
+    def get(self, proposal_id, default=None):
+        rows = query_votes(self.conn, proposal_id, self.columns, self.min_vp)
+        return rows if rows else default
+
+    def close(self):
+        self.conn.close()
+
+class PostWindowQuery:
+    """
+    Time-window lookups of Discourse posts over the created_ts index; drop-in for
+    joiner.PostTimeIndex. Posts come back ordered by created_at.
+    """
+    def __init__(self, engine, columns):
+        self.conn = engine.connect()
+        self.columns = [posts.c[name] for name in columns]
+
+    def between(self, min_time, max_time):
+        stmt = (
+            select(*self.columns)
+            .where(posts.c.created_ts.between(min_time.timestamp(), max_time.timestamp()))
+            .order_by(posts.c.created_ts, posts.c.id)
+        )
+        return [row_dict(row) for row in self.conn.execute(stmt)]
+
+    def close(self):
+        self.conn.close()
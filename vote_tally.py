@@ -0,0 +1,177 @@
+# vote_tally.py
+"""
+Batched vote tallying for the joiner.
+
+Each proposal's votes are read once into columns (vp, voter, choice), or
+taken as they are from columnar.VoteColumns. Int
+choices, every choice of a single-choice proposal, are mapped to labels and
+summed as arrays; list and dict choices add one (vote, label, weight) entry per
+counted choice. Voters are counted with a Counter.
+
+Choice formats, as Snapshot returns them:
+  single-choice / basic:         1-based int
+  approval / ranked-choice:      list of 1-based ints (nested lists are flattened one level,
+                                 malformed entries skipped)
+  weighted / quadratic:          {"<1-based index>": weight}
+Out-of-range indices count towards "Unknown".
+
+With aggregates=True, tally_votes also returns the per-proposal vote summaries
+that let the compact join output drop the raw vote list: whales, a VP histogram
+and the top voters.
+"""
+
+from collections import Counter
+
+import numpy as np
+
+VOTE_COLUMNS = ["voter", "vp", "choice"]  # the vote fields a tally reads
+LOW_VP_THRESHOLD = 0.01
+WHALE_THRESHOLD = 500_000
+TOP_VOTERS = 10
+# VP histogram bin edges: [0, 0.01), [0.01, 1), [1, 10), ... [1e6, 1e7), [1e7, inf)
+VP_HISTOGRAM_EDGES = [0, LOW_VP_THRESHOLD] + [10.0 ** k for k in range(0, 8)]
+
+class LabelMap:
+    """
+    Maps 1-based choice indices to label ids once per proposal; equal labels share an id.
+    """
+    def __init__(self, choices):
+        self.labels = []
+        ids = {}
+        for label in list(choices) + ["Unknown"]:
+            if label not in ids:
+                ids[label] = len(self.labels)
+                self.labels.append(label)
+        self.choice_ids = [ids[label] for label in choices]
+        self.unknown_id = ids["Unknown"]
+        # lookup table for vectorized int choices: index len(choices) is "Unknown"
+        self.lut = np.array(self.choice_ids + [self.unknown_id], dtype=np.int64)
+
+    def id_for(self, index):
+        i = index - 1
+        return self.choice_ids[i] if 0 <= i < len(self.choice_ids) else self.unknown_id
+
+def flatten_choice(raw_choice):
+    flat = []
+    for c in raw_choice:
+        flat.extend(c if isinstance(c, list) else [c])
+    return flat
+
+def collect_entries(votes, label_map):
+    """
+    Reads the votes (dicts or VoteColumns) into columns. Returns (vp values, voters, int-choice entries,
+    other entries). When every choice is an int (single-choice, basic), the choices
+    become one array without a per-vote loop; otherwise only the list and dict
+    choices are walked, and int choices are still mapped to labels in one step.
+    """
+    if hasattr(votes, "column"):  # columnar.VoteColumns
+        vp, voters, raw_choices = votes.column("vp", 0), votes.column("voter"), votes.column("choice")
+    else:
+        vp = [vote.get("vp", 0) for vote in votes]
+        voters = [vote["voter"] for vote in votes]
+        raw_choices = [vote.get("choice") for vote in votes]
+    entry_votes, entry_labels, entry_weights = [], [], []
+
+    if set(map(type, raw_choices)) <= {int, bool}:
+        return vp, voters, (None, np.array(raw_choices, dtype=np.int64)), (entry_votes, entry_labels, entry_weights)
+
+    int_votes = [i for i, c in enumerate(raw_choices) if isinstance(c, int)]
+    int_choices = [raw_choices[i] for i in int_votes]
+    for i, raw_choice in enumerate(raw_choices):
+        if isinstance(raw_choice, list):
+            for idx in flatten_choice(raw_choice):
+                try:
+                    label_id = label_map.id_for(int(idx))
+                except (ValueError, TypeError):
+                    continue  # skip malformed choice
+                entry_votes.append(i)
+                entry_labels.append(label_id)
+                entry_weights.append(1.0)
+
+        elif isinstance(raw_choice, dict):
+            for idx_str, weight in raw_choice.items():
+                entry_votes.append(i)
+                entry_labels.append(label_map.id_for(int(idx_str)))
+                entry_weights.append(weight)
+
+    int_entries = (np.array(int_votes, dtype=np.int64), np.array(int_choices, dtype=np.int64))
+    return vp, voters, int_entries, (entry_votes, entry_labels, entry_weights)
+
+def distribution(vp, label_map, int_entries, other_entries):
+    """
+    Sums vp (times weight) per label. Returns [(label, total)] ordered by the first vote
+    that counted towards each label. int_entries is (vote indexes, choices), with None
+    indexes when every vote has an int choice.
+    """
+    int_votes, int_choices = int_entries
+    n_choices = len(label_map.choice_ids)
+    idx = int_choices - 1
+    idx = np.where((idx >= 0) & (idx < n_choices), idx, n_choices)
+    int_labels = label_map.lut[idx]
+
+    if int_votes is None:
+        # one entry per vote, already in vote order
+        label_ids, values = int_labels, vp
+    else:
+        vote_idx = np.concatenate([int_votes, np.asarray(other_entries[0], dtype=np.int64)])
+        label_ids = np.concatenate([int_labels, np.asarray(other_entries[1], dtype=np.int64)])
+        weights = np.concatenate([np.ones(len(int_votes)), np.asarray(other_entries[2], dtype=np.float64)])
+        # vote order, so bincount accumulates each label in the same order as a per-vote loop
+        order = np.argsort(vote_idx, kind="stable")
+        label_ids = label_ids[order]
+        values = weights[order] * vp[vote_idx[order]]
+    if len(label_ids) == 0:
+        return []
+
+    sums = np.bincount(label_ids, weights=values, minlength=len(label_map.labels))
+    present, first_seen = np.unique(label_ids, return_index=True)
+    return [(label_map.labels[i], float(sums[i])) for i in present[np.argsort(first_seen)]]
+
+def vp_histogram(vp, edges=VP_HISTOGRAM_EDGES):
+    """
+    {"edges": lower bounds, "votes": count per bin, "vp": vp sum per bin}; the last bin is open-ended.
+    """
+    bins = np.searchsorted(np.asarray(edges, dtype=np.float64), vp, side="right") - 1
+    bins = np.clip(bins, 0, len(edges) - 1)  # negative vp counts in the first bin
+    return {
+        "edges": list(edges),
+        "votes": np.bincount(bins, minlength=len(edges)).tolist(),
+        "vp": [round(float(x), 2) for x in np.bincount(bins, weights=vp, minlength=len(edges))],
+    }
+
+def vote_aggregates(vp, voters, whale_threshold=WHALE_THRESHOLD, top_n=TOP_VOTERS):
+    """
+    whales: voters with vp >= whale_threshold, in vote order (one entry per vote);
+    top_voters: the top_n votes by vp, largest first; vp_histogram: see vp_histogram.
+    """
+    top = np.argsort(-vp, kind="stable")[:top_n]
+    return {
+        "whale_threshold": whale_threshold,
+        "whales": [voters[i] for i in np.flatnonzero(vp >= whale_threshold)],
+        "top_voters": [{"voter": voters[i], "vp": float(vp[i])} for i in top],
+        "vp_histogram": vp_histogram(vp),
+    }
+
+def tally_votes(votes, choices, low_vp_threshold=LOW_VP_THRESHOLD, aggregates=False):
+    """
+    Tallies one proposal's votes. Returns a dict with vote_distribution (label -> vp,
+    unrounded, in first-vote order), total_voters, total_vp, unique_voters,
+    repeat_voters and low_vp_votes, plus "aggregates" (see vote_aggregates) if asked.
+    """
+    label_map = LabelMap(choices)
+    vp_values, voters, int_entries, other_entries = collect_entries(votes, label_map)
+    vp = np.array(vp_values, dtype=np.float64)
+    votes_per_voter = Counter(voters)
+
+    tally = {
+        "vote_distribution": dict(distribution(vp, label_map, int_entries, other_entries)),
+        "total_voters": len(votes),
+        # sequential, as the per-vote loop summed it (ndarray.sum is pairwise and can differ in the last bits)
+        "total_vp": sum(vp_values),
+        "unique_voters": len(votes_per_voter),
+        "repeat_voters": sum(1 for count in votes_per_voter.values() if count > 1),
+        "low_vp_votes": int((vp < low_vp_threshold).sum()),
+    }
+    if aggregates:
+        tally["aggregates"] = vote_aggregates(vp, voters)
+    return tally
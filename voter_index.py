@@ -0,0 +1,317 @@
+# voter_index.py
+"""
+Voter-centric index of a DAO's Snapshot votes, so per-voter questions (how often
+does this whale vote, and with whom) don't need a scan of every vote.
+
+Built in one streaming pass over the votes into data/<dao>/voter_index/:
+
+    voters.npy      voter addresses (lowercased), sorted, for binary search
+    offsets.npy     int64, voter i's votes are rows offsets[i]:offsets[i + 1]
+    votes.npy       (proposal, choice, vp, created) rows grouped by voter, by created
+    proposals.json  id, created and title of each proposal index, oldest first
+    meta.json       counts and the choice table, written last
+
+The .npy files are opened memory-mapped, so a query reads only the rows of the
+voters it asks about. Choices are int32: the 1-based choice for single-choice
+votes, else -(1 + i) with i the choice's JSON in meta["choices"], so equal
+choices compare equal whatever the voting type.
+
+    python voter_index.py --dao arbitrum                    # build from the crawled votes
+    python voter_index.py --voter 0xabc... --voter 0xdef... # participation and VP over time
+    python voter_index.py --agreement 20                    # agreement of the top 20 voters by VP
+"""
+
+import argparse
+import json
+import os
+import shutil
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+import daos
+import instrumentation
+from instrumentation import TELEMETRY
+from records import iter_jsonl, load_jsonl
+
+SNAPSHOT_DATA_DIR = Path("crawler_snapshot/data")
+DATA_DIR = Path("./data")
+
+VOTE_DTYPE = np.dtype([("proposal", "<i4"), ("choice", "<i4"), ("vp", "<f8"), ("created", "<i8")])
+NO_VOTE = np.iinfo(np.int64).min  # agreement matrix cell of a proposal the voter skipped
+
+# the DAO's crawled data and its index, set by use_dao()
+PROPOSALS_PATH = None
+VOTES_PATH = None
+VOTES_PARQUET_PATH = None
+DB_PATH = None
+INDEX_DIR = None
+
+def use_dao(name):
+    global PROPOSALS_PATH, VOTES_PATH, VOTES_PARQUET_PATH, DB_PATH, INDEX_DIR
+    PROPOSALS_PATH = SNAPSHOT_DATA_DIR / name / "proposals.jsonl"
+    VOTES_PATH = SNAPSHOT_DATA_DIR / name / "votes.jsonl"
+    VOTES_PARQUET_PATH = SNAPSHOT_DATA_DIR / name / "votes.parquet"
+    DB_PATH = daos.db_path(name)
+    INDEX_DIR = daos.partition(DATA_DIR, name) / "voter_index"
+
+# --- build ----------------------------------------------------------------------
+
+class IndexBuilder:
+    """
+    Accumulates votes as columns of ids (voters, proposals and choices interned as they
+    are first seen); write() sorts them by voter and saves the index.
+    """
+    def __init__(self, proposals):
+        self.proposals = []
+        self.proposal_ids = {}
+        for p in proposals:
+            self.add_proposal(p["id"], p.get("created"), p.get("title"))
+        self.voter_ids = {}
+        self.choice_codes = {}
+        self.voter = array("i")
+        self.proposal = array("i")
+        self.choice = array("i")
+        self.vp = array("d")
+        self.created = array("q")
+
+    def add_proposal(self, proposal_id, created, title=None):
+        self.proposal_ids[proposal_id] = len(self.proposals)
+        self.proposals.append({"id": proposal_id, "created": created, "title": title})
+        return self.proposal_ids[proposal_id]
+
+    def encode_choice(self, choice):
+        if isinstance(choice, int) and not isinstance(choice, bool) and 0 <= choice < 2 ** 31:
+            return choice
+        key = json.dumps(choice, sort_keys=True)
+        if key not in self.choice_codes:
+            self.choice_codes[key] = -(1 + len(self.choice_codes))
+        return self.choice_codes[key]
+
+    def add(self, vote):
+        voter = vote["voter"].lower()
+        voter_id = self.voter_ids.get(voter)
+        if voter_id is None:
+            voter_id = self.voter_ids[voter] = len(self.voter_ids)
+        created = vote.get("created") or 0
+        proposal_id = self.proposal_ids.get(vote["proposal_id"])
+        if proposal_id is None:  # votes of a proposal missing from proposals.jsonl
+            proposal_id = self.add_proposal(vote["proposal_id"], created)
+        self.voter.append(voter_id)
+        self.proposal.append(proposal_id)
+        self.choice.append(self.encode_choice(vote.get("choice")))
+        self.vp.append(vote.get("vp") or 0.0)
+        self.created.append(created)
+
+    def write(self, path, dao=None):
+        # proposals oldest first, so proposal indexes follow time
+        created = [p["created"] if p["created"] is not None else 0 for p in self.proposals]
+        proposal_order = np.argsort(np.asarray(created, dtype=np.int64), kind="stable")
+        proposal_rank = np.empty(len(proposal_order), dtype=np.int32)
+        proposal_rank[proposal_order] = np.arange(len(proposal_order), dtype=np.int32)
+
+        voters = np.array([v.encode() for v in self.voter_ids], dtype=bytes)
+        voter_order = np.argsort(voters, kind="stable")
+        voter_rank = np.empty(len(voters), dtype=np.int64)
+        voter_rank[voter_order] = np.arange(len(voters))
+
+        row_voter = voter_rank[np.frombuffer(self.voter, dtype=np.int32)]
+        votes = np.empty(len(row_voter), dtype=VOTE_DTYPE)
+        votes["proposal"] = proposal_rank[np.frombuffer(self.proposal, dtype=np.int32)]
+        votes["choice"] = np.frombuffer(self.choice, dtype=np.int32)
+        votes["vp"] = np.frombuffer(self.vp, dtype=np.float64)
+        votes["created"] = np.frombuffer(self.created, dtype=np.int64)
+        rows = np.lexsort((votes["created"], row_voter))
+        offsets = np.zeros(len(voters) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(row_voter, minlength=len(voters)), out=offsets[1:])
+
+        # written next to the old index and swapped in whole
+        tmp_path = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+        np.save(tmp_path / "voters.npy", voters[voter_order])
+        np.save(tmp_path / "offsets.npy", offsets)
+        np.save(tmp_path / "votes.npy", votes[rows])
+        with open(tmp_path / "proposals.json", "w") as f:
+            json.dump([self.proposals[i] for i in proposal_order], f)
+        with open(tmp_path / "meta.json", "w") as f:
+            json.dump({
+                "dao": dao,
+                "built_at": datetime.now(timezone.utc).isoformat(),
+                "votes": len(votes),
+                "voters": len(voters),
+                "proposals": len(self.proposals),
+                "choices": list(self.choice_codes),
+            }, f, indent=2)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        return path
+
+def iter_source_votes(fmt="jsonl"):
+    columns = ["voter", "proposal_id", "choice", "vp", "created"]
+    if fmt == "sqlite":
+        from sql_store import iter_rows, open_engine, votes
+        return iter_rows(open_engine(DB_PATH), votes, columns)
+    if fmt == "parquet":
+        from columnar import iter_votes
+        return iter_votes(VOTES_PARQUET_PATH, columns=columns)
+    return iter_jsonl(VOTES_PATH)
+
+def load_source_proposals(fmt="jsonl"):
+    if fmt == "sqlite":
+        from sql_store import load_proposals, open_engine
+        return load_proposals(open_engine(DB_PATH))
+    return load_jsonl(PROPOSALS_PATH)
+
+def build_index(path, fmt="jsonl", dao=None):
+    builder = IndexBuilder(load_source_proposals(fmt))
+    with TELEMETRY.span("index_votes", format=fmt):
+        for vote in iter_source_votes(fmt):
+            builder.add(vote)
+    with TELEMETRY.span("write"):
+        builder.write(path, dao)
+    TELEMETRY.count("voter_index.votes", len(builder.voter))
+    TELEMETRY.count("voter_index.voters", len(builder.voter_ids))
+    return builder
+
+# --- queries --------------------------------------------------------------------
+
+class VoterIndex:
+    """
+    Read-only view of a built index.
+
+        index = VoterIndex(INDEX_DIR)
+        index.participation("0xabc...")
+        index.agreement_matrix(top_n=20)
+        index.vp_over_time("0xabc...")
+    """
+    def __init__(self, path):
+        path = Path(path)
+        with open(path / "meta.json") as f:
+            self.meta = json.load(f)
+        with open(path / "proposals.json") as f:
+            self.proposals = json.load(f)
+        self.voters = np.load(path / "voters.npy", mmap_mode="r")
+        self.offsets = np.load(path / "offsets.npy", mmap_mode="r")
+        self.votes = np.load(path / "votes.npy", mmap_mode="r")
+
+    def __len__(self):
+        return len(self.voters)
+
+    def voter_id(self, voter):
+        key = voter.lower().encode()
+        i = int(np.searchsorted(self.voters, key))
+        if i == len(self.voters) or self.voters[i] != key:
+            raise KeyError(voter)
+        return i
+
+    def address(self, voter_id):
+        return self.voters[voter_id].decode()
+
+    def rows(self, voter_id):
+        return self.votes[self.offsets[voter_id]:self.offsets[voter_id + 1]]
+
+    def latest_votes(self, voter_id):
+        """
+        The voter's last vote on each proposal, by proposal index.
+        """
+        rows = self.rows(voter_id)[::-1]
+        _, last = np.unique(rows["proposal"], return_index=True)
+        return rows[last]
+
+    def participation(self, voter):
+        """
+        Proposals voted on, out of every proposal and out of those created since the
+        voter's first voted proposal.
+        """
+        voter_id = self.voter_id(voter)
+        rows = self.rows(voter_id)
+        voted = np.unique(rows["proposal"])
+        since_first = len(self.proposals) - int(voted[0])
+        return {
+            "voter": self.address(voter_id),
+            "votes": len(rows),
+            "proposals_voted": len(voted),
+            "proposals": len(self.proposals),
+            "rate": round(len(voted) / len(self.proposals), 4),
+            "rate_since_first_vote": round(len(voted) / since_first, 4),
+            "first_vote": int(rows["created"].min()),
+            "last_vote": int(rows["created"].max()),
+        }
+
+    def top_voters(self, n, by="vp"):
+        """
+        Ids of the n voters with the most VP cast in total ("vp") or the most votes ("votes").
+        """
+        counts = np.diff(self.offsets)
+        if by == "votes":
+            totals = counts
+        else:
+            totals = np.zeros(len(counts))
+            voted = counts > 0
+            totals[voted] = np.add.reduceat(self.votes["vp"], self.offsets[:-1][voted])
+        return np.argsort(-totals, kind="stable")[:n]
+
+    def agreement_matrix(self, voters=None, top_n=20, by="vp"):
+        """
+        For `voters` (addresses; default the top_n by `by`): "shared", the proposals both
+        voters of a pair voted on, and "agreement", the fraction of those on which they
+        made the same choice (None when they share none), each voter's latest vote counting.
+        """
+        ids = [self.voter_id(v) for v in voters] if voters else list(self.top_voters(top_n, by))
+        choices = np.full((len(ids), len(self.proposals)), NO_VOTE, dtype=np.int64)
+        for k, voter_id in enumerate(ids):
+            rows = self.latest_votes(voter_id)
+            choices[k, rows["proposal"]] = rows["choice"]
+        voted = choices != NO_VOTE
+        shared = voted.astype(np.int64) @ voted.T.astype(np.int64)
+        agreed = np.empty_like(shared)
+        for k in range(len(ids)):
+            agreed[k] = ((choices == choices[k]) & voted & voted[k]).sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rate = agreed / shared
+        return {
+            "voters": [self.address(i) for i in ids],
+            "shared": shared.tolist(),
+            "agreement": [[round(float(x), 4) if s else None for x, s in zip(row, srow)]
+                          for row, srow in zip(rate, shared)],
+        }
+
+    def vp_over_time(self, voter):
+        """
+        [{proposal_id, created, vp}] of the voter's latest vote on each proposal, oldest first.
+        """
+        rows = self.latest_votes(self.voter_id(voter))
+        rows = rows[np.argsort(rows["created"], kind="stable")]
+        return [{"proposal_id": self.proposals[p]["id"], "created": int(c), "vp": float(vp)}
+                for p, c, vp in zip(rows["proposal"], rows["created"], rows["vp"])]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the voter-centric index of a DAO's Snapshot votes")
+    parser.add_argument("--format", dest="fmt", choices=["jsonl", "parquet", "sqlite"], default="jsonl",
+                        help="read the votes from JSONL, the crawler's Parquet dataset, or the SQLite store")
+    parser.add_argument("--voter", action="append", default=[],
+                        help="print this voter's participation and VP over time (repeatable)")
+    parser.add_argument("--agreement", type=int, metavar="N",
+                        help="print the agreement matrix of the top N voters")
+    parser.add_argument("--by", choices=["vp", "votes"], default="vp",
+                        help="rank the top voters by total VP cast or by number of votes")
+    daos.add_argument(parser)
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    use_dao(args.dao)
+
+    if args.voter or args.agreement:
+        index = VoterIndex(INDEX_DIR)
+        for voter in args.voter:
+            print(json.dumps({**index.participation(voter), "vp_over_time": index.vp_over_time(voter)}, indent=2))
+        if args.agreement:
+            print(json.dumps(index.agreement_matrix(top_n=args.agreement, by=args.by)))
+    else:
+        instrumentation.start("voter_index", args)
+        builder = build_index(INDEX_DIR, args.fmt, args.dao)
+        print(f"✅ Indexed {len(builder.voter)} votes of {len(builder.voter_ids)} voters "
+              f"on {len(builder.proposals)} proposals → {INDEX_DIR}")
+        instrumentation.finish(args)